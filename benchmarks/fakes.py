@@ -0,0 +1,126 @@
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+from utils.context_manager import ctx_mgr
+
+_ids = count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"bench-{user_id}"
+        self.bot = False
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class FakeMessage:
+    """
+    Stands in for a sent discord.Message: `edit` and `reply` only record what would have been sent.
+    """
+
+    def __init__(self, channel: "FakeChannel", content: Optional[str] = None, **kwargs: Any):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content or ""
+        self.attachments: List[FakeAttachment] = kwargs.pop("attachments", [])
+        self.kwargs = kwargs
+        self.edits = 0
+
+    async def edit(self, content: Optional[str] = None, **kwargs: Any) -> "FakeMessage":
+        self.edits += 1
+        self.content = content or ""
+        self.kwargs = kwargs
+        self.channel.sent += 1
+        return self
+
+    async def reply(self, content: Optional[str] = None, **kwargs: Any) -> "FakeMessage":
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        self.sent += 1
+        return FakeMessage(self, content, **kwargs)
+
+
+class FakeBot:
+    """
+    Only what the modules ask of the bot: channel lookups (time table alerts).
+    """
+
+    def __init__(self):
+        self.channels: Dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channels.setdefault(channel_id, FakeChannel(channel_id))
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        return self.get_channel(channel_id)
+
+
+class FakeContext:
+    """
+    A commands.Context as the modules use it: author, bot, the invoking message and `reply`.
+    """
+
+    def __init__(self, bot: FakeBot, user_id: int, content: str = "", attachments: Optional[List[FakeAttachment]] = None):
+        self.bot = bot
+        self.author = FakeUser(user_id)
+        self.channel = bot.get_channel(0)
+        self.message = FakeMessage(self.channel, content, attachments=attachments or [])
+
+    async def reply(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeResponse:
+    async def defer(self):
+        pass
+
+    async def send_message(self, *args: Any, **kwargs: Any):
+        pass
+
+
+class FakeInteraction:
+    """
+    Enough of a discord.Interaction for the views' button and dropdown callbacks.
+    """
+
+    def __init__(self, user_id: int, message: Optional[FakeMessage] = None):
+        self.user = FakeUser(user_id)
+        self.message = message
+        self.response = FakeResponse()
+
+
+def use_context(bot: FakeBot, user_id: int, content: str = "", attachments: Optional[List[FakeAttachment]] = None) -> FakeContext:
+    """
+    Installs a fresh FakeContext in the ContextManager, as the cog does before calling a module.
+    """
+    ctx = FakeContext(bot, user_id, content, attachments)
+    ctx_mgr().set_init_context(ctx)  # type: ignore
+    ctx_mgr().reset_active_msg()
+    return ctx
+
+
+def attachment(data: bytes, filename: str = "file.bin") -> FakeAttachment:
+    return FakeAttachment(filename, data)
+
+
+def audio(size: int = 64 * 1024) -> bytes:
+    return bytes(range(256)) * (size // 256)
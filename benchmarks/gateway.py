@@ -0,0 +1,215 @@
+from asyncio import Future, get_running_loop, sleep
+from collections import Counter
+from datetime import datetime, timezone
+from json import loads
+from re import match
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from discord import utils
+from discord.http import HTTPClient, Route
+
+Payload = Dict[str, Any]
+
+
+class Snowflakes:
+    """
+    Unique, time-ordered Discord ids, as the real API hands out.
+    """
+
+    def __init__(self):
+        self._last = 0
+
+    def next(self) -> int:
+        self._last = max(self._last + 1, utils.time_snowflake(datetime.now(timezone.utc)))
+        return self._last
+
+
+def user_payload(user_id: int, *, bot: bool = False) -> Payload:
+    return {
+        "id": str(user_id),
+        "username": f"{'bot' if bot else 'user'}-{user_id}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def guild_payload(guild_id: int, channel_ids: List[int]) -> Payload:
+    return {
+        "id": str(guild_id),
+        "name": "load-test",
+        "owner_id": str(guild_id),
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "members": [],
+        "member_count": 0,
+        "roles": [{
+            "id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+            "hoist": False, "managed": False, "mentionable": False, "flags": 0,
+        }],
+        "channels": [
+            {"id": str(channel_id), "type": 0, "name": f"channel-{i}", "position": i, "permission_overwrites": []}
+            for i, channel_id in enumerate(channel_ids)
+        ],
+    }
+
+
+class FakeHTTP(HTTPClient):
+    """
+    The REST side of Discord, in-process: every request is answered after `latency` seconds with a
+    payload shaped like the real one. Messages sent and edited are recorded so the harness can
+    match them to the commands and interactions that caused them.
+    """
+
+    def __init__(self, snowflakes: Snowflakes, bot_user: Payload, guild_id: int, latency: float):
+        super().__init__(get_running_loop())
+        self.snowflakes = snowflakes
+        self.bot_user = bot_user
+        self.guild_id = guild_id
+        self.latency = latency
+
+        self.requests: Counter[str] = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # message id -> ids of the messages sent in reply to it
+        self.replies: Dict[int, List[int]] = {}
+        # message id -> latest payload of every message the bot sent
+        self.messages: Dict[int, Payload] = {}
+        # message id -> futures resolved by its next edit
+        self._edit_waiters: Dict[int, List["Future[float]"]] = {}
+        # Called with (channel_id, payload) for every message sent
+        self.on_send: Optional[Callable[[int, Payload], None]] = None
+
+    def wait_for_edit(self, message_id: int) -> "Future[float]":
+        future: "Future[float]" = get_running_loop().create_future()
+        self._edit_waiters.setdefault(message_id, []).append(future)
+        return future
+
+    def message_payload(self, channel_id: int, message_id: int, payload: Payload) -> Payload:
+        return {
+            "id": str(message_id),
+            "channel_id": str(channel_id),
+            "guild_id": str(self.guild_id),
+            "type": 0,
+            "content": payload.get("content") or "",
+            "author": self.bot_user,
+            "attachments": [],
+            "embeds": payload.get("embeds") or [],
+            "components": payload.get("components") or [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "flags": 0,
+            "timestamp": utils.utcnow().isoformat(),
+            "edited_timestamp": None,
+        }
+
+    async def request(self, route: Route, *, files: Any = None, form: Any = None, **kwargs: Any) -> Any:
+        self.requests[route.key] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+        payload: Payload = kwargs.get("json") or {}
+        if form:
+            payload = loads(form[0]["value"])
+
+        path = route.url[len(Route.BASE):]
+        if route.method == "POST" and (m := match(r"/channels/(\d+)/messages$", path)):
+            channel_id, message_id = int(m[1]), self.snowflakes.next()
+            reference = payload.get("message_reference")
+            if reference is not None:
+                self.replies.setdefault(int(reference["message_id"]), []).append(message_id)
+            if self.on_send is not None:
+                self.on_send(channel_id, payload)
+            self.messages[message_id] = self.message_payload(channel_id, message_id, payload)
+            return self.messages[message_id]
+
+        if route.method == "PATCH" and (m := match(r"/channels/(\d+)/messages/(\d+)$", path)):
+            channel_id, message_id = int(m[1]), int(m[2])
+            self.messages[message_id] = self.message_payload(channel_id, message_id, payload)
+            for future in self._edit_waiters.pop(message_id, []):
+                if not future.done():
+                    future.set_result(perf_counter())
+            return self.messages[message_id]
+
+        if route.method == "GET" and (m := match(r"/channels/(\d+)$", path)):
+            return {"id": m[1], "type": 0, "guild_id": str(self.guild_id), "name": "fetched", "position": 0,
+                    "permission_overwrites": []}
+
+        return {}
+
+
+class FakeWebhookAdapter:
+    """
+    Answers interaction callbacks (`interaction.response.defer()` etc.), which discord.py sends
+    through its webhook adapter rather than the HTTPClient.
+    """
+
+    def __init__(self, http: FakeHTTP):
+        self.http = http
+
+    async def create_interaction_response(self, interaction_id: int, token: str, **kwargs: Any) -> Payload:
+        self.http.requests["POST /interactions/{interaction_id}/{token}/callback"] += 1
+        await sleep(self.http.latency)
+        return {"interaction": {"id": str(interaction_id), "type": 3}}
+
+
+def message_create(snowflakes: Snowflakes, guild_id: int, channel_id: int, user_id: int, content: str) -> Payload:
+    return {
+        "id": str(snowflakes.next()),
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "type": 0,
+        "content": content,
+        "author": user_payload(user_id),
+        "attachments": [],
+        "embeds": [],
+        "components": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "flags": 0,
+        "timestamp": utils.utcnow().isoformat(),
+        "edited_timestamp": None,
+    }
+
+
+def interaction_create(
+    snowflakes: Snowflakes, application_id: int, message: Payload, user_id: int,
+    custom_id: str, component_type: int, values: Optional[List[str]] = None,
+) -> Payload:
+    data: Payload = {"custom_id": custom_id, "component_type": component_type}
+    if values is not None:
+        data["values"] = values
+    return {
+        "id": str(snowflakes.next()),
+        "application_id": str(application_id),
+        "type": 3,
+        "token": "load-test",
+        "version": 1,
+        "channel_id": message["channel_id"],
+        "channel": {"id": message["channel_id"], "type": 0},
+        "guild_id": message["guild_id"],
+        "member": {
+            "user": user_payload(user_id), "roles": [], "joined_at": utils.utcnow().isoformat(),
+            "permissions": "0", "deaf": False, "mute": False, "flags": 0,
+        },
+        "message": message,
+        "data": data,
+        "locale": "en-US",
+        "app_permissions": "0",
+        "attachment_size_limit": 25 * 1024 * 1024,
+        "entitlements": [],
+        "authorizing_integration_owners": {},
+    }
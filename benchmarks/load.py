@@ -0,0 +1,480 @@
+"""
+Concurrent-user load and replay harness for the whole bot.
+
+    python -m benchmarks.load [--users 50] [--duration 120] [--think 2.0] [--api-latency-ms 50]
+                              [--seed 1] [--record run.jsonl | --replay run.jsonl] [--json out.json]
+
+Builds the real commands.Bot with every cog, but answers its REST calls from an in-process fake
+(benchmarks/gateway.py) and feeds it MESSAGE_CREATE / INTERACTION_CREATE gateway events directly,
+so commands, checks, views and the reminder scheduler run exactly as in production with no network.
+
+Each simulated user repeatedly picks an action (flashcard review with dropdown and button clicks,
+task edits, task listing, playlist playback, adding a reminder due the next minute) and waits a
+random think time. Reports end-to-end latency per step, event loop lag, database pool saturation,
+Discord API traffic and reminder delivery. --record saves the action script; --replay reruns it
+with the same timing and choices.
+"""
+import os
+from argparse import ArgumentParser
+from asyncio import Task, TimeoutError, create_task, gather, get_running_loop, run, sleep, wait_for
+from collections import Counter
+from datetime import datetime, timedelta
+from json import dump, dumps, loads
+from logging import WARNING, getLogger
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from warnings import filterwarnings
+
+# Songs are written to a throwaway local blob store, never to the configured one.
+os.environ["BLOB_STORE"] = "local"
+os.environ["BLOB_STORE_PATH"] = mkdtemp(prefix="load-blobs-")
+
+from discord import ClientUser, Intents  # noqa: E402
+from discord.ext import commands  # noqa: E402
+from discord.webhook.async_ import async_context  # noqa: E402
+
+from config import ALERT_CHANNEL_ID, DB_MODE  # noqa: E402
+from database import Database  # noqa: E402
+from modules.time_table import DAYS  # noqa: E402
+from storage import blob_store  # noqa: E402
+from utils.context_manager import ContextManager  # noqa: E402
+from utils.general import get_time  # noqa: E402
+from utils.random import generate_random_string  # noqa: E402
+from benchmarks.fakes import audio  # noqa: E402
+from benchmarks.gateway import (  # noqa: E402
+    FakeHTTP, FakeWebhookAdapter, Payload, Snowflakes, guild_payload, interaction_create, message_create, user_payload,
+)
+from benchmarks.scenarios import BASE_USER_ID, cleanup  # noqa: E402
+
+LOAD_USERS_FROM = BASE_USER_ID + 100_000
+TASKS_PER_USER = 5
+FLASHCARDS_PER_USER = 4
+SONGS_PER_USER = 3
+COMMAND_CHANNELS = 4
+# Longest wait for a command to complete or a click to update its message
+STEP_TIMEOUT = 10.0
+SAMPLE_INTERVAL = 0.05
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """
+    Count and p50/p95/p99/max of a list of seconds, in milliseconds.
+    """
+    return {
+        "count": len(values),
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+        "max_ms": 1000 * max(values, default=0.0),
+    }
+
+
+class SimUser:
+    def __init__(self, index: int, channel_id: int):
+        self.index = index
+        self.user_id = LOAD_USERS_FROM + index
+        self.channel_id = channel_id
+        self.task_ids: List[int] = []
+        self.set_id = generate_random_string(12)
+        self.playlist_id = generate_random_string(12)
+
+    async def seed(self, blob_hash: str, size: int):
+        """
+        Registers the user and gives them tasks, a flashcard set and a playlist to work with.
+        """
+        statements = [("INSERT INTO Users (user_id, name, join_date) VALUES (%s, %s, %s)", (self.user_id, f"load-{self.index}", get_time()))]
+        statements.append(("INSERT INTO Flashcard_Set (card_set_id, name, owner) VALUES (%s, %s, %s)", (self.set_id, "load", self.user_id)))
+        for i in range(FLASHCARDS_PER_USER):
+            card_id = generate_random_string(12)
+            statements.append((
+                "INSERT INTO Flashcard (card_id, user_id, question, options, answer) VALUES (%s, %s, %s, %s, %s)",
+                (card_id, self.user_id, f"Question {i}?", ["yes", "no", "maybe"], "yes"),
+            ))
+            statements.append((
+                "INSERT INTO Flashcard_Set_Cards (card_set_id, card_id, added_by) VALUES (%s, %s, %s)",
+                (self.set_id, card_id, self.user_id),
+            ))
+        statements.append(("INSERT INTO Playlist (playlist_id, user_id, name) VALUES (%s, %s, %s)", (self.playlist_id, self.user_id, "load")))
+        for i in range(SONGS_PER_USER):
+            song_id = generate_random_string(12)
+            statements.append((
+                "INSERT INTO Songs (song_id, user_id, name, blob_hash, size, artist) VALUES (%s, %s, %s, %s, %s, %s)",
+                (song_id, self.user_id, f"Song {i}", blob_hash, size, "load"),
+            ))
+            statements.append(("INSERT INTO Playlist_Songs (playlist_id, song_id) VALUES (%s, %s)", (self.playlist_id, song_id)))
+        statements.append((
+            "INSERT INTO Tasks (user_id, name, status) SELECT %s, 'task ' || n, 'pending' FROM generate_series(1, %s) AS n "
+            "RETURNING task_id",
+            (self.user_id, TASKS_PER_USER),
+        ))
+        self.task_ids = [row[0] for row in await Database.execute_transaction(statements)]
+
+
+class Simulation:
+    """
+    The bot under test plus the bookkeeping to turn injected events into latencies.
+    """
+
+    def __init__(self, api_latency: float):
+        self.snowflakes = Snowflakes()
+        self.guild_id = self.snowflakes.next()
+        self.application_id = self.snowflakes.next()
+        self.channel_ids = [self.snowflakes.next() for _ in range(COMMAND_CHANNELS)]
+        self.api_latency = api_latency
+
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Counter[str] = Counter()
+        self.loop_lag: List[float] = []
+        self.pool_samples: List[Dict[str, Any]] = []
+        self.reminders_created: List[datetime] = []
+        self.alerts: List[float] = []
+        self._pending: Dict[int, "Any"] = {}
+        self._samplers: List[Task[None]] = []
+
+    async def start(self):
+        from cogs.study_tracker_cog import StudyTrackerCog
+        from cogs.GeminiCog import GeminiAgent
+        from cogs.admin_cog import AdminCog
+
+        bot_user = user_payload(self.application_id, bot=True)
+        self.bot = commands.Bot(command_prefix="$", intents=Intents.all(), help_command=None, chunk_guilds_at_startup=False)
+        await self.bot._async_setup_hook()
+        self.http = FakeHTTP(self.snowflakes, bot_user, self.guild_id, self.api_latency)
+        self.http.on_send = self._on_send
+        self.bot.http = self.http
+        self.state = self.bot._connection
+        self.state.http = self.http
+        self.state.user = ClientUser(state=self.state, data=bot_user)  # type: ignore
+        self.state.application_id = self.application_id
+        self.state._add_guild_from_data(guild_payload(self.guild_id, [*self.channel_ids, ALERT_CHANNEL_ID]))  # type: ignore
+        # Interaction callbacks go through discord.py's webhook adapter; tasks started from here inherit this one.
+        async_context.set(FakeWebhookAdapter(self.http))  # type: ignore
+
+        self.bot.add_listener(self._on_command_done, "on_command_completion")
+        self.bot.add_listener(self._on_command_error, "on_command_error")
+        await self.bot.add_cog(StudyTrackerCog(self.bot))
+        await self.bot.add_cog(GeminiAgent(self.bot))
+        await self.bot.add_cog(AdminCog(self.bot))
+        self.bot._ready.set()
+        self.bot.dispatch("ready")
+
+        self._samplers = [create_task(self._sample_loop_lag()), create_task(self._sample_pool())]
+
+    async def stop(self):
+        for sampler in self._samplers:
+            sampler.cancel()
+        for name in list(self.bot.cogs):
+            await self.bot.remove_cog(name)
+
+    def _on_send(self, channel_id: int, payload: Payload):
+        if channel_id == ALERT_CHANNEL_ID:
+            # Alerts are due on the minute; how far into it they went out is their delivery latency.
+            now = datetime.now()
+            for _ in payload.get("embeds") or []:
+                self.alerts.append(now.second + now.microsecond / 1e6)
+
+    async def _on_command_done(self, ctx: commands.Context[Any]):
+        future = self._pending.pop(ctx.message.id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def _on_command_error(self, ctx: commands.Context[Any], error: Exception):
+        future = self._pending.pop(ctx.message.id, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    async def _sample_loop_lag(self):
+        while True:
+            expected = perf_counter() + SAMPLE_INTERVAL
+            await sleep(SAMPLE_INTERVAL)
+            self.loop_lag.append(max(0.0, perf_counter() - expected))
+
+    async def _sample_pool(self):
+        while True:
+            await sleep(SAMPLE_INTERVAL)
+            self.pool_samples.append(Database.get_backend_stats())
+
+    def _record(self, name: str, seconds: float):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    async def command(self, user: SimUser, content: str, name: str) -> Optional[int]:
+        """
+        Sends `content` as the user and waits for the command to finish.
+        Returns the id of the bot's last reply to it, if any.
+        """
+        data = message_create(self.snowflakes, self.guild_id, user.channel_id, user.user_id, content)
+        message_id = int(data["id"])
+        future = get_running_loop().create_future()
+        self._pending[message_id] = future
+        started = perf_counter()
+        self.state.parse_message_create(data)  # type: ignore
+        try:
+            await wait_for(future, STEP_TIMEOUT)
+        except TimeoutError:
+            self._pending.pop(message_id, None)
+            self.failures[f"{name}: timeout"] += 1
+            return None
+        except Exception as exc:
+            self.failures[f"{name}: {type(exc).__name__}"] += 1
+            return None
+        self._record(name, perf_counter() - started)
+        replies = self.http.replies.pop(message_id, [])
+        return replies[-1] if replies else None
+
+    async def click(self, user: SimUser, message_id: int, custom_id: str, component_type: int, name: str, values: Optional[List[str]] = None) -> bool:
+        """
+        Clicks a button (component_type 2) or picks from a select menu (3) on a message the bot sent,
+        and waits for the view to update that message.
+        """
+        message = self.http.messages.get(message_id)
+        if message is None:
+            self.failures[f"{name}: no message"] += 1
+            return False
+        data = interaction_create(self.snowflakes, self.application_id, message, user.user_id, custom_id, component_type, values)
+        edited = self.http.wait_for_edit(message_id)
+        started = perf_counter()
+        self.state.parse_interaction_create(data)  # type: ignore
+        try:
+            finished = await wait_for(edited, STEP_TIMEOUT)
+        except TimeoutError:
+            self.failures[f"{name}: timeout"] += 1
+            return False
+        self._record(name, finished - started)
+        return True
+
+
+async def review_flashcards(sim: Simulation, user: SimUser, rng: Random):
+    message_id = await sim.command(user, f"$flashcard_review_set {user.set_id}", "flashcard_review_set")
+    if message_id is None:
+        return
+    if await sim.click(user, message_id, "options", 3, "flashcard answer", [str(rng.randrange(3))]):
+        await sim.click(user, message_id, "next", 2, "flashcard next")
+
+
+async def edit_task(sim: Simulation, user: SimUser, rng: Random):
+    task_id = rng.choice(user.task_ids)
+    await sim.command(user, f"$set_task_by_id {task_id}", "set_task_by_id")
+    await sim.command(user, f"$add_description load test {rng.randrange(1000)}", "add_description")
+    await sim.command(user, f"$set_due_date 2030-01-{rng.randrange(1, 29):02} 10:00:00", "set_due_date")
+    await sim.command(user, f"$mark_as_started_by_id {task_id}", "mark_as_started_by_id")
+
+
+async def list_tasks(sim: Simulation, user: SimUser, rng: Random):
+    await sim.command(user, "$list_tasks", "list_tasks")
+
+
+async def play_playlist(sim: Simulation, user: SimUser, rng: Random):
+    message_id = await sim.command(user, f"$play_playlist {user.playlist_id}", "play_playlist")
+    if message_id is None:
+        return
+    for _ in range(rng.randrange(1, SONGS_PER_USER)):
+        if not await sim.click(user, message_id, "next", 2, "playlist next"):
+            return
+
+
+async def add_reminder(sim: Simulation, user: SimUser, rng: Random):
+    # Due at the start of the next minute (host time, as the user has no time zone), so it fires during the run.
+    due = (datetime.now() + timedelta(minutes=1)).replace(second=0, microsecond=0)
+    content = (
+        "$create_time_table_entry\n"
+        f"# name: Load {rng.randrange(1000)}\n"
+        f"## time: {due:%H:%M}\n"
+        f"## days: {DAYS[(due.weekday() + 1) % len(DAYS)]}\n"
+        "## duration: 30\n"
+        "- description: load test reminder"
+    )
+    if await sim.command(user, content, "create_time_table_entry") is not None:
+        sim.reminders_created.append(due)
+
+
+Action = Callable[[Simulation, SimUser, Random], Awaitable[None]]
+# name -> (action, weight in the random mix)
+ACTIONS: Dict[str, "tuple[Action, int]"] = {
+    "review_flashcards": (review_flashcards, 4),
+    "edit_task": (edit_task, 3),
+    "list_tasks": (list_tasks, 2),
+    "play_playlist": (play_playlist, 2),
+    "add_reminder": (add_reminder, 1),
+}
+
+
+async def perform(sim: Simulation, user: SimUser, name: str, seed: int):
+    try:
+        await ACTIONS[name][0](sim, user, Random(seed))
+    except Exception as exc:
+        sim.failures[f"{name}: {type(exc).__name__}: {exc}"] += 1
+
+
+async def run_user(sim: Simulation, user: SimUser, script: List[Dict[str, Any]], started: float, *,
+                   rng: Optional[Random] = None, deadline: float = 0.0, delay: float = 0.0, think: float = 0.0):
+    """
+    Replays `script` if it has entries, otherwise generates actions with `rng` until `deadline`,
+    appending them to `script`.
+    """
+    if script:
+        for step in list(script):
+            await sleep(max(0.0, started + step["t"] - perf_counter()))
+            await perform(sim, user, step["action"], step["seed"])
+        return
+
+    assert rng is not None
+    await sleep(delay)
+    names = list(ACTIONS)
+    weights = [weight for _, weight in ACTIONS.values()]
+    while perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        seed = rng.getrandbits(32)
+        script.append({"t": perf_counter() - started, "user": user.index, "action": name, "seed": seed})
+        await perform(sim, user, name, seed)
+        await sleep(rng.expovariate(1 / think) if think else 0)
+
+
+def report(sim: Simulation, elapsed: float, users: int) -> Dict[str, Any]:
+    steps = {name: summarize(values) for name, values in sorted(sim.latencies.items())}
+    completed = sum(step["count"] for step in steps.values())
+    queries = Database.query_stats.get_stats()
+
+    pool: Dict[str, Any] = {"mode": DB_MODE, "samples": len(sim.pool_samples)}
+    if sim.pool_samples:
+        if DB_MODE == "pool":
+            waiting = [sample.get("requests_waiting", 0) for sample in sim.pool_samples]
+            busy = [sample.get("pool_size", 0) - sample.get("pool_available", 0) for sample in sim.pool_samples]
+            pool["max_size"] = sim.pool_samples[-1].get("pool_max")
+        else:
+            waiting = [sample["queue_depth"] for sample in sim.pool_samples]
+            busy = [sample["running"] for sample in sim.pool_samples]
+            pool["max_size"] = sim.pool_samples[-1]["workers"]
+        pool["max_waiting"] = max(waiting)
+        pool["saturated_fraction"] = sum(1 for n in waiting if n > 0) / len(waiting)
+        pool["max_busy"] = max(busy)
+        pool["avg_busy"] = sum(busy) / len(busy)
+        pool["final"] = sim.pool_samples[-1]
+
+    return {
+        "users": users,
+        "elapsed_s": elapsed,
+        "api_latency_ms": 1000 * sim.api_latency,
+        "steps_per_sec": completed / elapsed if elapsed else 0.0,
+        "steps": steps,
+        "failures": dict(sim.failures),
+        "loop_lag": summarize(sim.loop_lag),
+        "db": {"queries": queries["calls"], "errors": queries["errors"], "queries_per_sec": queries["calls"] / elapsed, "pool": pool},
+        "http": {"requests": dict(sim.http.requests), "max_in_flight": sim.http.max_in_flight},
+        "reminders": {
+            "created": len(sim.reminders_created),
+            "alerts_delivered": len(sim.alerts),
+            "seconds_after_due": {
+                "p50": percentile(sim.alerts, 0.5), "p99": percentile(sim.alerts, 0.99), "max": max(sim.alerts, default=0.0),
+            },
+        },
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"{result['users']} users for {result['elapsed_s']:.0f}s, {result['steps_per_sec']:.1f} steps/s, "
+          f"Discord API latency {result['api_latency_ms']:.0f}ms\n")
+    print(f"{'step':<26} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, step in result["steps"].items():
+        print(f"{name:<26} {step['count']:>7} {step['p50_ms']:>9.1f} {step['p95_ms']:>9.1f} {step['p99_ms']:>9.1f} {step['max_ms']:>9.1f}")
+    for failure, count in result["failures"].items():
+        print(f"FAILED {failure}: {count}")
+
+    lag = result["loop_lag"]
+    print(f"\nEvent loop lag: p50 {lag['p50_ms']:.1f}ms, p99 {lag['p99_ms']:.1f}ms, max {lag['max_ms']:.1f}ms")
+    db, pool = result["db"], result["db"]["pool"]
+    print(f"Database: {db['queries']} queries ({db['queries_per_sec']:.0f}/s), {db['errors']} errors")
+    if "max_waiting" in pool:
+        print(f"  {pool['mode']}: busy avg {pool['avg_busy']:.1f} / max {pool['max_busy']} of {pool['max_size']}, "
+              f"callers waiting max {pool['max_waiting']}, saturated in {pool['saturated_fraction']:.0%} of samples")
+    http = result["http"]
+    print(f"Discord API: {sum(http['requests'].values())} requests, max {http['max_in_flight']} in flight")
+    reminders = result["reminders"]
+    if reminders["created"]:
+        after = reminders["seconds_after_due"]
+        print(f"Reminders: {reminders['created']} created, {reminders['alerts_delivered']} alerts delivered, "
+              f"{after['p50']:.2f}s / {after['max']:.2f}s (p50 / max) after due")
+
+
+async def main():
+    parser = ArgumentParser(description="Simulates concurrent users against the whole bot with no network.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=120.0, help="seconds of generated load")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which users join")
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds a user waits between actions")
+    parser.add_argument("--api-latency-ms", type=float, default=50.0, help="simulated Discord API round trip")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record", help="save the generated action script to this file")
+    parser.add_argument("--replay", help="rerun an action script saved with --record")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    getLogger().setLevel(WARNING)
+    # Views are created and dropped by the thousand here; their async __del__ is never awaited.
+    filterwarnings("ignore", message="coroutine 'BaseView.__del__' was never awaited")
+
+    scripts: Dict[int, List[Dict[str, Any]]] = {}
+    users = args.users
+    if args.replay:
+        with open(args.replay) as f:
+            for line in f:
+                step = loads(line)
+                scripts.setdefault(step["user"], []).append(step)
+        users = max(scripts) + 1
+
+    await Database.establish_connection()
+    ContextManager.setup_context_manager()
+    sim = Simulation(args.api_latency_ms / 1000)
+    try:
+        await cleanup()
+        size = len(audio())
+        blob_hash = await get_running_loop().run_in_executor(None, blob_store().put, audio())
+        sim_users = [SimUser(i, sim.channel_ids[i % COMMAND_CHANNELS]) for i in range(users)]
+        for user in sim_users:
+            await user.seed(blob_hash, size)
+        await sim.start()
+
+        started = perf_counter()
+        deadline = started + args.duration
+        rng = Random(args.seed)
+        await gather(*(
+            run_user(
+                sim, user, scripts.setdefault(user.index, []), started,
+                rng=Random(rng.getrandbits(32)), deadline=deadline, delay=args.ramp * user.index / users, think=args.think,
+            )
+            for user in sim_users
+        ))
+        # Let reminders due during the run go out before measuring them.
+        if sim.reminders_created:
+            await sleep(max(0.0, (max(sim.reminders_created) - datetime.now()).total_seconds() + 5))
+        elapsed = perf_counter() - started
+
+        result = report(sim, elapsed, users)
+        result["generated_at"] = int(time())
+        print_report(result)
+        if args.json:
+            with open(args.json, "w") as f:
+                dump(result, f, indent=2)
+        if args.record and not args.replay:
+            with open(args.record, "w") as f:
+                for step in sorted((step for script in scripts.values() for step in script), key=lambda step: step["t"]):
+                    f.write(dumps(step) + "\n")
+    finally:
+        if hasattr(sim, "bot"):
+            await sim.stop()
+        await cleanup()
+        await Database.terminate_connection()
+        rmtree(os.environ["BLOB_STORE_PATH"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,166 @@
+"""
+Offline benchmarks for the command hot paths.
+
+    python -m benchmarks.run [--iterations 200] [--only tasks,songs] [--json out.json] [--compare baseline.json]
+
+Runs every scenario in benchmarks/scenarios.py against the Postgres configured in .env (migrated with
+construct_db.py) through a fake Discord context, and reports ops/s, p50/p99 latency and database
+queries per operation. With --compare, exits with status 1 if any scenario regressed.
+"""
+import os
+from argparse import ArgumentParser
+from asyncio import run
+from json import dump, load
+from logging import WARNING, getLogger
+from platform import python_version
+from shutil import rmtree
+from subprocess import DEVNULL, check_output
+from tempfile import mkdtemp
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional
+from warnings import filterwarnings
+
+# Songs are written to a throwaway local blob store, never to the configured one.
+os.environ["BLOB_STORE"] = "local"
+os.environ["BLOB_STORE_PATH"] = mkdtemp(prefix="bench-blobs-")
+
+from config import DB_MODE  # noqa: E402
+from database import Database  # noqa: E402
+from utils.context_manager import ContextManager  # noqa: E402
+from benchmarks.scenarios import SCENARIOS, Fixture, Scenario, cleanup  # noqa: E402
+
+
+def percentile(timings: List[float], fraction: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def query_count() -> int:
+    return sum(stats.calls for stats in Database.query_stats.statements.values())
+
+
+async def measure(fixture: Fixture, fn: Scenario, iterations: int, warmup: int) -> Dict[str, Any]:
+    for i in range(warmup):
+        await fn(fixture, i)
+
+    queries = query_count()
+    timings: List[float] = []
+    started = perf_counter()
+    for i in range(warmup, warmup + iterations):
+        op_started = perf_counter()
+        await fn(fixture, i)
+        timings.append(perf_counter() - op_started)
+    elapsed = perf_counter() - started
+
+    return {
+        "ops_per_sec": iterations / elapsed,
+        "mean_ms": 1000 * elapsed / iterations,
+        "p50_ms": 1000 * percentile(timings, 0.50),
+        "p99_ms": 1000 * percentile(timings, 0.99),
+        "queries_per_op": (query_count() - queries) / iterations,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return check_output(["git", "rev-parse", "--short", "HEAD"], stderr=DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    print(f"{'scenario':<40} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<40} ERROR: {result['error']}")
+            continue
+        print(
+            f"{name:<40} {result['ops_per_sec']:>9.1f} {result['p50_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['queries_per_op']:>8.2f}"
+        )
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """
+    Prints the change against `baseline` and returns the scenarios that regressed: p50 latency up
+    by more than `threshold`, or more queries per operation (which doesn't depend on the machine).
+    """
+    regressions: List[str] = []
+    print(f"\n{'scenario':<40} {'p50':>9} {'ops/s':>9} {'queries':>12}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or "error" in before or "error" in result:
+            continue
+        p50 = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        ops = result["ops_per_sec"] / before["ops_per_sec"] - 1 if before["ops_per_sec"] else 0.0
+        regressed = p50 > threshold or result["queries_per_op"] > before["queries_per_op"] + 0.01
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<40} {p50:>+9.0%} {ops:>+9.0%} "
+            f"{before['queries_per_op']:>5.2f} -> {result['queries_per_op']:<5.2f}{'  REGRESSED' if regressed else ''}"
+        )
+    return regressions
+
+
+async def main() -> int:
+    parser = ArgumentParser(description="Benchmarks the command hot paths against a local Postgres.")
+    parser.add_argument("--iterations", type=int, default=200, help="measured operations per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured operations run first")
+    parser.add_argument("--only", help="comma separated scenario name prefixes, e.g. tasks,songs.get_song")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    getLogger().setLevel(WARNING)
+    # Views are created and dropped by the thousand here; their async __del__ is never awaited.
+    filterwarnings("ignore", message="coroutine 'BaseView.__del__' was never awaited")
+    prefixes = args.only.split(",") if args.only else [""]
+    scenarios = {name: fn for name, fn in SCENARIOS.items() if any(name.startswith(prefix) for prefix in prefixes)}
+
+    await Database.establish_connection()
+    ContextManager.setup_context_manager()
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        fixture = Fixture()
+        await fixture.setup()
+        for name, fn in scenarios.items():
+            try:
+                results[name] = await measure(fixture, fn, args.iterations, args.warmup)
+            except Exception as exc:
+                results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+    finally:
+        await cleanup()
+        await Database.terminate_connection()
+        rmtree(os.environ["BLOB_STORE_PATH"], ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": int(time()),
+            "python": python_version(),
+            "db_mode": DB_MODE,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = load(f)
+        print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('db_mode')} mode)")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(run(main()))
@@ -0,0 +1,295 @@
+from asyncio import to_thread
+from typing import Awaitable, Callable, Dict, List
+
+from database import Database
+from storage import blob_store
+from utils.general import get_time
+from utils.random import generate_random_string
+from benchmarks.fakes import FakeBot, FakeInteraction, attachment, audio, use_context
+
+# Every row the suite creates belongs to a user id at or above this, so it can be cleaned up afterwards.
+BASE_USER_ID = 9_100_000_000_000_000_000
+READER_ID = BASE_USER_ID
+WRITER_ID = BASE_USER_ID + 1
+NEW_USERS_FROM = BASE_USER_ID + 1_000
+
+FLASHCARDS = 20
+SET_SIZE = 10
+SONGS = 5
+TASKS = 50
+ALERTS = 25
+
+
+class Fixture:
+    """
+    Data the scenarios read: a reader with flashcards, a set, songs in a playlist and tasks,
+    and a writer whose rows pile up as the write scenarios run.
+    """
+
+    def __init__(self):
+        self.bot = FakeBot()
+        self.card_ids: List[str] = []
+        self.set_id = generate_random_string(12)
+        self.song_ids: List[str] = []
+        self.playlist_id = generate_random_string(12)
+        self.task_ids: List[int] = []
+        self.new_users = 0
+
+    async def setup(self):
+        await cleanup()
+        now = get_time()
+        for user_id in (READER_ID, WRITER_ID):
+            query = "INSERT INTO Users (user_id, name, join_date) VALUES (%s, %s, %s)"
+            await Database.execute_query(query, user_id, f"bench-{user_id}", now)
+
+        for i in range(FLASHCARDS):
+            card_id = generate_random_string(12)
+            query = "INSERT INTO Flashcard (card_id, user_id, question, options, answer) VALUES (%s, %s, %s, %s, %s)"
+            await Database.execute_query(query, card_id, READER_ID, f"Question {i}?", ["yes", "no", "maybe"], "yes")
+            self.card_ids.append(card_id)
+        query = "INSERT INTO Flashcard_Set (card_set_id, name, owner) VALUES (%s, %s, %s)"
+        await Database.execute_query(query, self.set_id, "bench", READER_ID)
+        for card_id in self.card_ids[:SET_SIZE]:
+            query = "INSERT INTO Flashcard_Set_Cards (card_set_id, card_id, added_by) VALUES (%s, %s, %s)"
+            await Database.execute_query(query, self.set_id, card_id, READER_ID)
+
+        blob_hash = await to_thread(blob_store().put, audio())
+        query = "INSERT INTO Playlist (playlist_id, user_id, name) VALUES (%s, %s, %s)"
+        await Database.execute_query(query, self.playlist_id, READER_ID, "bench")
+        for i in range(SONGS):
+            song_id = generate_random_string(12)
+            query = "INSERT INTO Songs (song_id, user_id, name, blob_hash, size, artist) VALUES (%s, %s, %s, %s, %s, %s)"
+            await Database.execute_query(query, song_id, READER_ID, f"Song {i}", blob_hash, len(audio()), "bench")
+            query = "INSERT INTO Playlist_Songs (playlist_id, song_id) VALUES (%s, %s)"
+            await Database.execute_query(query, self.playlist_id, song_id)
+            self.song_ids.append(song_id)
+
+        for i in range(TASKS):
+            query = "INSERT INTO Tasks (user_id, name, status) VALUES (%s, %s, 'pending') RETURNING task_id"
+            self.task_ids.append((await Database.fetch_one(query, READER_ID, f"task {i}"))[0])
+
+
+async def cleanup():
+    """
+    Deletes everything owned by the benchmark users, children first.
+    """
+    cards = "SELECT card_id FROM Flashcard WHERE user_id >= %s"
+    sets = "SELECT card_set_id FROM Flashcard_Set WHERE owner >= %s"
+    statements = [
+        (f"DELETE FROM Flashcard_History WHERE user_id >= %s OR card_id IN ({cards})", 2),
+        (f"DELETE FROM Flashcard_Set_Cards WHERE card_set_id IN ({sets}) OR card_id IN ({cards})", 2),
+        (f"DELETE FROM Flashcard_set_access WHERE user_id >= %s OR card_set_id IN ({sets})", 2),
+        ("DELETE FROM Flashcard_Set WHERE owner >= %s", 1),
+        ("DELETE FROM Flashcard WHERE user_id >= %s", 1),
+        ("DELETE FROM Playlist_Songs WHERE playlist_id IN (SELECT playlist_id FROM Playlist WHERE user_id >= %s) "
+         "OR song_id IN (SELECT song_id FROM Songs WHERE user_id >= %s)", 2),
+        ("DELETE FROM Playlist WHERE user_id >= %s", 1),
+        ("DELETE FROM Songs WHERE user_id >= %s", 1),
+        ("DELETE FROM Time_Table WHERE user_id >= %s", 1),
+        ("DELETE FROM Tasks WHERE user_id >= %s", 1),
+        ("DELETE FROM Focus_Mode WHERE user_id >= %s", 1),
+        ("DELETE FROM User_Sessions WHERE user_id >= %s", 1),
+        ("DELETE FROM Users WHERE user_id >= %s", 1),
+    ]
+    await Database.execute_transaction([(query, (BASE_USER_ID,) * n) for query, n in statements])
+
+
+Scenario = Callable[[Fixture, int], Awaitable[None]]
+SCENARIOS: Dict[str, Scenario] = {}
+
+
+def scenario(name: str):
+    def register(fn: Scenario) -> Scenario:
+        SCENARIOS[name] = fn
+        return fn
+
+    return register
+
+
+@scenario("user.register_user")
+async def register_user(fx: Fixture, i: int):
+    from modules.user import register_user
+
+    fx.new_users += 1
+    use_context(fx.bot, NEW_USERS_FROM + fx.new_users)
+    await register_user("Bench", "User")
+
+
+@scenario("user.set_institution")
+async def set_institution(fx: Fixture, i: int):
+    from modules.user import set_institution
+
+    use_context(fx.bot, WRITER_ID)
+    await set_institution("Bench", "University", str(i))
+
+
+@scenario("user.set_time_zone")
+async def set_time_zone(fx: Fixture, i: int):
+    from modules.user import set_time_zone
+
+    use_context(fx.bot, WRITER_ID)
+    await set_time_zone(str(i % 24 - 12))
+
+
+@scenario("user.set_dob")
+async def set_dob(fx: Fixture, i: int):
+    from modules.user import set_dob
+
+    use_context(fx.bot, WRITER_ID)
+    await set_dob(f"{i % 28 + 1:02} 01 2000")
+
+
+@scenario("tasks.add_task")
+async def add_task(fx: Fixture, i: int):
+    from modules.tasks import add_task
+
+    use_context(fx.bot, WRITER_ID)
+    await add_task(f"bench task {i}")
+
+
+@scenario("tasks.list_tasks")
+async def list_tasks(fx: Fixture, i: int):
+    from modules.tasks import list_tasks
+
+    use_context(fx.bot, READER_ID)
+    await list_tasks()
+
+
+@scenario("tasks.mark_as_started")
+async def mark_as_started(fx: Fixture, i: int):
+    from modules.tasks import mark_as_started
+
+    use_context(fx.bot, READER_ID)
+    await mark_as_started(name=f"task {i % TASKS}")
+
+
+@scenario("tasks.mark_as_done")
+async def mark_as_done(fx: Fixture, i: int):
+    from modules.tasks import mark_as_done
+
+    use_context(fx.bot, READER_ID)
+    await mark_as_done(task_id=fx.task_ids[i % TASKS])
+
+
+@scenario("tasks.set_due_date")
+async def set_due_date(fx: Fixture, i: int):
+    from modules.tasks import set_due_date
+
+    use_context(fx.bot, READER_ID)
+    await set_due_date(fx.task_ids[i % TASKS], "2030-01-01")
+
+
+@scenario("flashcards.add_flashcard")
+async def add_flashcard(fx: Fixture, i: int):
+    from modules.flashcards import add_flashcard
+
+    use_context(fx.bot, WRITER_ID, f"$add_flashcard\n# Q: Question {i}?\n## A: yes\n- yes\n- no")
+    await add_flashcard()
+
+
+@scenario("flashcards.list_flashcards")
+async def list_flashcards(fx: Fixture, i: int):
+    from modules.flashcards import list_flashcards
+
+    use_context(fx.bot, READER_ID)
+    await list_flashcards()
+
+
+@scenario("flashcards.flashcard_flash")
+async def flashcard_flash(fx: Fixture, i: int):
+    from modules.flashcards import flashcard_flash
+
+    use_context(fx.bot, READER_ID)
+    await flashcard_flash(fx.card_ids[i % FLASHCARDS])
+
+
+@scenario("flashcards.flashcard_review_set")
+async def flashcard_review_set(fx: Fixture, i: int):
+    from modules.flashcards import flashcard_review_set
+
+    use_context(fx.bot, READER_ID)
+    await flashcard_review_set(fx.set_id)
+
+
+@scenario("flashcards.answer_and_next")
+async def answer_and_next(fx: Fixture, i: int):
+    """
+    One review step: pick an option from the dropdown, then press Next.
+    """
+    from modules.flashcards import Flashcard, FlashcardFlashView
+
+    use_context(fx.bot, READER_ID)
+    flashcards = await Flashcard.load_flashcards(fx.card_ids)
+    view = FlashcardFlashView(flashcards)
+    view.idx = i % (FLASHCARDS - 1)
+    await view.send()
+    interaction = FakeInteraction(READER_ID)
+    await view._dropdown_selected(interaction=interaction, custom_id="options", values=["0"])  # type: ignore
+    await view._button_clicked(interaction, "next")  # type: ignore
+
+
+@scenario("songs.add_song")
+async def add_song(fx: Fixture, i: int):
+    from modules.songs import add_song
+
+    use_context(fx.bot, WRITER_ID, attachments=[attachment(audio(), "song.mp3")])
+    await add_song("Bench", "Song", str(i), "by", "Bench")
+
+
+@scenario("songs.get_song")
+async def get_song(fx: Fixture, i: int):
+    from modules.songs import get_song
+
+    use_context(fx.bot, READER_ID)
+    await get_song(fx.song_ids[i % SONGS])
+
+
+@scenario("songs.get_playlist")
+async def get_playlist(fx: Fixture, i: int):
+    from modules.songs import get_playlist
+
+    use_context(fx.bot, READER_ID)
+    await get_playlist(fx.playlist_id)
+
+
+@scenario("songs.play_playlist")
+async def play_playlist(fx: Fixture, i: int):
+    from modules.songs import play_playlist
+
+    use_context(fx.bot, READER_ID)
+    await play_playlist(fx.playlist_id)
+
+
+@scenario("time_table.create_time_table_entry")
+async def create_time_table_entry(fx: Fixture, i: int):
+    from modules.time_table import create_time_table_entry
+
+    content = (
+        "$create_time_table_entry\n"
+        f"# name: Bench {i}\n"
+        f"## time: {i % 24:02}:{i % 60:02}\n"
+        "## days: Mon Wed Fri\n"
+        "## duration: 60\n"
+        "- description: benchmark entry"
+    )
+    use_context(fx.bot, WRITER_ID, content)
+    await create_time_table_entry()
+
+
+@scenario("time_table.send_alert")
+async def send_alert(fx: Fixture, i: int):
+    """
+    One reminder slot with ALERTS entries due at once. The per-channel rate limit is reset first, as
+    the fake channel would otherwise be throttled to a few messages per second across iterations.
+    """
+    from modules.time_table import TimeTableEntry, _channel_windows, send_alert
+
+    use_context(fx.bot, READER_ID)
+    _channel_windows.clear()
+    tt_entries: List[TimeTableEntry] = []
+    for n in range(ALERTS):
+        tt_entry = TimeTableEntry()
+        tt_entry.tt_id = f"bench{n:07}"
+        tt_entry._set_from_row((READER_ID + n % 2, f"Bench {n}", "benchmark entry", 0b0101010, 930, 60, True, True))
+        tt_entries.append(tt_entry)
+    await send_alert(fx.bot, tt_entries)  # type: ignore
@@ -1,210 +1,344 @@
-from config import Gemini_API_Key
+from config import (
+    Gemini_API_Key,
+    GEMINI_CACHE_TTL,
+    GEMINI_CACHE_MAX_ITEMS,
+    GEMINI_SEMANTIC_CACHE_THRESHOLD,
+    GEMINI_EMBEDDING_MODEL,
+    GEMINI_HELP_TOKEN_BUDGET,
+    GEMINI_USER_PER_MINUTE,
+    GEMINI_GUILD_PER_MINUTE,
+    GEMINI_GLOBAL_PER_MINUTE,
+    GEMINI_WORKERS,
+    GEMINI_QUEUE_SIZE,
+    GEMINI_CHAT_TTL,
+    GEMINI_CHAT_MAX_SESSIONS,
+    GEMINI_CHAT_MAX_TOKENS,
+)
 from discord.ext import commands
 import google.generativeai as genai
-import time
-
-helpContext='''
-Below is the list of available commands
-
-Study Tracker Commands
-
-Flashcard Commands
-- $add_flashcard 
-    {message} (message should be in a new line)
-  Adds a new flashcard. Message format should be
-# Q: <question 256 chars>
-## A: <answer 256 chars>
-- <option1 256 chars>
-- <option2 256 chars>
-- <option3>
- Always give atleast 2 options and try to give 3 options
-
-- $list_flashcards  
-  Lists all flashcards. No arguments required.
-- $flashcard_flash {card_id}  
-  Flashes a specific flashcard by ID. Takes one argument: card_id.
-- $flashcard_create_set {set_name}
-  Creates a new flashcard set. Takes one argument: <set_name>
-- $flashcard_add_to_set {set_id} {card_id}
-  Adds a flashcard to a set by ID. Takes two arguments: set_id, card_id.
-- $flashcard_remove_from_set {set_id} {card_id}
-  Removes a flashcard from a set by ID. Takes two arguments: set_id, card_id.
-- $flashcard_review_set {set_id}
-  Reviews a flashcard set by ID. Takes one argument: set_id.
-
-Task Management Commands
-- $add_task {name}  
-  Adds a new task with a specified name. Takes one argument: name.
-- $set_task {name}  
-  Sets the current task by name. Takes one argument: name.
-- $set_task_by_id {id}  
-  Sets the current task by ID. Takes one argument: id.
-- $add_description {description}  
-  Adds a description to the current task. Takes one argument: description.
-- $list_tasks  
-  Lists all tasks. No arguments required.
-- $remove_task {name}  
-  Removes a task by name. Takes one argument: name.
-- $delete_task {id}  
-  Deletes a task by ID. Takes one argument: id.Also called task number
-- $mark_as_done {name}  
-  Marks a task as done by name. Takes one argument: name.
-- $mark_as_started {name}  
-  Marks a task as started by name. Takes one argument: name.
-- $mark_as_started_by_id {id}  
-  Marks a task as started by ID. Takes one argument: id.
-- $mark_as_done_by_id {id}  
-  Marks a task as done by ID. Takes one argument: id.
-- $set_due_date {due_date}  
-  Sets a due date for the current task. Takes one argument: due_date (format: YYYY-MM-DD HH:MM:SS).
-
-Music Commands
-- $add_song {message}  
-  Adds a new song. Message format should be 'Song Name by Artist.
-  For example: despacito by justin bieber
-  An attachment containing an audio file(mp3) should be sent with the message
-- $get_song {song_id}  
-  Retrieves a song by ID. Takes one argument: song_id.
-- $create_playlist {playlist_name}  
-  Creates a new playlist. Takes the name of the playlist.
-- $get_playlist {playlist_id}  
-  Retrieves a playlist by ID. Takes one argument: playlist_id.
-- $add_song_to_playlist {playlist_id} {song_id}  
-  Adds a song to a playlist by song ID and playlist ID. Takes two arguments: playlist_id, song_id.
-- $remove_song_from_playlist {playlist_id} {song_id}  
-  Removes a song from a playlist by song ID and playlist ID. Takes two arguments: playlist_id, song_id.
-- $play_playlist {playlist_id}  
-  Plays a playlist by ID. Takes one argument: playlist_id.
-
-Time Table Management Commands
-- $create_time_table_entry {message}
-  Adds a new time table entry. Message format should be
-  # name: <name>
-  ## time: <time>
-  ## days: <day>(day should be first three letters of the word with first letter in capital.E.g. Mon)
-  ## duration: <duration>(an integer in minutes)
-  - description: <description>
--$delete_time_table_entry {tt_id}
-  Removes a time table entry by ID. Takes one argument: tt_id.
-
-
-General Purpose Commands
-- $ping  
-  Responds with 'Pong!' and alternates messages. No arguments required.
-- $query {question}  
-  Queries the Gemini API with your question and returns a response. Takes one argument: question.
-- $pm  
-  Sends a private message to you asking how the bot can help and you can talk to it. No arguments required.
-- $gemini enable  
-  Enables Gemini to respond to every message in the server. No arguments required.
-- $gemini disable  
-  Disables Gemini from responding to every message in the server. No arguments required.
-- $register {name}  
-  Registers a new user. Takes the name of the user
-- $set_institution {institution}
-  Sets the institution of the user. Takes the name of the institution
-- $set_dob {dob}
-  Sets the date of birth of the user. Takes the date of birth in the format DD MM YYYY
-- !help {question}  
-  To ask a question related to the commands to the bot. Takes one optional argument: question.
-'''
+import asyncio
+import logging
+from time import perf_counter
+from utils.response_cache import ResponseCache
+from utils.help_context import HelpContext
+from utils.rate_limit import RateLimiter
+from utils.work_queue import WorkQueue
+from utils.chat_memory import ChatMemory
+from utils.general import get_time
+from utils.metrics import metrics
+from database import Database
 
 
 genai.configure(api_key=Gemini_API_Key)
 DISCORD_MAX_MESSAGE_LENGTH=2000
 PLEASE_TRY_AGAIN_ERROR_MESSAGE='There was an issue with your question please try again.. '
-Gemini=False
-first_time=True
+SERVER_ERROR_MESSAGE="There was an error from serverside.. Please try again.."
+RATE_LIMITED_MESSAGE="You're asking too quickly, please wait a moment and try again.."
+BUSY_MESSAGE="Gemini Agent is busy right now, please try again in a bit.."
+STREAM_INTERRUPTED_MESSAGE="(The answer was cut off by an error from serverside, please ask again for the rest..)"
+# Seconds between edits of a streaming reply; Discord allows about 5 message edits per 5 seconds per channel
+STREAM_EDIT_INTERVAL=1.0
 class GeminiAgent(commands.Cog):
 
     def __init__(self,bot):
         self.bot = bot
         self.model = genai.GenerativeModel('gemini-pro')
+        self.response_cache = ResponseCache(
+            ttl=GEMINI_CACHE_TTL,
+            max_items=GEMINI_CACHE_MAX_ITEMS,
+            embed=self.embed_content,
+            threshold=GEMINI_SEMANTIC_CACHE_THRESHOLD,
+        )
+        self.help_context = None
+        self.rate_limiter = RateLimiter(
+            user_per_minute=GEMINI_USER_PER_MINUTE,
+            guild_per_minute=GEMINI_GUILD_PER_MINUTE,
+            global_per_minute=GEMINI_GLOBAL_PER_MINUTE,
+        )
+        self.work_queue = WorkQueue("Gemini", GEMINI_WORKERS, GEMINI_QUEUE_SIZE)
+        self.chat_memory = ChatMemory(
+            ttl=GEMINI_CHAT_TTL,
+            max_sessions=GEMINI_CHAT_MAX_SESSIONS,
+            max_tokens=GEMINI_CHAT_MAX_TOKENS,
+            summarize=self.summarize_chat,
+        )
+        # Channels where Gemini answers every message; mirrors the Gemini_Channels table.
+        self.enabled_channels = set()
+
+    async def cog_load(self):
+        result = await Database.fetch_many("SELECT channel_id FROM Gemini_Channels")
+        self.enabled_channels = {row[0] for row in result}
+        self.work_queue.start()
+
+    async def cog_unload(self):
+        self.work_queue.stop()
+
+    async def cog_before_invoke(self,ctx):
+        metrics().command_started(ctx)
+
+    async def cog_after_invoke(self,ctx):
+        metrics().command_finished(ctx)
+
+    def get_help_context(self):
+        # Built from the registered commands once every cog has been added.
+        if self.help_context is None:
+            self.help_context = HelpContext(self.bot)
+        return self.help_context
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.get_help_context()
 
     @commands.Cog.listener()
     async def on_message(self,msg):
+        if msg.author.bot:
+            return
+        # In server channels without Gemini enabled only the explicit triggers below are answered.
+        if msg.guild is not None and msg.channel.id not in self.enabled_channels:
+            if not msg.content.startswith(("!help", "ping gemini-agent")):
+                return
         try:
             if msg.content == "ping gemini-agent":
                 await msg.channel.send("Agent is connected..")
             elif msg.content[:5] == "!help":
                  prompt=msg.content[5:]
-                 global helpContext
-                 response = self.gemini_generate_content(helpContext+prompt)
-                 await self.send_message_in_chunks(msg.channel,response)
-            elif 'Direct Message' in str(msg.channel) and not msg.author.bot:
-                response = self.gemini_generate_content(msg.content)
+                 context = self.get_help_context().select(prompt, GEMINI_HELP_TOKEN_BUDGET)
+                 await self.reply(msg.channel,msg.author,msg.guild,f"{context}\n\nQuestion: {prompt}",cache=("help",prompt))
+            elif msg.guild is None:
+                # DMs are a conversation: send the user's session along and remember the exchange.
                 dmchannel = await msg.author.create_dm()
-                await self.send_message_in_chunks(dmchannel,response) 
-                global first_time
-            elif(not msg.author.bot and Gemini):
-                if first_time:
-                    await msg.channel.send('Hi, I am Gemini Agent. How can I help you today?')
-                    first_time=False
-                else:
-                    if(msg.content[0]!='$'):
-                        response = self.gemini_generate_content(msg.content)
-                        await self.send_message_in_chunks(msg.channel,response) 
+                contents = self.chat_memory.get(msg.author.id).contents(msg.content)
+                async def remember(answer):
+                    if self.chat_memory.add_exchange(msg.author.id, msg.content, answer):
+                        await self.compact_chat(msg.author.id)
+                await self.reply(dmchannel,msg.author,None,contents,on_answer=remember)
+            elif msg.content and msg.content[0]!='$':
+                await self.reply(msg.channel,msg.author,msg.guild,msg.content)
         except Exception as e:
-            await msg.channel.send("There was an error from serverside.. Please try again..")
+            await msg.channel.send(SERVER_ERROR_MESSAGE)
         
 
-    @commands.command()
+    @commands.command(extras={"group": "Gemini"})
     async def query(self,ctx,*,question):
+        """
+        Asks Gemini a question and replies with its answer. Takes the question.
+        """
         try:
-            response = self.gemini_generate_content(question)
-            await self.send_message_in_chunks(ctx,response)
-            
+            await self.reply(ctx,ctx.author,ctx.guild,question,cache=("query",question))
+
         except Exception as e:
-            await ctx.send("There was an error from serverside.. Please try again..")
+            await ctx.send(SERVER_ERROR_MESSAGE)
     
-    @commands.group()
+    @commands.group(extras={"group": "Gemini"})
     async def gemini(self,ctx):
+        """
+        Turns Gemini replies to every message in a channel on or off.
+        """
         pass
 
-    @gemini.command()
+    @gemini.command(extras={"group": "Gemini"})
+    @commands.guild_only()
     async def enable(self,ctx):
-        global Gemini,first_time
-        Gemini=True
+        """
+        Enables Gemini to respond to every message in this channel.
+        """
+        query = (
+            "INSERT INTO Gemini_Channels (channel_id, guild_id, enabled_by, enabled_at) "
+            "VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING"
+        )
+        await Database.execute_transaction([(query, (ctx.channel.id, ctx.guild.id, ctx.author.id, get_time()))])
+        self.enabled_channels.add(ctx.channel.id)
         await ctx.send('Gemini Agent is enabled..')
+        await ctx.send('Hi, I am Gemini Agent. How can I help you today?')
     
-    @gemini.command()
+    @gemini.command(extras={"group": "Gemini"})
+    @commands.guild_only()
     async def disable(self,ctx):
-        global Gemini,first_time
-        Gemini=False
-        first_time=True
+        """
+        Disables Gemini from responding to every message in this channel.
+        """
+        query = "DELETE FROM Gemini_Channels WHERE channel_id = %s"
+        await Database.execute_transaction([(query, (ctx.channel.id,))])
+        self.enabled_channels.discard(ctx.channel.id)
         await ctx.send('Gemini Agent is disabled..')
 
-    @commands.command()
+    @gemini.command(extras={"group": "Gemini"})
+    async def stats(self,ctx):
+        """
+        Shows response cache, queue and rate limit statistics.
+        """
+        stats = self.response_cache.get_stats()
+        await ctx.send(
+            f"Response cache: {stats['hits']} hits, {stats['semantic_hits']} similar-question hits, "
+            f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries.\n"
+            f"Saved {stats['api_calls_saved']} Gemini calls, about {stats['saved_ms'] / 1000:.1f}s "
+            f"(average uncached reply {stats['avg_miss_ms']:.0f}ms)."
+        )
+        chats = self.chat_memory.get_stats()
+        await ctx.send(
+            f"DM conversations: {chats['sessions']} active, {chats['expirations']} expired, "
+            f"{chats['evictions']} evicted, {chats['summaries']} summarized."
+        )
+        queue = self.work_queue.get_stats()
+        rejections = self.rate_limiter.get_stats()["rejections"]
+        await ctx.send(
+            f"Queue: {queue['queue_depth']} waiting, {queue['running']} running, {queue['completed']} done, "
+            f"wait avg {queue['wait_avg_ms']:.0f}ms / max {queue['wait_max_ms']:.0f}ms.\n"
+            f"Turned away: {queue['rejected']} (queue full), {rejections['user']} (user limit), "
+            f"{rejections['guild']} (server limit), {rejections['global']} (global limit)."
+        )
+
+    @commands.command(extras={"group": "Gemini"})
     async def pm(self,ctx):
+        """
+        Sends you a private message; Gemini answers whatever you write there and remembers the conversation for a while.
+        """
         dmchannel = await ctx.author.create_dm()
         await dmchannel.send('Hi how can I help you today?')
 
-    def gemini_generate_content(self, content, retries=4, delay=2):
-        attempt = 0
-        while attempt < retries:
+    async def gemini_generate_content(self, content, retries=4, delay=2):
+        """
+        Starts streaming Gemini's answer, retrying with backoff, and returns an async iterator of its
+        text or an error message once every attempt failed. The first chunk is awaited inside the
+        retry loop, so a stream that fails before producing any text is retried too; errors after
+        that are left to send_message_in_chunks, as retrying would repeat text already sent.
+        """
+        # Uses the SDK's async client so a slow or retried call never blocks the event loop.
+        for attempt in range(retries):
             try:
-                response = self.model.generate_content(content, stream=True)
-                return response
+                response = await self.model.generate_content_async(content, stream=True)
+                chunks = response.__aiter__()
+                first = (await chunks.__anext__()).text
+                return self.stream_text(first, chunks)
             except Exception as e:
-                print(f"Attempt {attempt + 1}: error in gemini_generate_content:", e)
-                if attempt < retries - 1:
-                    time.sleep(delay)
-                attempt += 1
-                return PLEASE_TRY_AGAIN_ERROR_MESSAGE + str(e)
-        
+                logging.warning(f"Attempt {attempt + 1}: error in gemini_generate_content: {e}")
+                if attempt == retries - 1:
+                    return PLEASE_TRY_AGAIN_ERROR_MESSAGE + str(e)
+                await asyncio.sleep(delay * 2 ** attempt)
+
+    async def stream_text(self, first, chunks):
+        yield first
+        async for chunk in chunks:
+            yield chunk.text
+
+    async def compact_chat(self, user_id):
+        """
+        Summarizes a DM session that outgrew its token budget. The summary is a Gemini call like any
+        other, so it needs a rate limit token and a queue slot, and runs as its own job so the reply's
+        worker never waits on it. If it is turned away the oldest history is truncated instead.
+        """
+        if self.admit(user_id, None, lambda: self.chat_memory.compact(user_id)) is not None:
+            await self.chat_memory.compact(user_id, summarize=False)
+
+    async def summarize_chat(self, summary, transcript):
+        prompt = (
+            f"Summarize this conversation in under {GEMINI_CHAT_MAX_TOKENS // 8} words, keeping anything "
+            f"the user may refer back to.\n\nEarlier summary: {summary or 'none'}\n\nConversation:\n{transcript}"
+        )
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def embed_content(self, text):
+        result = await genai.embed_content_async(model=GEMINI_EMBEDDING_MODEL, content=text)
+        return result["embedding"]
+
+    async def reply(self, channel, author, guild, prompt, cache=None, on_answer=None):
+        """
+        Answers `prompt` in `channel`. Cached answers are sent straight away; otherwise the call
+        has to pass the per-user / per-guild / global rate limits and fit in the work queue, or the
+        user gets a short "busy" reply instead.
+
+        :param cache: (namespace, question) to look up and store the answer under, or None
+        :param on_answer: awaited with the full answer once it has been sent
+        """
+        lookup = None
+        if cache is not None:
+            lookup = await self.response_cache.lookup(*cache)
+            if lookup.response is not None:
+                await self.send_message_in_chunks(channel, lookup.response)
+                return
+
+        async def job():
+            try:
+                start = perf_counter()
+                response = await self.gemini_generate_content(prompt)
+                text = await self.send_message_in_chunks(channel, response)
+                if isinstance(response, str) or text is None:
+                    return
+                if lookup is not None:
+                    self.response_cache.store(lookup, text, perf_counter() - start)
+                if on_answer is not None:
+                    await on_answer(text)
+            except Exception:
+                await channel.send(SERVER_ERROR_MESSAGE)
+                raise
+
+        refusal = self.admit(author.id, guild.id if guild is not None else None, job)
+        if refusal is not None:
+            await channel.send(refusal)
+
+    def admit(self, user_id, guild_id, job):
+        """
+        Queues a Gemini call if the work queue has room and the rate limits allow it, or returns the
+        message to turn the user away with. The queue is checked first so a call that gets turned
+        away doesn't use up rate limit tokens; nothing awaits in between, so it can't fill up meanwhile.
+        """
+        if self.work_queue.full():
+            self.work_queue.reject()
+            return BUSY_MESSAGE
+        if self.rate_limiter.acquire(user_id, guild_id) is not None:
+            return RATE_LIMITED_MESSAGE
+        if not self.work_queue.submit(job):
+            return BUSY_MESSAGE
+        return None
+
     async def send_message_in_chunks(self,ctx,response):
-        message = ""
-        for chunk in response:
-            message += chunk.text
-            if len(message) > DISCORD_MAX_MESSAGE_LENGTH:
-                extraMessage = message[DISCORD_MAX_MESSAGE_LENGTH:]
-                message = message[:DISCORD_MAX_MESSAGE_LENGTH]
-                await ctx.send(message)
-                message = extraMessage
-        if len(message) > 0:
-            while len(message) > DISCORD_MAX_MESSAGE_LENGTH:
-                extraMessage = message[DISCORD_MAX_MESSAGE_LENGTH:]
-                message = message[:DISCORD_MAX_MESSAGE_LENGTH]
-                await ctx.send(message)
-                message = extraMessage
-            await ctx.send(message)
+        """
+        Sends a complete string or streams a Gemini response, and returns the full text sent, or None
+        if the stream broke off part way (what arrived is kept, followed by STREAM_INTERRUPTED_MESSAGE).
+        """
+        if isinstance(response, str):
+            for start in range(0, len(response), DISCORD_MAX_MESSAGE_LENGTH):
+                await ctx.send(response[start:start + DISCORD_MAX_MESSAGE_LENGTH])
+            return response
+
+        # Stream into one message, editing it at most every STREAM_EDIT_INTERVAL seconds and
+        # continuing in a new message once it is full.
+        loop = asyncio.get_running_loop()
+        message = None
+        full_text = ""
+        text = ""
+        shown = ""
+        last_edit = 0.0
+        interrupted = False
+        try:
+            async for piece in response:
+                full_text += piece
+                text += piece
+                while len(text) > DISCORD_MAX_MESSAGE_LENGTH:
+                    if message is None:
+                        await ctx.send(text[:DISCORD_MAX_MESSAGE_LENGTH])
+                    else:
+                        await message.edit(content=text[:DISCORD_MAX_MESSAGE_LENGTH])
+                    text = text[DISCORD_MAX_MESSAGE_LENGTH:]
+                    message = None
+                    shown = ""
+                if text and text != shown and loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+                    if message is None:
+                        message = await ctx.send(text)
+                    else:
+                        await message.edit(content=text)
+                    shown = text
+                    last_edit = loop.time()
+        except Exception as e:
+            logging.warning(f"Gemini stream failed after {len(full_text)} characters: {e}")
+            interrupted = True
+        if text and text != shown:
+            if message is None:
+                await ctx.send(text)
+            else:
+                await message.edit(content=text)
+        if interrupted:
+            await ctx.send(STREAM_INTERRUPTED_MESSAGE)
+            return None
+        return full_text
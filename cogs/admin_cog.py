@@ -0,0 +1,88 @@
+from datetime import datetime
+from discord.ext import commands
+from discord.ext.commands import command, Bot, Cog, Context  # type: ignore
+from typing import Any, List
+from logging import info, error as err
+
+from database import Database
+from utils.metrics import metrics
+
+# Statements and slow queries listed by $db_stats
+TOP_STATEMENTS = 6
+RECENT_SLOW_QUERIES = 5
+# Characters of SQL shown per statement
+SQL_PREVIEW_LENGTH = 90
+
+
+def preview(query: str) -> str:
+    return query if len(query) <= SQL_PREVIEW_LENGTH else query[:SQL_PREVIEW_LENGTH - 3] + "..."
+
+
+class AdminCog(Cog):
+    """
+    Diagnostics for the bot owner. Its commands are hidden from $help and !help.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        info("AdminCog has been loaded.")
+
+    async def cog_check(self, ctx: Context[Any]) -> bool:  # type: ignore
+        return await self.bot.is_owner(ctx.author)
+
+    async def cog_before_invoke(self, ctx: Context[Any]) -> None:
+        metrics().command_started(ctx)
+
+    async def cog_after_invoke(self, ctx: Context[Any]) -> None:
+        metrics().command_finished(ctx)
+
+    async def cog_command_error(self, ctx: Context[Any], error: Exception) -> None:
+        if isinstance(error, commands.CheckFailure):
+            return
+        err(f"An excpetion occured: {error}", exc_info=True)
+
+    @command(name="db_stats", hidden=True, extras={"group": "Admin"})
+    async def db_stats(self, ctx: Context[Bot], sort: str = "total"):
+        """
+        Shows the slowest database statements and recent slow queries. Owner only.
+        Takes one optional argument: total (default), avg, p99, calls or errors, to sort by.
+        """
+        by = {"total": "total_ms", "avg": "avg_ms", "p99": "p99_ms"}.get(sort, sort)
+        if by not in ("total_ms", "avg_ms", "p99_ms", "calls", "errors"):
+            await ctx.send("Sort by one of: total, avg, p99, calls, errors.")
+            return
+
+        stats = Database.get_stats()
+        backend = stats["backend"]
+        await ctx.send(
+            f"{stats['calls']} queries, {stats['errors']} errors since startup. "
+            f"Backend: {', '.join(f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}' for key, value in backend.items())}"
+        )
+
+        lines: List[str] = []
+        for query, statement in Database.query_stats.top(TOP_STATEMENTS, by):
+            lines.append(preview(query))
+            lines.append(
+                f"  {statement['calls']} calls, {statement['errors']} errors, {statement['rows']} rows, "
+                f"avg {statement['avg_ms']:.1f}ms, p50 {statement['p50_ms']:.1f}ms, "
+                f"p99 {statement['p99_ms']:.1f}ms, max {statement['max_ms']:.1f}ms"
+            )
+        if lines:
+            await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+        slow = stats["slow_queries"][-RECENT_SLOW_QUERIES:]
+        if slow:
+            lines = [
+                f"{datetime.fromtimestamp(entry['time']):%H:%M:%S} {entry['elapsed_ms']:.0f}ms "
+                f"{'FAILED ' if entry['failed'] else ''}{preview(entry['query'])} {str(entry['args'])[:SQL_PREVIEW_LENGTH]}"
+                for entry in slow
+            ]
+            await ctx.send("Recent slow queries:\n```\n" + "\n".join(lines) + "\n```")
+
+    @command(name="db_stats_reset", hidden=True, extras={"group": "Admin"})
+    async def db_stats_reset(self, ctx: Context[Bot]):
+        """
+        Clears the database query statistics and slow query log. Owner only.
+        """
+        Database.query_stats.reset()
+        await ctx.send("Database statistics cleared.")
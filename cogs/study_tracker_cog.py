@@ -1,27 +1,54 @@
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ext.commands import command, Bot, Cog, Context  # type: ignore
 from discord import Embed
 from typing import Any
 from logging import info, error as err
 from database.database import Database
 from utils.context_manager import ctx_mgr
+from utils.session import sessions
+from utils.metrics import metrics
+from modules.user import NotRegistered, registered_only, registered_users
 
-current_task_id=None
 class StudyTrackerCog(Cog):
     
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.task_reminder.start()
+        self.reminder_scheduler = None
         info("StudyTrackerCog has been loaded.")
 
+    async def cog_load(self) -> None:
+        from modules.reminders import ReminderScheduler
+        from modules.time_table import schedule_index
+
+        await registered_users().warm()
+
+        self.reminder_scheduler = ReminderScheduler(self.bot, schedule_index())
+        self.reminder_scheduler.start()
+
+    async def cog_unload(self) -> None:
+        if self.reminder_scheduler is not None:
+            self.reminder_scheduler.stop()
+
+    async def cog_before_invoke(self, ctx: Context[Any]) -> None:
+        metrics().command_started(ctx)
+
+    async def cog_after_invoke(self, ctx: Context[Any]) -> None:
+        metrics().command_finished(ctx)
+
     async def cog_command_error(self, ctx: Context[Any], error: Exception) -> None:
+        if isinstance(error, NotRegistered):
+            await ctx.send("User not found. Please register first.")
+            return
         if isinstance(error, commands.CheckFailure):
             return
         err(f"An excpetion occured: {error}", exc_info=True)
         # await ctx.reply(f"ERROR: {type(error)} {error}")
     
-    @command(name="ping")
+    @command(name="ping", extras={"group": "General"})
     async def ping(self, ctx: Context[Bot]):
+        """
+        Replies with 'Pong!' and alternates a few ping/pong messages.
+        """
         ctx_mgr().set_init_context(ctx)
         
         from asyncio import sleep
@@ -36,110 +63,134 @@ class StudyTrackerCog(Cog):
         embed3 = BaseEmbed(title="Ping!")
         await send_message(content="Pong!", embed=embed3)
     
-    @command(name="register")
+    @command(name="register", extras={"group": "Profile"})
     async def register(self, ctx: Context[Bot], *args: str):
+        """
+        Registers you as a user. Takes your name, e.g. `$register John Doe`.
+        """
         from modules.user import register_user
 
         ctx_mgr().set_init_context(ctx)
         await register_user(*args)
     
-    @command(name="set_institution")
+    @command(name="set_institution", extras={"group": "Profile"})
+    @registered_only()
     async def set_institution(self, ctx: Context[Bot], *args: str):
+        """
+        Sets your institution. Takes the name of the institution.
+        """
         from modules.user import set_institution
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await set_institution(*args)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await set_institution(*args)
     
-    @command(name="set_time_zone")
+    @command(name="set_time_zone", extras={"group": "Profile"})
+    @registered_only()
     async def set_time_zone(self, ctx: Context[Bot], time_zone: str):
+        """
+        Sets your time zone as an offset from UTC, in hours (e.g. -5) or minutes (e.g. 330 for +5:30).
+        Time table alerts fire at your local time.
+        """
         from modules.user import set_time_zone
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await set_time_zone(time_zone)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await set_time_zone(time_zone)
     
-    @command(name="set_dob")
+    @command(name="set_dob", extras={"group": "Profile"})
+    @registered_only()
     async def set_dob(self, ctx: Context[Bot], *args: str):
+        """
+        Sets your date of birth. Takes the date in the format DD MM YYYY.
+        """
         from modules.user import set_dob
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await set_dob(*args)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await set_dob(*args)
        
 
-    @command(name="add_flashcard")
+    @command(name="add_flashcard", extras={"group": "Flashcards"})
+    @registered_only()
     async def add_flashcard(self, ctx: Context[Bot]):
+        """
+        Adds a new flashcard. The question, answer and options follow on new lines:
+        # Q: <question>
+        ## A: <answer>
+        - <option1>
+        - <option2>
+        - <option3>
+        Give at least 2 options. An image can be attached.
+        """
         from modules.flashcards import add_flashcard
         
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await add_flashcard()
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await add_flashcard()
     
-    @command(name="list_flashcards")
+    @command(name="list_flashcards", extras={"group": "Flashcards"})
     async def list_flashcards(self, ctx: Context[Bot]):
+        """
+        Lists all your flashcards.
+        """
         from modules.flashcards import list_flashcards
         
         ctx_mgr().set_init_context(ctx)
         await list_flashcards()
     
-    @command(name="flashcard_flash")
+    @command(name="flashcard_flash", extras={"group": "Flashcards"})
     async def flashcard_flash(self, ctx: Context[Bot], card_id: str):
+        """
+        Shows a flashcard by ID so you can answer it. Takes one argument: card_id.
+        """
         from modules.flashcards import flashcard_flash
         
         ctx_mgr().set_init_context(ctx)
         await flashcard_flash(card_id)
 
-    @command(name="flashcard_create_set")
+    @command(name="flashcard_create_set", extras={"group": "Flashcards"})
+    @registered_only()
     async def flashcard_create(self, ctx: Context[Bot], set_name: str):
+        """
+        Creates a new flashcard set. Takes one argument: set_name.
+        """
         from modules.flashcards import flashcard_create_set
-        try:
-            ctx_mgr().set_init_context(ctx)
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await flashcard_create_set(set_name)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        ctx_mgr().set_init_context(ctx)
+        await flashcard_create_set(set_name)
     
-    @command(name="flashcard_add_to_set")
+    @command(name="flashcard_add_to_set", extras={"group": "Flashcards"})
     async def flashcard_add_to_set(self, ctx: Context[Bot], set_id: str, card_id: str):
+        """
+        Adds a flashcard to a set. Takes two arguments: set_id, card_id.
+        """
         from modules.flashcards import flashcard_add_to_set
 
         ctx_mgr().set_init_context(ctx)
         await flashcard_add_to_set(set_id, card_id)
 
-    @command(name="flashcard_remove_from_set")
+    @command(name="flashcard_remove_from_set", extras={"group": "Flashcards"})
     async def flashcard_remove_from_set(self, ctx: Context[Bot], set_id: str, card_id: str):
+        """
+        Removes a flashcard from a set. Takes two arguments: set_id, card_id.
+        """
         from modules.flashcards import flashcard_remove_from_set
 
         ctx_mgr().set_init_context(ctx)
         await flashcard_remove_from_set(set_id, card_id)
     
-    @command(name="flashcard_review_set")
+    @command(name="flashcard_review_set", extras={"group": "Flashcards"})
     async def flashcard_review_set(self, ctx: Context[Bot], set_id: str):
+        """
+        Reviews every flashcard in a set. Takes one argument: set_id.
+        """
         from modules.flashcards import flashcard_review_set
 
         ctx_mgr().set_init_context(ctx)
         await flashcard_review_set(set_id)
     
-    @command(name="add_task")
+    @command(name="add_task", extras={"group": "Tasks"})
+    @registered_only()
     async def add_task(self, ctx: Context[Bot],*,name=""):
+        """
+        Adds a new task. Takes the task name.
+        """
         if name.strip() == "":
             await ctx.send("Please provide a task name")
             return
@@ -148,194 +199,254 @@ class StudyTrackerCog(Cog):
         await add_task(name=name)
 
         
-    @command(name="set_task")
+    @command(name="set_task", extras={"group": "Tasks"})
     async def set_current_task(self, ctx: Context[Bot],*,name: str):
-        query=("SELECT task_id FROM Tasks WHERE name=%s")
-        id=Database.fetch_one(query,name)
-        global current_task_id
-        current_task_id=id
-        await ctx.send(f"Current task set to name: {name}, id: {current_task_id}")
+        """
+        Sets the current task by name. Takes the task name.
+        """
+        try:
+            query=("SELECT task_id FROM Tasks WHERE name=%s AND user_id=%s")
+            id=(await Database.fetch_one(query,name,ctx.author.id))[0]
+        except ValueError:
+            await ctx.send("Task not found")
+            return
+        await sessions().set(ctx.author.id, "current_task_id", id)
+        await ctx.send(f"Current task set to name: {name}, id: {id}")
 
-    @command(name="set_task_by_id")
+    @command(name="set_task_by_id", extras={"group": "Tasks"})
     async def settask(self, ctx: Context[Bot], *, id):
-        query=("SELECT name FROM Tasks WHERE task_id=%s")
-        name=Database.fetch_one(query,id)
-        global current_task_id
-        current_task_id = id
-        await ctx.send(f"Current task set to name: {name}, id: {current_task_id}")
+        """
+        Sets the current task by ID (task number). Takes one argument: id.
+        """
+        try:
+            query=("SELECT task_id, name FROM Tasks WHERE task_id=%s AND user_id=%s")
+            id, name = await Database.fetch_one(query,id,ctx.author.id)
+        except ValueError:
+            await ctx.send("Task not found")
+            return
+        await sessions().set(ctx.author.id, "current_task_id", id)
+        await ctx.send(f"Current task set to name: {name}, id: {id}")
      
 
-    @command(name="add_description")
+    @command(name="add_description", extras={"group": "Tasks"})
     async def add_description(self, ctx: Context[Bot],*, description: str):
+        """
+        Adds a description to the current task. Takes the description.
+        """
         from modules.tasks import add_description
-        id=current_task_id
+        id=await sessions().get(ctx.author.id, "current_task_id")
         if(id==None):
             await ctx.send("Please set the  task.")
             await ctx.send("Use set_task <task_name> or set_task_by_id <task_id>")
+            return
         ctx_mgr().set_init_context(ctx)
         await add_description(id, description)
 
-    @command(name="list_tasks")
+    @command(name="list_tasks", extras={"group": "Tasks"})
     async def list_tasks(self, ctx: Context[Bot]):
+        """
+        Lists all your tasks.
+        """
         from modules.tasks import list_tasks
         
         ctx_mgr().set_init_context(ctx)
         await list_tasks()
     
-    @command(name="remove_task")
+    @command(name="remove_task", extras={"group": "Tasks"})
     async def remove_task(self, ctx: Context[Bot],*,name: str):
+        """
+        Removes a task by name. Takes the task name.
+        """
         from modules.tasks import remove_task
-        try:
-            query=("SELECT task_id FROM Tasks WHERE name=%s")
-            id=Database.fetch_one(query,name)
-            ctx_mgr().set_init_context(ctx)
-            await remove_task(id)
-        except Exception as e:
-            await ctx.send("Task not found")
+
+        ctx_mgr().set_init_context(ctx)
+        await remove_task(name=name)
             
 
-    @command(name="delete_task")
+    @command(name="delete_task", extras={"group": "Tasks"})
     async def delete_task(self, ctx: Context[Bot],*,id):
+        """
+        Deletes a task by ID (task number). Takes one argument: id.
+        """
         from modules.tasks import remove_task
 
         ctx_mgr().set_init_context(ctx)
         await remove_task(id)
 
-    @command(name="mark_as_done")
+    @command(name="mark_as_done", extras={"group": "Tasks"})
     async def mark_as_done(self, ctx: Context[Bot],*,name: str):
+        """
+        Marks a task as done by name. Takes the task name.
+        """
         from modules.tasks import mark_as_done
-        try:
-            query=("SELECT task_id FROM Tasks WHERE name=%s")
-            id=Database.fetch_one(query,name)
-            ctx_mgr().set_init_context(ctx)
-            await mark_as_done(id)
-        except Exception as e:
-            await ctx.send("Task not found")
+
+        ctx_mgr().set_init_context(ctx)
+        await mark_as_done(name=name)
 
 
-    @command(name="mark_as_started")
+    @command(name="mark_as_started", extras={"group": "Tasks"})
     async def mark_as_started(self, ctx: Context[Bot],*,name: str):
+        """
+        Marks a task as started by name. Takes the task name.
+        """
         from modules.tasks import mark_as_started
-        try:
-            query=("SELECT task_id FROM Tasks WHERE name=%s")
-            id=Database.fetch_one(query,name)
-            ctx_mgr().set_init_context(ctx)
-            await mark_as_started(id)    
-        except Exception as e:
-            await ctx.send("Task not found")
-            return
+
+        ctx_mgr().set_init_context(ctx)
+        await mark_as_started(name=name)
 
 
-    @command(name="mark_as_started_by_id")
+    @command(name="mark_as_started_by_id", extras={"group": "Tasks"})
     async def mark_as_started_by_id(self, ctx: Context[Bot],*,id: str):
+        """
+        Marks a task as started by ID. Takes one argument: id.
+        """
         from modules.tasks import mark_as_started
         
         ctx_mgr().set_init_context(ctx)
         await mark_as_started(id)
     
-    @command(name="mark_as_done_by_id")
+    @command(name="mark_as_done_by_id", extras={"group": "Tasks"})
     async def mark_as_done_by_id(self, ctx: Context[Bot],*,id: str):
+        """
+        Marks a task as done by ID. Takes one argument: id.
+        """
         from modules.tasks import mark_as_done
         
         ctx_mgr().set_init_context(ctx)
         await mark_as_done(id)
 
-    @command(name="set_due_date")
+    @command(name="set_due_date", extras={"group": "Tasks"})
     async def set_due_date(self, ctx: Context[Bot],*,due_date: str):
+        """
+        Sets the due date of the current task. Takes a date such as YYYY-MM-DD HH:MM:SS.
+        """
         from modules.tasks import set_due_date
-        id=current_task_id
+        id=await sessions().get(ctx.author.id, "current_task_id")
         if(id==None):
             await ctx.send("Please set the  task.")
             await ctx.send("Use set_task <task_name> or set_task_by_id <task_id>")
+            return
         ctx_mgr().set_init_context(ctx)
         await set_due_date(id, due_date)
     
-    @command(name="add_song")
+    @command(name="add_song", extras={"group": "Music"})
+    @registered_only()
     async def add_song(self, ctx: Context[Bot], *args: str):
+        """
+        Adds a song. Takes 'Song Name by Artist', e.g. `$add_song despacito by justin bieber`,
+        with the audio file (mp3) attached.
+        """
         from modules.songs import add_song
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await add_song(*args)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await add_song(*args)
     
-    @command(name="get_song")
+    @command(name="get_song", extras={"group": "Music"})
     async def get_song(self, ctx: Context[Bot], song_id: str):
+        """
+        Sends a song by ID. Takes one argument: song_id.
+        """
         from modules.songs import get_song
 
         ctx_mgr().set_init_context(ctx)
         await get_song(song_id)
     
-    @command(name="create_playlist")
+    @command(name="create_playlist", extras={"group": "Music"})
+    @registered_only()
     async def create_playlist(self, ctx: Context[Bot], *args: str):
+        """
+        Creates a new playlist. Takes the playlist name.
+        """
         from modules.songs import create_playlist
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await create_playlist(*args)
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await create_playlist(*args)
     
-    @command(name="get_playlist")
+    @command(name="get_playlist", extras={"group": "Music"})
     async def get_playlist(self, ctx: Context[Bot], playlist_id: str):
+        """
+        Shows a playlist by ID. Takes one argument: playlist_id.
+        """
         from modules.songs import get_playlist
 
         ctx_mgr().set_init_context(ctx)
         await get_playlist(playlist_id)
 
-    @command(name="add_song_to_playlist")
+    @command(name="add_song_to_playlist", extras={"group": "Music"})
     async def add_song_to_playlist(self, ctx: Context[Bot], playlist_id: str, song_id: str):
+        """
+        Adds a song to a playlist. Takes two arguments: playlist_id, song_id.
+        """
         from modules.songs import add_song_to_playlist
 
         ctx_mgr().set_init_context(ctx)
         await add_song_to_playlist(playlist_id, song_id)
     
-    @command(name="remove_song_from_playlist")
+    @command(name="remove_song_from_playlist", extras={"group": "Music"})
     async def remove_song_from_playlist(self, ctx: Context[Bot], playlist_id: str, song_id: str):
+        """
+        Removes a song from a playlist. Takes two arguments: playlist_id, song_id.
+        """
         from modules.songs import remove_song_from_playlist
 
         ctx_mgr().set_init_context(ctx)
         await remove_song_from_playlist(playlist_id, song_id)
 
-    @command(name="play_playlist")
+    @command(name="play_playlist", extras={"group": "Music"})
     async def play_playlist(self, ctx: Context[Bot], playlist_id: str):
+        """
+        Plays a playlist by ID. Takes one argument: playlist_id.
+        """
         from modules.songs import play_playlist
 
         ctx_mgr().set_init_context(ctx)
         await play_playlist(playlist_id)
     
-    @command(name="create_time_table_entry")
+    @command(name="create_time_table_entry", extras={"group": "Time Table"})
+    @registered_only()
     async def create_time_table_entry(self, ctx: Context[Bot]):
+        """
+        Adds a time table entry; you get a reminder at its time on each of its days. The details follow on new lines:
+        # name: <name>
+        ## time: <HH:MM>
+        ## days: <days, first three letters capitalised, e.g. Mon Wed Fri>
+        ## duration: <minutes>
+        - description: <description>
+        """
         from modules.time_table import create_time_table_entry
 
         ctx_mgr().set_init_context(ctx)
-        try:
-            query = ("SELECT user_id FROM Users WHERE user_id=%s")
-            Database.fetch_one(query, ctx_mgr().get_context_user_id())
-            await create_time_table_entry()
-        except Exception as e:
-            await ctx.send("User not found. Please register first.")
+        await create_time_table_entry()
     
-    @command(name="delete_time_table_entry")
+    @command(name="delete_time_table_entry", extras={"group": "Time Table"})
     async def delete_time_table_entry(self, ctx: Context[Bot], entry_id: str):
+        """
+        Deletes a time table entry. Takes one argument: tt_id.
+        """
         from modules.time_table import delete_time_table_entry
 
         ctx_mgr().set_init_context(ctx)
         await delete_time_table_entry(entry_id)
     
-    @tasks.loop(seconds=60)
-    async def task_reminder(self):
-        from modules.time_table import send_alert
+    @Cog.listener()
+    async def on_ready(self):
+        from modules.time_table import schedule_index
+
+        # on_ready also fires after the bot reconnects; pick up changes made while it was away.
+        # The rebuild also makes the reminder scheduler replay the minutes it may have missed.
+        await schedule_index().rebuild()
+
+    @Cog.listener()
+    async def on_resumed(self):
+        from modules.time_table import schedule_index
 
-        await send_alert(self.bot)
+        await schedule_index().rebuild()
 
-    @command(name="help1")
+    @command(name="help1", extras={"group": "General"})
     async def help1_command(self, ctx: Context[Bot]):
+        """
+        Lists the study tracker commands.
+        """
         embed = Embed(title="Study Tracker Commands", description="List of available commands and their usage", color=0x00ff00)
 
         commands_info = {
@@ -367,8 +478,11 @@ class StudyTrackerCog(Cog):
 
         await ctx.send(embed=embed)
     
-    @command(name="help2")
+    @command(name="help2", extras={"group": "General"})
     async def help2_command(self, ctx: Context[Bot]):
+        """
+        Lists the music, time table and Gemini commands.
+        """
         embed = Embed(title="Study Tracker Commands", description="List of available commands and their usage", color=0x00ff00)
 
         commands_info = {
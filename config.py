@@ -5,10 +5,67 @@ load_dotenv()
 
 DISCORD_API_TOKEN = getenv("DISCORD_API_TOKEN")
 ADMIN_CHANNEL_ID = int(getenv("ADMIN_CHANNEL_ID") or 0)
+ALERT_CHANNEL_ID = int(getenv("ALERT_CHANNEL_ID") or 1282659377437999185)
 
 DB_URL = getenv("DB_URL")
 DB_PORT = getenv("DB_PORT")
 DB_NAME = getenv("DB_NAME")
 DB_USER = getenv("DB_USER")
 DB_PASS = getenv("DB_PASS")
-Gemini_API_Key = getenv("Gemini_API_Key")
\ No newline at end of file
+# "pool" uses an asyncio connection pool, "executor" runs blocking queries on worker threads
+DB_MODE = getenv("DB_MODE") or "pool"
+DB_POOL_MIN_SIZE = int(getenv("DB_POOL_MIN_SIZE") or 2)
+DB_POOL_MAX_SIZE = int(getenv("DB_POOL_MAX_SIZE") or 10)
+DB_EXECUTOR_WORKERS = int(getenv("DB_EXECUTOR_WORKERS") or 4)
+DB_EXECUTOR_MAX_QUEUE = int(getenv("DB_EXECUTOR_MAX_QUEUE") or 64)
+# Queries slower than this many milliseconds are logged with their arguments (0 disables),
+# and the latest DB_SLOW_QUERY_LOG_SIZE of them are kept for $db_stats
+DB_SLOW_QUERY_MS = int(getenv("DB_SLOW_QUERY_MS") or 200)
+DB_SLOW_QUERY_LOG_SIZE = int(getenv("DB_SLOW_QUERY_LOG_SIZE") or 50)
+Gemini_API_Key = getenv("Gemini_API_Key")
+# Answers to !help and $query are reused for this long
+GEMINI_CACHE_TTL = int(getenv("GEMINI_CACHE_TTL") or 3600)
+GEMINI_CACHE_MAX_ITEMS = int(getenv("GEMINI_CACHE_MAX_ITEMS") or 512)
+# Cosine similarity at which a rephrased question reuses a cached answer; 0 disables the embedding lookup
+GEMINI_SEMANTIC_CACHE_THRESHOLD = float(getenv("GEMINI_SEMANTIC_CACHE_THRESHOLD") or 0)
+GEMINI_EMBEDDING_MODEL = getenv("GEMINI_EMBEDDING_MODEL") or "models/text-embedding-004"
+# Approximate token budget of the command reference sent with each !help question
+GEMINI_HELP_TOKEN_BUDGET = int(getenv("GEMINI_HELP_TOKEN_BUDGET") or 600)
+# Gemini requests allowed per minute, each also the allowed burst
+GEMINI_USER_PER_MINUTE = int(getenv("GEMINI_USER_PER_MINUTE") or 5)
+GEMINI_GUILD_PER_MINUTE = int(getenv("GEMINI_GUILD_PER_MINUTE") or 30)
+GEMINI_GLOBAL_PER_MINUTE = int(getenv("GEMINI_GLOBAL_PER_MINUTE") or 60)
+# Gemini calls in flight at once, and how many more may wait before new ones are turned away
+GEMINI_WORKERS = int(getenv("GEMINI_WORKERS") or 4)
+GEMINI_QUEUE_SIZE = int(getenv("GEMINI_QUEUE_SIZE") or 32)
+# DM conversations: idle seconds before one is forgotten, how many are kept, and the approximate
+# tokens of history sent along before older turns are summarized
+GEMINI_CHAT_TTL = int(getenv("GEMINI_CHAT_TTL") or 1800)
+GEMINI_CHAT_MAX_SESSIONS = int(getenv("GEMINI_CHAT_MAX_SESSIONS") or 1000)
+GEMINI_CHAT_MAX_TOKENS = int(getenv("GEMINI_CHAT_MAX_TOKENS") or 2000)
+
+# Song audio lives outside Postgres: "local" (filesystem) or "s3" (any S3-compatible endpoint)
+BLOB_STORE = getenv("BLOB_STORE") or "local"
+BLOB_STORE_PATH = getenv("BLOB_STORE_PATH") or "blobs"
+S3_BUCKET = getenv("S3_BUCKET")
+S3_ENDPOINT_URL = getenv("S3_ENDPOINT_URL")
+S3_ACCESS_KEY = getenv("S3_ACCESS_KEY")
+S3_SECRET_KEY = getenv("S3_SECRET_KEY")
+SONG_CACHE_MAX_BYTES = int(getenv("SONG_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+
+FLASHCARD_IMAGE_CACHE_MAX_BYTES = int(getenv("FLASHCARD_IMAGE_CACHE_MAX_BYTES") or 32 * 1024 * 1024)
+# Uploaded flashcard images are downscaled so neither side exceeds this many pixels
+FLASHCARD_IMAGE_MAX_SIZE = int(getenv("FLASHCARD_IMAGE_MAX_SIZE") or 1024)
+# $list_flashcards keeps this many cards in memory at a time
+FLASHCARD_PAGE_WINDOW = int(getenv("FLASHCARD_PAGE_WINDOW") or 25)
+# Time table alert messages in flight at once, across all channels
+ALERT_SEND_CONCURRENCY = int(getenv("ALERT_SEND_CONCURRENCY") or 20)
+# Per-user session state (e.g. the current task): idle seconds it is kept, users kept in memory,
+# and whether it is also saved to the database so it survives restarts
+SESSION_TTL = int(getenv("SESSION_TTL") or 12 * 60 * 60)
+SESSION_MAX_USERS = int(getenv("SESSION_MAX_USERS") or 10000)
+SESSION_PERSIST = (getenv("SESSION_PERSIST") or "1") == "1"
+# Reminders missed while the bot was down are still sent if at most this many minutes late
+REMINDER_CATCHUP_MINUTES = int(getenv("REMINDER_CATCHUP_MINUTES") or 30)
+# Port for the Prometheus /metrics endpoint (needs prometheus_client), 0 disables it
+METRICS_PORT = int(getenv("METRICS_PORT") or 0)
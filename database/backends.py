@@ -0,0 +1,210 @@
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from asyncio import Semaphore, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from threading import local, Lock
+from time import perf_counter
+from logging import info, warning
+from typing import Any, Callable, Dict, List, Optional, Protocol, Set, Tuple
+
+from config import DB_URL, DB_PORT, DB_NAME, DB_USER, DB_PASS
+
+Row = Tuple[Any, ...]
+Statement = Tuple[str, Tuple[Any, ...]]
+
+
+def connection_kwargs() -> Dict[str, Any]:
+    return {
+        "host": DB_URL,
+        "port": DB_PORT,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASS,
+    }
+
+
+class Backend(Protocol):
+    async def open(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def execute(self, query: str, args: Tuple[Any, ...]) -> int: ...
+
+    async def fetch_many(self, query: str, args: Tuple[Any, ...]) -> List[Row]: ...
+
+    async def fetch_one(self, query: str, args: Tuple[Any, ...]) -> Optional[Row]: ...
+
+    async def run_transaction(self, statements: List[Statement]) -> List[Row]: ...
+
+    def get_stats(self) -> Dict[str, Any]: ...
+
+
+class PoolBackend:
+    """
+    asyncio-native backend: every call borrows a connection from a psycopg AsyncConnectionPool.
+    The pool commits when the connection is returned and discards broken connections.
+    """
+
+    def __init__(self, min_size: int, max_size: int):
+        self.pool = AsyncConnectionPool(
+            kwargs=connection_kwargs(),
+            min_size=min_size,
+            max_size=max_size,
+            open=False,
+        )
+
+    async def open(self):
+        await self.pool.open(wait=True)
+        info(f"DATABASE: Connection pool established (min: {self.pool.min_size}, max: {self.pool.max_size})")
+
+    async def close(self):
+        await self.pool.close()
+        info("DATABASE: Connection pool terminated")
+
+    async def execute(self, query: str, args: Tuple[Any, ...]) -> int:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, args)
+            return cur.rowcount
+
+    async def fetch_many(self, query: str, args: Tuple[Any, ...]) -> List[Row]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, args)
+            return await cur.fetchall()
+
+    async def fetch_one(self, query: str, args: Tuple[Any, ...]) -> Optional[Row]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, args)
+            return await cur.fetchone()
+
+    async def run_transaction(self, statements: List[Statement]) -> List[Row]:
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    for query, args in statements:
+                        await cur.execute(query, args)
+                    return await cur.fetchall() if cur.description else []
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"mode": "pool"}
+        stats.update(self.pool.get_stats())
+        return stats
+
+
+class ExecutorBackend:
+    """
+    Runs blocking psycopg calls on a dedicated, bounded ThreadPoolExecutor with one connection per
+    worker thread, so slow queries never stall the event loop (and the gateway heartbeat).
+
+    At most `workers + max_queue` calls are admitted at once; further callers wait on a semaphore.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="database")
+        self.slots = Semaphore(workers + max_queue)
+
+        self._local = local()
+        self._connections: List[psycopg.Connection[Any]] = []
+        self._lock = Lock()
+
+        # One token per call that hasn't reached a worker yet; removed by whichever of the worker or
+        # the (possibly cancelled) caller gets there first, so cancellations can't leak.
+        self._waiting: Set[object] = set()
+        self._running = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def open(self):
+        info(f"DATABASE: Executor mode with {self.workers} worker connections")
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        info("DATABASE: Executor connections terminated")
+
+    def _get_connection(self) -> "psycopg.Connection[Any]":
+        conn: Optional[psycopg.Connection[Any]] = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = psycopg.connect(**connection_kwargs())
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self, conn: "psycopg.Connection[Any]"):
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def _call(self, token: object, submitted: float, statements: List[Statement], fn: Callable[..., Any]) -> Any:
+        wait = perf_counter() - submitted
+        with self._lock:
+            self._waiting.discard(token)
+            self._running += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+        try:
+            conn = self._get_connection()
+            try:
+                with conn.cursor() as cur:
+                    for query, args in statements:
+                        cur.execute(query, args)
+                    result = fn(cur)
+                conn.commit()
+                return result
+            except Exception:
+                if conn.broken:
+                    warning("DATABASE: Dropping broken worker connection")
+                    self._drop_connection(conn)
+                else:
+                    conn.rollback()
+                raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    async def _run(self, statements: List[Statement], fn: Callable[..., Any]) -> Any:
+        token, submitted = object(), perf_counter()
+        with self._lock:
+            self._waiting.add(token)
+        try:
+            async with self.slots:
+                loop = get_running_loop()
+                return await loop.run_in_executor(self.executor, self._call, token, submitted, statements, fn)
+        finally:
+            with self._lock:
+                self._waiting.discard(token)
+
+    async def execute(self, query: str, args: Tuple[Any, ...]) -> int:
+        return await self._run([(query, args)], lambda cur: cur.rowcount)
+
+    async def fetch_many(self, query: str, args: Tuple[Any, ...]) -> List[Row]:
+        return await self._run([(query, args)], lambda cur: cur.fetchall())
+
+    async def fetch_one(self, query: str, args: Tuple[Any, ...]) -> Optional[Row]:
+        return await self._run([(query, args)], lambda cur: cur.fetchone())
+
+    async def run_transaction(self, statements: List[Statement]) -> List[Row]:
+        return await self._run(statements, lambda cur: cur.fetchall() if cur.description else [])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "mode": "executor",
+                "workers": self.workers,
+                "connections": len(self._connections),
+                "queue_depth": len(self._waiting),
+                "running": self._running,
+                "completed": self._completed,
+                "wait_avg_ms": 1000 * self._wait_total / started if started else 0.0,
+                "wait_max_ms": 1000 * self._wait_max,
+            }
@@ -1,71 +1,92 @@
-import psycopg2
-from psycopg2._psycopg import connection
-from logging import info, error
-from typing import Any, List, Optional, Tuple
+from logging import error
+from typing import Any, Dict, List, Optional, Tuple
 
-from config import DB_URL, DB_PORT, DB_NAME, DB_USER, DB_PASS
+from config import DB_MODE, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_EXECUTOR_WORKERS, DB_EXECUTOR_MAX_QUEUE
+from config import DB_SLOW_QUERY_MS, DB_SLOW_QUERY_LOG_SIZE
+from .backends import Backend, PoolBackend, ExecutorBackend, Statement
+from .instrumentation import QueryStats, redact
 
 
 class Database:
 
-    conn: Optional[connection] = None
+    backend: Optional[Backend] = None
+    query_stats = QueryStats(slow_ms=DB_SLOW_QUERY_MS, slow_log_size=DB_SLOW_QUERY_LOG_SIZE)
 
     @staticmethod
-    def establish_connection():
-        Database.conn = psycopg2.connect(
-            host=DB_URL,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-        )
-        info("DATABASE: Connection established")
+    async def establish_connection():
+        if DB_MODE == "pool":
+            Database.backend = PoolBackend(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+        elif DB_MODE == "executor":
+            Database.backend = ExecutorBackend(DB_EXECUTOR_WORKERS, DB_EXECUTOR_MAX_QUEUE)
+        else:
+            raise ValueError(f"Invalid DB_MODE: `{DB_MODE}`, expected `pool` or `executor`.")
+        await Database.backend.open()
 
     @staticmethod
-    def terminate_connection():
-        assert Database.conn is not None
-        Database.conn.close()
-        info("DATABASE: Connection terminated")
+    async def terminate_connection():
+        await Database.get_backend().close()
 
     @staticmethod
-    def get_connection():
-        assert Database.conn is not None
-        return Database.conn
+    def get_backend() -> Backend:
+        assert Database.backend is not None
+        return Database.backend
 
     @staticmethod
-    def get_cursor():
-        return Database.get_connection().cursor()
-    
+    def get_backend_stats() -> Dict[str, Any]:
+        """
+        Connection pool / executor statistics, e.g. queue depth and wait times.
+        """
+        return Database.get_backend().get_stats()
+
     @staticmethod
-    def commit():
-        conn = Database.get_connection()
-        conn.commit()
+    def get_stats() -> Dict[str, Any]:
+        """
+        Per-statement query statistics (latency histogram, rows, errors) keyed by normalized SQL,
+        the recent slow queries, and the backend statistics.
+        """
+        stats = Database.query_stats.get_stats()
+        stats["backend"] = Database.get_backend_stats() if Database.backend is not None else {}
+        return stats
 
     @staticmethod
-    def execute_query(query: str, *args: Any):
+    async def execute_query(query: str, *args: Any):
         try:
-            with Database.get_cursor() as cur:
-                cur.execute(query, args)
-            Database.commit()
+            with Database.query_stats.measure(query, args) as measurement:
+                measurement.rows = await Database.get_backend().execute(query, args)
         except Exception as exc:
-            Database.establish_connection()
-            error(f"exc: {exc}\nquery: {query}\nargs: {args}", exc_info=True)
+            error(f"exc: {exc}\nquery: {query}\nargs: {redact(args)}", exc_info=True)
 
     @staticmethod
-    def fetch_many(query: str, *args: Any) -> List[Tuple[Any, ...]]:
-        with Database.get_cursor() as cur:
-            cur.execute(query, args)
-            result = cur.fetchall()
-            return result
+    async def fetch_many(query: str, *args: Any) -> List[Tuple[Any, ...]]:
+        with Database.query_stats.measure(query, args) as measurement:
+            result = await Database.get_backend().fetch_many(query, args)
+            measurement.rows = len(result)
+        return result
 
     @staticmethod
-    def fetch_one(query: str, *args: Any) -> Tuple[Any, ...]:
+    async def fetch_one(query: str, *args: Any) -> Tuple[Any, ...]:
         """
         :raises ValueError: if no result is found
         """
-        with Database.get_cursor() as cur:
-            cur.execute(query, args)
-            result = cur.fetchone()
-            if result is None:
-                raise ValueError("No result found")
-            return result
+        with Database.query_stats.measure(query, args) as measurement:
+            result = await Database.get_backend().fetch_one(query, args)
+            measurement.rows = int(result is not None)
+        if result is None:
+            raise ValueError("No result found")
+        return result
+
+    @staticmethod
+    async def execute_transaction(statements: List[Statement]) -> List[Tuple[Any, ...]]:
+        """
+        Runs `(query, args)` statements on one connection in a single transaction, rolling back if any fails.
+        Returns the rows of the last statement (empty if it returns none).
+
+        :raises Exception: whatever the failing statement raised
+        """
+        # Timed as a whole, under the key of all its statements together.
+        query = "; ".join(query for query, _ in statements)
+        args = [arg for _, statement_args in statements for arg in statement_args]
+        with Database.query_stats.measure(query, args) as measurement:
+            result = await Database.get_backend().run_transaction(statements)
+            measurement.rows = len(result)
+        return result
@@ -0,0 +1,148 @@
+from bisect import bisect_left
+from collections import deque
+from logging import warning
+from re import sub
+from time import perf_counter, time
+from typing import Any, Deque, Dict, List, Sequence, Tuple
+
+from utils.metrics import metrics
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket catches everything slower.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Longest argument kept in the slow query log
+MAX_ARG_LENGTH = 200
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Collapses whitespace and replaces inline literals with `?`, so the same statement
+    always lands under the same key however it was formatted.
+    """
+    query = sub(r"'(?:[^']|'')*'", "?", query)
+    query = sub(r"\b\d+\b", "?", query)
+    return " ".join(query.split())
+
+
+def redact(arg: Any) -> Any:
+    if isinstance(arg, (bytes, bytearray, memoryview)):
+        return f"<{len(arg)} bytes>"
+    if isinstance(arg, str) and len(arg) > MAX_ARG_LENGTH:
+        return arg[:MAX_ARG_LENGTH] + "..."
+    if isinstance(arg, (list, tuple)):
+        return type(arg)(redact(item) for item in arg)
+    return arg
+
+
+class StatementStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound of the histogram bucket holding the given fraction of calls
+        (capped at the slowest call seen).
+        """
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(float(bound), self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": self.total_ms,
+            "avg_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "max_ms": self.max_ms,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "histogram": dict(zip([*map(str, LATENCY_BUCKETS_MS), "inf"], self.buckets)),
+        }
+
+
+class Measurement:
+    """
+    Times one database call: `with stats.measure(query, args) as m: ...; m.rows = n`.
+    An exception escaping the block is counted as an error.
+    """
+
+    def __init__(self, stats: "QueryStats", query: str, args: Sequence[Any]):
+        self.stats = stats
+        self.query = query
+        self.args = args
+        self.rows = 0
+        self._start = 0.0
+
+    def __enter__(self) -> "Measurement":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        elapsed_ms = 1000 * (perf_counter() - self._start)
+        self.stats.record(self.query, self.args, elapsed_ms, self.rows, exc is not None)
+
+
+class QueryStats:
+    """
+    Per-statement latency histograms, row and error counts, keyed by normalized SQL.
+    Calls slower than `slow_ms` are logged with their (redacted) arguments and the latest
+    `slow_log_size` of them are kept for the admin command; a `slow_ms` of 0 disables the log.
+    """
+
+    def __init__(self, *, slow_ms: int, slow_log_size: int):
+        self.slow_ms = slow_ms
+        self.statements: Dict[str, StatementStats] = {}
+        self.slow_log: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+
+    def measure(self, query: str, args: Sequence[Any]) -> Measurement:
+        return Measurement(self, query, args)
+
+    def record(self, query: str, args: Sequence[Any], elapsed_ms: float, rows: int, failed: bool):
+        key = normalize_sql(query)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats()
+        stats.calls += 1
+        stats.errors += failed
+        stats.rows += rows
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        metrics().observe_query(key, elapsed_ms / 1000, failed)
+
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            entry = {
+                "time": time(),
+                "elapsed_ms": elapsed_ms,
+                "query": key,
+                "args": [redact(arg) for arg in args],
+                "failed": failed,
+            }
+            self.slow_log.append(entry)
+            warning(f"DATABASE: Slow query ({elapsed_ms:.0f}ms): {key} args: {entry['args']}")
+
+    def top(self, n: int, by: str = "total_ms") -> List[Tuple[str, Dict[str, Any]]]:
+        stats = self.get_stats()["statements"]
+        return sorted(stats.items(), key=lambda item: item[1][by], reverse=True)[:n]
+
+    def get_stats(self) -> Dict[str, Any]:
+        statements = {key: stats.to_dict() for key, stats in self.statements.items()}
+        return {
+            "calls": sum(stats["calls"] for stats in statements.values()),
+            "errors": sum(stats["errors"] for stats in statements.values()),
+            "statements": statements,
+            "slow_queries": list(self.slow_log),
+        }
+
+    def reset(self):
+        self.statements.clear()
+        self.slow_log.clear()
@@ -0,0 +1,302 @@
+from asyncio import to_thread
+from logging import info, warning
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from storage import blob_store
+from utils.general import get_time
+from .backends import Statement
+from .database import Database
+
+
+class Migration:
+    """
+    A forward-only schema change. Its statements run in one transaction together with the
+    insert into Schema_Migrations, so a migration is either fully applied or not at all.
+
+    `prepare`, if given, runs first and returns extra statements to run at the start of that
+    transaction; it is for data moves that need Python, and must be safe to repeat.
+    """
+
+    def __init__(self, version: int, name: str, statements: List[str],
+                 prepare: Optional[Callable[[], Awaitable[List[Statement]]]] = None):
+        self.version = version
+        self.name = name
+        self.statements = statements
+        self.prepare = prepare
+
+
+async def move_song_bytes_to_blob_store() -> List[Statement]:
+    """
+    Writes every Songs.bytes value into the blob store, one song at a time, and returns the
+    updates that point the songs at their blobs. Blobs are content-addressed, so rerunning
+    after a failed migration only rewrites the same keys.
+    """
+    query = "SELECT 1 FROM information_schema.columns WHERE table_name = 'songs' AND column_name = 'bytes'"
+    if not await Database.fetch_many(query):
+        return []
+
+    updates: List[Statement] = []
+    last_song_id = ""
+    while True:
+        query = ("SELECT song_id, bytes FROM Songs WHERE song_id > %s AND blob_hash IS NULL AND bytes IS NOT NULL "
+                 "ORDER BY song_id LIMIT 1")
+        result = await Database.fetch_many(query, last_song_id)
+        if not result:
+            return updates
+        last_song_id, data = result[0][0], bytes(result[0][1])
+        blob_hash = await to_thread(blob_store().put, data)
+        updates.append(("UPDATE Songs SET blob_hash = %s, size = %s WHERE song_id = %s", (blob_hash, len(data), last_song_id)))
+        info(f"DATABASE: Moved song {last_song_id} ({len(data)} bytes) to the blob store")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline schema", [
+        ("CREATE TABLE IF NOT EXISTS Users("
+         "user_id BIGINT PRIMARY KEY,"
+         "name VARCHAR(64) NOT NULL,"
+         "join_date BIGINT NOT NULL,"
+         "dob BIGINT,"
+         "institution VARCHAR(256),"
+         "time_zone SMALLINT"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Tasks("
+         "task_id SERIAL PRIMARY KEY,"
+         "user_id BIGINT NOT NULL,"
+         "name VARCHAR(128) NOT NULL,"
+         "description TEXT,"
+         "status VARCHAR(32),"
+         "due_date BIGINT,"
+         "completion_time BIGINT,"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Time_Table("
+         "tt_id VARCHAR(12) PRIMARY KEY,"
+         "user_id BIGINT NOT NULL,"
+         "name VARCHAR(128) NOT NULL,"
+         "description TEXT,"
+         "days SMALLINT NOT NULL,"
+         "time SMALLINT NOT NULL,"
+         "duration SMALLINT,"
+         "ping BOOLEAN NOT NULL,"
+         "active BOOLEAN NOT NULL,"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Time_Table_Status("
+         "tt_id VARCHAR(12) NOT NULL,"
+         "time BIGINT NOT NULL,"
+         "status VARCHAR(32),"
+         "PRIMARY KEY (tt_id, time),"
+         "FOREIGN KEY (tt_id) REFERENCES Time_Table(tt_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Focus_Mode("
+         "user_id BIGINT,"
+         "start_time BIGINT NOT NULL,"
+         "duration BIGINT NOT NULL,"
+         "PRIMARY KEY (user_id, start_time),"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Songs("
+         "song_id VARCHAR(12) PRIMARY KEY,"
+         "user_id BIGINT NOT NULL,"
+         "name VARCHAR(128) NOT NULL,"
+         "bytes BYTEA NOT NULL,"
+         "artist VARCHAR(64) NOT NULL,"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Playlist("
+         "playlist_id VARCHAR(12) PRIMARY KEY,"
+         "user_id BIGINT NOT NULL,"
+         "name VARCHAR(128) NOT NULL,"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Playlist_Songs("
+         "playlist_id VARCHAR(12),"
+         "song_id VARCHAR(12),"
+         "PRIMARY KEY (playlist_id, song_id),"
+         "FOREIGN KEY (playlist_id) REFERENCES Playlist(playlist_id),"
+         "FOREIGN KEY (song_id) REFERENCES Songs(song_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Flashcard("
+         "card_id VARCHAR(12) PRIMARY KEY,"
+         "user_id BIGINT NOT NULL,"
+         "question TEXT NOT NULL,"
+         "options TEXT[],"
+         "answer TEXT,"
+         "image BYTEA,"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Flashcard_Set("
+         "card_set_id VARCHAR(12) PRIMARY KEY,"
+         "name VARCHAR(128) NOT NULL,"
+         "owner BIGINT NOT NULL,"
+         "description TEXT,"
+         "FOREIGN KEY (owner) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Flashcard_set_access("
+         "card_set_id VARCHAR(12),"
+         "user_id BIGINT,"
+         "PRIMARY KEY (card_set_id, user_id),"
+         "FOREIGN KEY (card_set_id) REFERENCES Flashcard_Set(card_set_id),"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Flashcard_Set_Cards("
+         "card_set_id VARCHAR(12),"
+         "card_id VARCHAR(12),"
+         "added_by BIGINT NOT NULL,"
+         "PRIMARY KEY (card_set_id, card_id),"
+         "FOREIGN KEY (card_set_id) REFERENCES Flashcard_Set(card_set_id),"
+         "FOREIGN KEY (card_id) REFERENCES Flashcard(card_id)"
+         ")"),
+        ("CREATE TABLE IF NOT EXISTS Flashcard_History("
+         "card_id VARCHAR(12),"
+         "user_id BIGINT,"
+         "time BIGINT,"
+         "correct BOOLEAN,"
+         "PRIMARY KEY (card_id, user_id, time),"
+         "FOREIGN KEY (card_id) REFERENCES Flashcard(card_id),"
+         "FOREIGN KEY (user_id) REFERENCES Users(user_id)"
+         ")"),
+    ]),
+    # Playlist_Songs(playlist_id) and Flashcard_Set_Cards(card_set_id) are already served by their primary keys.
+    Migration(2, "indexes for hot queries", [
+        "CREATE INDEX IF NOT EXISTS tasks_user_id_name_idx ON Tasks (user_id, name)",
+        "CREATE INDEX IF NOT EXISTS tasks_name_idx ON Tasks (name)",
+        "CREATE INDEX IF NOT EXISTS flashcard_user_id_card_id_idx ON Flashcard (user_id, card_id)",
+        "CREATE INDEX IF NOT EXISTS flashcard_set_owner_idx ON Flashcard_Set (owner)",
+        "CREATE INDEX IF NOT EXISTS time_table_alert_idx ON Time_Table (time, days) WHERE active AND ping",
+    ]),
+    # The reminder scheduler records every alert it sends, so deleting an entry must drop its history too.
+    Migration(3, "cascade time table status deletes", [
+        ("ALTER TABLE Time_Table_Status "
+         "DROP CONSTRAINT IF EXISTS time_table_status_tt_id_fkey, "
+         "ADD CONSTRAINT time_table_status_tt_id_fkey "
+         "FOREIGN KEY (tt_id) REFERENCES Time_Table(tt_id) ON DELETE CASCADE"),
+    ]),
+    Migration(4, "gemini channels", [
+        ("CREATE TABLE IF NOT EXISTS Gemini_Channels("
+         "channel_id BIGINT PRIMARY KEY,"
+         "guild_id BIGINT NOT NULL,"
+         "enabled_by BIGINT NOT NULL,"
+         "enabled_at BIGINT NOT NULL"
+         ")"),
+    ]),
+    Migration(5, "user sessions", [
+        ("CREATE TABLE IF NOT EXISTS User_Sessions("
+         "user_id BIGINT PRIMARY KEY,"
+         "data JSONB NOT NULL,"
+         "updated_at BIGINT NOT NULL"
+         ")"),
+    ]),
+    # Task lookups by name are always scoped by user now, which tasks_user_id_name_idx serves.
+    Migration(6, "drop tasks name index", [
+        "DROP INDEX IF EXISTS tasks_name_idx",
+    ]),
+    # Song audio moves out of Songs.bytes into the blob store; new songs only set blob_hash and size.
+    Migration(7, "songs blob columns", [
+        "ALTER TABLE Songs ADD COLUMN IF NOT EXISTS blob_hash CHAR(64), ADD COLUMN IF NOT EXISTS size BIGINT",
+        # Databases built before migrations were recorded may already lack the bytes column.
+        ("DO $$ BEGIN "
+         "IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'songs' AND column_name = 'bytes') "
+         "THEN ALTER TABLE Songs ALTER COLUMN bytes DROP NOT NULL; END IF; "
+         "END $$"),
+    ]),
+    Migration(8, "move song audio to blob store", [
+        "ALTER TABLE Songs ALTER COLUMN blob_hash SET NOT NULL, ALTER COLUMN size SET NOT NULL",
+        "ALTER TABLE Songs DROP COLUMN IF EXISTS bytes",
+    ], prepare=move_song_bytes_to_blob_store),
+    # Due reminders are served by the in-memory ScheduleIndex now, so nothing reads Time_Table by (time, days).
+    Migration(9, "drop time table alert index", [
+        "DROP INDEX IF EXISTS time_table_alert_idx",
+    ]),
+]
+
+
+# (query, sample args, index) for the statements on the hot paths; each must search that index.
+HOT_QUERIES: List[Tuple[str, Tuple[Any, ...], str]] = [
+    ("SELECT * FROM Tasks WHERE user_id=%s ORDER BY task_id", (0,), "tasks_user_id_name_idx"),
+    ("SELECT task_id FROM Tasks WHERE name=%s AND user_id=%s", ("", 0), "tasks_user_id_name_idx"),
+    ("UPDATE Tasks SET status='done', completion_time=%s WHERE task_id=(SELECT task_id FROM Tasks WHERE "
+     "user_id=%s AND name=%s ORDER BY task_id LIMIT 1) AND user_id=%s RETURNING task_id", (0, 0, "", 0),
+     "tasks_user_id_name_idx"),
+    ("SELECT card_id, user_id, question, options, answer, image IS NOT NULL FROM flashcard WHERE user_id = %s "
+     "AND card_id > %s ORDER BY card_id LIMIT %s", (0, "", 25), "flashcard_user_id_card_id_idx"),
+    ("SELECT COUNT(*) FROM flashcard WHERE user_id = %s", (0,), "flashcard_user_id_card_id_idx"),
+    ("SELECT card_set_id, name, owner, description FROM flashcard_set WHERE owner = %s", (0,), "flashcard_set_owner_idx"),
+    ("SELECT card_id FROM flashcard_set_cards WHERE card_set_id = %s", ("",), "flashcard_set_cards_pkey"),
+    ("SELECT song_id FROM playlist_songs WHERE playlist_id = %s", ("",), "playlist_songs_pkey"),
+]
+
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+async def ensure_migrations_table():
+    query = ("CREATE TABLE IF NOT EXISTS Schema_Migrations("
+             "version INTEGER PRIMARY KEY,"
+             "name VARCHAR(128) NOT NULL,"
+             "applied_at BIGINT NOT NULL"
+             ")")
+    await Database.execute_transaction([(query, ())])
+
+
+async def get_applied_versions() -> Set[int]:
+    result = await Database.fetch_many("SELECT version FROM Schema_Migrations")
+    return {row[0] for row in result}
+
+
+async def migrate() -> List[Migration]:
+    """
+    Applies every pending migration in version order and returns the ones applied.
+
+    :raises ValueError: if the database has a version this code doesn't know about
+    """
+    await ensure_migrations_table()
+    applied = await get_applied_versions()
+
+    known = {migration.version for migration in MIGRATIONS}
+    unknown = applied - known
+    if unknown:
+        raise ValueError(f"Database has unknown migration versions {sorted(unknown)}; is this code out of date?")
+
+    done: List[Migration] = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        statements: List[Statement] = await migration.prepare() if migration.prepare is not None else []
+        statements += [(statement, ()) for statement in migration.statements]
+        statements.append((
+            "INSERT INTO Schema_Migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+            (migration.version, migration.name, get_time()),
+        ))
+        await Database.execute_transaction(statements)
+        info(f"DATABASE: Applied migration {migration.version}: {migration.name}")
+        done.append(migration)
+    return done
+
+
+def _searched_indexes(plan: Dict[str, Any]) -> Set[str]:
+    """
+    Names of the indexes the plan searches with an Index Cond (a full index scan doesn't count).
+    """
+    indexes = {plan["Index Name"]} if plan["Node Type"] in INDEX_NODE_TYPES and "Index Cond" in plan else set()
+    for child in plan.get("Plans", []):
+        indexes |= _searched_indexes(child)
+    return indexes
+
+
+async def check_index_usage() -> Dict[str, bool]:
+    """
+    EXPLAINs every query in HOT_QUERIES with sequential scans disabled (so tiny tables don't hide
+    a missing index) and reports whether its plan searches the index it is meant to use.
+    """
+    report: Dict[str, bool] = {}
+    for query, args, index in HOT_QUERIES:
+        result = await Database.execute_transaction([
+            ("SET LOCAL enable_seqscan = off", ()),
+            ("EXPLAIN (FORMAT JSON) " + query, args),
+        ])
+        plan = result[0][0][0]["Plan"]
+        uses_index = index in _searched_indexes(plan)
+        if not uses_index:
+            warning(f"DATABASE: {index} not used by: {query}")
+        report[query] = uses_index
+    return report
@@ -7,17 +7,21 @@ from config import DISCORD_API_TOKEN, ADMIN_CHANNEL_ID
 from database import Database
 from cogs.study_tracker_cog import StudyTrackerCog
 from cogs.GeminiCog import GeminiAgent
+from cogs.admin_cog import AdminCog
 from utils.context_manager import ContextManager
+from utils.metrics import metrics
 
 
 async def main():
     getLogger().setLevel(INFO)
 
-    Database.establish_connection()
+    await Database.establish_connection()
+    metrics().start()
 
     bot = commands.Bot(command_prefix="$", intents=Intents.all(),help_command=None)
     await bot.add_cog(StudyTrackerCog(bot))
     await bot.add_cog(GeminiAgent(bot))
+    await bot.add_cog(AdminCog(bot))
 
     ContextManager.setup_context_manager()
 
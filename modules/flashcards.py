@@ -1,29 +1,82 @@
-from typing import Optional, List, Self, override, Dict
+from asyncio import to_thread, create_task, Task
+from typing import Any, Optional, List, Self, Tuple, override, Dict
 
 from discord import Interaction
 from utils.context_manager import ctx_mgr
 from utils.discord import send_message, get_files_from_message, BaseEmbed, BaseView
 from utils.random import generate_random_string
 from utils.general import get_time
+from utils.cache import LRUCache
+from utils.images import shrink_image
 from database import Database
+from config import FLASHCARD_IMAGE_CACHE_MAX_BYTES, FLASHCARD_IMAGE_MAX_SIZE, FLASHCARD_PAGE_WINDOW
+
+
+# Process-wide cache of flashcard images keyed by card_id.
+image_cache: LRUCache[str, bytes] = LRUCache(max_bytes=FLASHCARD_IMAGE_CACHE_MAX_BYTES)
 
 
 class Flashcard:
     @classmethod
-    def get_user_flashcards(cls, user_id: int) -> List[Self]:
-        query = "SELECT card_id, user_id, question, options, answer, image FROM flashcard WHERE user_id = %s"
-        results = Database.fetch_many(query, user_id)
-        flashcards: List[Self] = []
+    def _from_row(cls, row: Tuple[Any, ...]) -> Self:
+        # row: card_id, user_id, question, options, answer, image IS NOT NULL
+        flashcard = cls()
+        flashcard.id = row[0]
+        flashcard.author = row[1]
+        flashcard.question = row[2]
+        flashcard.options = row[3]
+        flashcard.answer = row[4]
+        flashcard.has_image = row[5]
+        return flashcard
+
+    @classmethod
+    async def get_user_flashcards_page(
+        cls, user_id: int, limit: int, *, after: Optional[str] = None, before: Optional[str] = None
+    ) -> List[Self]:
+        """
+        Keyset pagination over a user's flashcards ordered by card_id: up to `limit` cards
+        right after `after`, or right before `before`, or from the start if neither is given.
+        """
+        columns = "card_id, user_id, question, options, answer, image IS NOT NULL"
+        if before is not None:
+            query = f"SELECT {columns} FROM flashcard WHERE user_id = %s AND card_id < %s ORDER BY card_id DESC LIMIT %s"
+            results = await Database.fetch_many(query, user_id, before, limit)
+            results.reverse()
+        elif after is not None:
+            query = f"SELECT {columns} FROM flashcard WHERE user_id = %s AND card_id > %s ORDER BY card_id LIMIT %s"
+            results = await Database.fetch_many(query, user_id, after, limit)
+        else:
+            query = f"SELECT {columns} FROM flashcard WHERE user_id = %s ORDER BY card_id LIMIT %s"
+            results = await Database.fetch_many(query, user_id, limit)
+        return [cls._from_row(result) for result in results]
+
+    @classmethod
+    async def count_user_flashcards(cls, user_id: int) -> int:
+        query = "SELECT COUNT(*) FROM flashcard WHERE user_id = %s"
+        result = await Database.fetch_one(query, user_id)
+        return result[0]
+
+    @classmethod
+    async def load_flashcards(cls, card_ids: List[str], with_images: bool = False) -> List[Self]:
+        """
+        Loads all the given flashcards with a single query, in the order of `card_ids`.
+        Unless `with_images` is set, images are left for `load_image` to fetch on display.
+        """
+        if not card_ids:
+            return []
+
+        image = "image" if with_images else "NULL"
+        query = (
+            f"SELECT card_id, user_id, question, options, answer, image IS NOT NULL, {image} "
+            "FROM flashcard WHERE card_id = ANY(%s)"
+        )
+        results = await Database.fetch_many(query, card_ids)
+        flashcards: Dict[str, Self] = {}
         for result in results:
-            flashcard = cls()
-            flashcard.id = result[0]
-            flashcard.author = result[1]
-            flashcard.question = result[2]
-            flashcard.options = result[3]
-            flashcard.answer = result[4]
-            flashcard.image = result[5]
-            flashcards.append(flashcard)
-        return flashcards
+            flashcard = cls._from_row(result)
+            flashcard.image = result[6]
+            flashcards[result[0]] = flashcard
+        return [flashcards[card_id] for card_id in card_ids if card_id in flashcards]
     
     def __init__(self):
         self.id: Optional[str] = None
@@ -32,6 +85,8 @@ class Flashcard:
         self.options: List[str] = []
         self.answer: Optional[str] = None
         self.image: Optional[bytes] = None
+        # Set when the row has an image that hasn't been fetched yet (see `load_image`).
+        self.has_image: bool = False
 
     def check_valid(self) -> bool:
         if not self.id or not self.author or not self.question or not self.answer:
@@ -52,20 +107,20 @@ class Flashcard:
 
         return True
 
-    def generate_id(self):
+    async def generate_id(self):
         while True:
             self.id = generate_random_string(12)
             try:
                 query = f"SELECT card_id FROM flashcard WHERE card_id = %s"
-                Database.fetch_one(query, self.id)
+                await Database.fetch_one(query, self.id)
             except:
                 break
 
-    def load_flashcard(self):
+    async def load_flashcard(self):
         assert self.id is not None
-        query = f"SELECT user_id, question, options, answer, image FROM flashcard WHERE card_id = %s"
+        query = f"SELECT user_id, question, options, answer, image IS NOT NULL FROM flashcard WHERE card_id = %s"
         try:
-            result = Database.fetch_one(query, self.id)
+            result = await Database.fetch_one(query, self.id)
         except ValueError:
             raise ValueError(f"Flashcard with id `{self.id}` not found.")
 
@@ -73,33 +128,56 @@ class Flashcard:
         self.question = result[1]
         self.options = result[2]
         self.answer = result[3]
-        self.image = result[4]
+        self.has_image = result[4]
+
+    async def load_image(self):
+        """
+        Fetches the image (through `image_cache`) if the card has one that isn't loaded yet.
+        """
+        if self.image is not None or not self.has_image:
+            return
+        assert self.id is not None
+
+        self.image = image_cache.get(self.id)
+        if self.image is not None:
+            return
+        query = "SELECT image FROM flashcard WHERE card_id = %s"
+        result = await Database.fetch_one(query, self.id)
+        self.image = result[0]
+        if self.image is not None:
+            image_cache.put(self.id, self.image)
+
+    async def shrink_image(self):
+        if self.image is None:
+            return
+        self.image = await to_thread(shrink_image, self.image, FLASHCARD_IMAGE_MAX_SIZE)
 
-    def save_flashcard(self):
+    async def save_flashcard(self):
         assert self.check_valid()
         query = f"INSERT INTO flashcard (card_id, user_id, question, options, answer, image) VALUES (%s, %s, %s, %s, %s, %s)"
-        Database.execute_query(query, self.id, self.author, self.question, self.options, self.answer, self.image)
+        await Database.execute_query(query, self.id, self.author, self.question, self.options, self.answer, self.image)
 
-    def delete_flashcard(self):
+    async def delete_flashcard(self):
         assert self.id is not None
         query = f"DELETE FROM flashcard WHERE card_id = %s"
-        Database.execute_query(query, self.id)
+        await Database.execute_query(query, self.id)
+        image_cache.pop(self.id)
     
     def get_details_embed(self) -> BaseEmbed:
         return FlashcardDetailsEmbed(self, show_answer=True, show_options=True)
     
-    def add_history(self, correct: bool):
+    async def add_history(self, correct: bool):
         user_id = ctx_mgr().get_context_user_id()
         time = get_time()
         query = "INSERT INTO flashcard_history (card_id, user_id, time, correct) VALUES (%s, %s, %s, %s)"
-        Database.execute_query(query, self.id, user_id, time, correct)
+        await Database.execute_query(query, self.id, user_id, time, correct)
 
 
 class FlashcardSet:
     @classmethod
-    def get_user_sets(cls, user_id: int) -> List[Self]:
+    async def get_user_sets(cls, user_id: int) -> List[Self]:
         query = "SELECT card_set_id, name, owner, description FROM flashcard_set WHERE owner = %s"
-        result = Database.fetch_many(query, user_id)
+        result = await Database.fetch_many(query, user_id)
         sets: List[Self] = []
         for row in result:
             card_set = cls()
@@ -118,48 +196,44 @@ class FlashcardSet:
         self.flashcard_ids: List[str] = []
         self.flashcards: List[Flashcard] = []
     
-    def load_flashcard_set(self):
+    async def load_flashcard_set(self):
         assert self.id is not None
 
         query = "SELECT name, owner, description FROM flashcard_set WHERE card_set_id = %s"
-        result = Database.fetch_one(query, self.id)
+        result = await Database.fetch_one(query, self.id)
         self.name = result[0]
         self.owner = result[1]
         self.description = result[2]
     
-    def load_flashcard_ids(self):
+    async def load_flashcard_ids(self):
         assert self.id is not None
 
         query = "SELECT card_id FROM flashcard_set_cards WHERE card_set_id = %s"
-        result = Database.fetch_many(query, self.id)
+        result = await Database.fetch_many(query, self.id)
         self.flashcard_ids = [row[0] for row in result]
     
-    def load_flashcards(self):
-        for card_id in self.flashcard_ids:
-            flashcard = Flashcard()
-            flashcard.id = card_id
-            flashcard.load_flashcard()
-            self.flashcards.append(flashcard)
+    async def load_flashcards(self, with_images: bool = False):
+        self.flashcards = await Flashcard.load_flashcards(self.flashcard_ids, with_images=with_images)
     
-    def generate_id(self):
+    async def generate_id(self):
         while True:
             self.id = generate_random_string(12)
             try:
                 query = "SELECT card_set_id FROM flashcard_set WHERE card_set_id = %s"
-                Database.fetch_one(query, self.id)
+                await Database.fetch_one(query, self.id)
             except:
                 break
     
-    def save_flashcard_set(self):
+    async def save_flashcard_set(self):
         assert self.id is not None
         assert self.name is not None
         assert self.owner is not None
 
         query = "INSERT INTO flashcard_set (card_set_id, name, owner, description) VALUES (%s, %s, %s, %s)"
-        Database.execute_query(query, self.id, self.name, self.owner, self.description)
+        await Database.execute_query(query, self.id, self.name, self.owner, self.description)
     
-    def add_flashcard_to_set(self, card_id: str):
-        self.load_flashcard_ids()
+    async def add_flashcard_to_set(self, card_id: str):
+        await self.load_flashcard_ids()
 
         if card_id in self.flashcard_ids:
             return
@@ -168,11 +242,11 @@ class FlashcardSet:
         
         user_id = ctx_mgr().get_context_user_id()
         query = "INSERT INTO flashcard_set_cards (card_set_id, card_id, added_by) VALUES (%s, %s, %s)"
-        Database.execute_query(query, self.id, card_id, user_id)
+        await Database.execute_query(query, self.id, card_id, user_id)
 
     
-    def remove_flashcard_from_set(self, card_id: str):
-        self.load_flashcard_ids()
+    async def remove_flashcard_from_set(self, card_id: str):
+        await self.load_flashcard_ids()
 
         if card_id not in self.flashcard_ids:
             return
@@ -180,7 +254,7 @@ class FlashcardSet:
         self.flashcard_ids.remove(card_id)
 
         query = "DELETE FROM flashcard_set_cards WHERE card_set_id = %s AND card_id = %s"
-        Database.execute_query(query, self.id, card_id)
+        await Database.execute_query(query, self.id, card_id)
 
 
 class FlashcardDetailsEmbed(BaseEmbed):
@@ -277,7 +351,7 @@ class FlashcardFlashView(BaseView):
         
         if custom_id == "options":
             self.correct = self.flashcards[self.idx].options[int(values[0])] == self.flashcards[self.idx].answer
-            self.flashcards[self.idx].add_history(correct=self.correct)
+            await self.flashcards[self.idx].add_history(correct=self.correct)
             self.show_answer = True
         else:
             raise ValueError(f"Invalid custom_id: {custom_id}")
@@ -286,25 +360,98 @@ class FlashcardFlashView(BaseView):
     
     @override
     async def get_embed_files(self):
+        flashcard = self.flashcards[self.idx]
+        await flashcard.load_image()
         if self.show_answer:
-            embed = FlashcardAnswerEmbed(self.flashcards[self.idx], correct=self.correct)
+            embed = FlashcardAnswerEmbed(flashcard, correct=self.correct)
         else:
-            embed = FlashcardQuestionEmbed(self.flashcards[self.idx])
+            embed = FlashcardQuestionEmbed(flashcard)
         return embed, None
 
 
+class FlashcardPaginator:
+    """
+    Pages through a user's flashcards one card at a time while only holding a window of
+    `window_size` cards, fetched with keyset pagination. The next window is prefetched once
+    the reader gets within `prefetch_margin` cards of the end of the current one.
+    """
+
+    def __init__(self, user_id: int, window_size: int = FLASHCARD_PAGE_WINDOW):
+        self.user_id = user_id
+        self.window_size = window_size
+        self.prefetch_margin = max(1, window_size // 5)
+
+        self.count = 0
+        self.window: List[Flashcard] = []
+        self.window_start = 0  # index of window[0] among all the user's flashcards
+        self._next_window: Optional[Task[List[Flashcard]]] = None
+
+    async def load(self):
+        self.count = await Flashcard.count_user_flashcards(self.user_id)
+        self.window = await Flashcard.get_user_flashcards_page(self.user_id, self.window_size)
+        self.window_start = 0
+        self._next_window = None
+
+    def _window_end(self) -> int:
+        return self.window_start + len(self.window)
+
+    def _start_next_window(self):
+        after = self.window[-1].id
+        self._next_window = create_task(
+            Flashcard.get_user_flashcards_page(self.user_id, self.window_size, after=after)
+        )
+
+    def _prefetch_next_window(self):
+        if self._next_window is not None or not self.window or self._window_end() >= self.count:
+            return
+        self._start_next_window()
+
+    async def get(self, idx: int) -> Optional[Flashcard]:
+        """
+        Returns the flashcard at `idx`; only steps of one card from the current window are supported.
+        """
+        if idx == self._window_end() and self.window:
+            if self._next_window is None:
+                self._start_next_window()
+            assert self._next_window is not None
+            next_window = await self._next_window
+            self._next_window = None
+            if not next_window:
+                return None
+            self.window_start = self._window_end()
+            self.window = next_window
+
+        elif idx == self.window_start - 1 and self.window:
+            before = self.window[0].id
+            prev_window = await Flashcard.get_user_flashcards_page(self.user_id, self.window_size, before=before)
+            if not prev_window:
+                return None
+            self.window_start -= len(prev_window)
+            self.window = prev_window
+            self._next_window = None
+
+        if not self.window_start <= idx < self._window_end():
+            return None
+
+        if idx >= self._window_end() - self.prefetch_margin:
+            self._prefetch_next_window()
+        return self.window[idx - self.window_start]
+
+
 class FlashcardListView(BaseView):
     @override
     @classmethod
-    async def send_view(cls, flashcards: List[Flashcard]):
-        view = cls(flashcards)
+    async def send_view(cls, user_id: int):
+        paginator = FlashcardPaginator(user_id)
+        await paginator.load()
+        view = cls(paginator)
         await view.send()
     
-    def __init__(self, flashcards: List[Flashcard]):
-        self.flashcards = flashcards
+    def __init__(self, paginator: FlashcardPaginator):
+        self.paginator = paginator
         
         self.current_page = 0
-        self.page_count = len(flashcards)
+        self.page_count = paginator.count
         super().__init__()
     
     def _add_items(self):
@@ -332,7 +479,12 @@ class FlashcardListView(BaseView):
         if self.page_count == 0:
             return BaseEmbed(title="No Flashcards"), None
         
-        embed = self.flashcards[self.current_page].get_details_embed()
+        flashcard = await self.paginator.get(self.current_page)
+        if flashcard is None:
+            # Cards were deleted since the count was taken.
+            return BaseEmbed(title="No Flashcards"), None
+        await flashcard.load_image()
+        embed = flashcard.get_details_embed()
         return embed, None
 
 
@@ -362,12 +514,13 @@ async def add_flashcard():
         return
     if len(files) == 1:
         flashcard.image = list(files.values())[0].getvalue()
+        await flashcard.shrink_image()
     
     # Setting the author
     flashcard.author = ctx_mgr().get_context_user_id()
 
     # Setting the id
-    flashcard.generate_id()
+    await flashcard.generate_id()
 
     # Setting other details
     for line in message.content.splitlines():
@@ -392,7 +545,7 @@ async def add_flashcard():
         )
         return
 
-    flashcard.save_flashcard()
+    await flashcard.save_flashcard()
     flashcard_embed = flashcard.get_details_embed()
     await send_message(embed=flashcard_embed)
 
@@ -400,17 +553,14 @@ async def add_flashcard():
 async def list_flashcards():
     user_id = ctx_mgr().get_context_user_id()
 
-    flashcards = Flashcard.get_user_flashcards(user_id)
-    for flashcard in flashcards:
-        print(f"DEBUG: Flashcard ID: {flashcard.id}")
-    await FlashcardListView.send_view(flashcards)
+    await FlashcardListView.send_view(user_id)
 
 
 async def flashcard_flash(card_id: str):
     flashcard = Flashcard()
     flashcard.id = card_id
     try:
-        flashcard.load_flashcard()
+        await flashcard.load_flashcard()
     except ValueError as e:
         await send_message(content=str(e), mention_author=True)
         return
@@ -423,12 +573,12 @@ async def flashcard_create_set(set_name: str):
     user_id = ctx_mgr().get_context_user_id()
 
     card_set = FlashcardSet()
-    card_set.generate_id()
+    await card_set.generate_id()
     card_set.owner = user_id
     card_set.name = set_name
     if content.find("```\n") != -1:
         card_set.description = content[content.find("```\n") + 4:content.rfind("\n```")] 
-    card_set.save_flashcard_set()
+    await card_set.save_flashcard_set()
 
     embed = FlashcardSetDetailsEmbed(card_set)
     await send_message(embed=embed)
@@ -438,7 +588,7 @@ async def flashcard_add_to_set(set_id: str, card_id: str):
     flashcard = Flashcard()
     flashcard.id = card_id
     try:
-        flashcard.load_flashcard()
+        await flashcard.load_flashcard()
     except ValueError:
         content = "ERROR: Flashcard not found."
         await send_message(content=content, mention_author=True)
@@ -447,13 +597,13 @@ async def flashcard_add_to_set(set_id: str, card_id: str):
     card_set = FlashcardSet()
     card_set.id = set_id
     try:
-        card_set.load_flashcard_set()
+        await card_set.load_flashcard_set()
     except ValueError:
         content = "ERROR: Flashcard set not found."
         await send_message(content=content, mention_author=True)
         return
     
-    card_set.add_flashcard_to_set(card_id)
+    await card_set.add_flashcard_to_set(card_id)
     
     embed = FlashcardSetDetailsEmbed(card_set)
     await send_message(embed=embed)
@@ -463,7 +613,7 @@ async def flashcard_remove_from_set(set_id: str, card_id: str):
     flashcard = Flashcard()
     flashcard.id = card_id
     try:
-        flashcard.load_flashcard()
+        await flashcard.load_flashcard()
     except ValueError:
         content = "ERROR: Flashcard not found."
         await send_message(content=content, mention_author=True)
@@ -472,13 +622,13 @@ async def flashcard_remove_from_set(set_id: str, card_id: str):
     card_set = FlashcardSet()
     card_set.id = set_id
     try:
-        card_set.load_flashcard_set()
+        await card_set.load_flashcard_set()
     except ValueError:
         content = "ERROR: Flashcard set not found."
         await send_message(content=content, mention_author=True)
         return
     
-    card_set.remove_flashcard_from_set(card_id)
+    await card_set.remove_flashcard_from_set(card_id)
 
     embed = FlashcardSetDetailsEmbed(card_set)
     await send_message(embed=embed)
@@ -488,14 +638,14 @@ async def flashcard_review_set(set_id: str):
     card_set = FlashcardSet()
     card_set.id = set_id
     try:
-        card_set.load_flashcard_set()
+        await card_set.load_flashcard_set()
     except ValueError:
         content = "ERROR: Flashcard set not found."
         await send_message(content=content, mention_author=True)
         return
     
-    card_set.load_flashcard_ids()
-    card_set.load_flashcards()
+    await card_set.load_flashcard_ids()
+    await card_set.load_flashcards()
 
     view = FlashcardFlashView(card_set.flashcards)
     await view.send()
\ No newline at end of file
@@ -0,0 +1,175 @@
+from asyncio import Event, Task, TimeoutError, create_task, sleep, wait_for
+from datetime import datetime, timedelta, timezone
+from heapq import heapify, heappop, heappush
+from logging import exception, info, warning, error
+from time import perf_counter
+from typing import List, Optional, Set, Tuple
+from discord.ext.commands import Bot  # type: ignore
+
+from config import REMINDER_CATCHUP_MINUTES
+from database import Database
+from modules.time_table import DAYS, ScheduleIndex, TimeTableEntry, send_alert
+from utils.metrics import metrics
+
+Slot = Tuple[int, int]
+
+# Longest single sleep, so a wall clock jump (suspend, NTP) is noticed within a few minutes.
+MAX_SLEEP_SECONDS = 300
+# First wait before retrying after the scheduler itself fails (e.g. the database is down); doubles up to MAX_SLEEP_SECONDS.
+RETRY_SECONDS = 5
+
+
+def to_millis(dt: datetime) -> int:
+    return int(1000 * dt.timestamp())
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def next_occurrence(slot: Slot, after: datetime) -> datetime:
+    """
+    First time at or after `after` (UTC) matching the UTC (weekday, HHMM) slot.
+    """
+    day, hhmm = slot
+    hour, minute = divmod(hhmm, 100)
+    occurrence = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    weekday = (after.weekday() + 1) % len(DAYS)  # datetime counts from Monday, DAYS from Sunday
+    occurrence += timedelta(days=(day - weekday) % len(DAYS))
+    if occurrence < after:
+        occurrence += timedelta(days=len(DAYS))
+    return occurrence
+
+
+class ReminderScheduler:
+    """
+    Sleeps until the next due slot in the ScheduleIndex instead of polling every minute.
+    The heap holds one upcoming occurrence per (weekday, HHMM) slot, so its size is bounded by the
+    number of distinct slots (at most 7 * 1440) however many entries share them.
+
+    Every firing is claimed in Time_Table_Status (tt_id, time) before it is sent, so an occurrence
+    is alerted at most once even across restarts. On startup and after every index rebuild the
+    occurrences since the last checkpoint (at most REMINDER_CATCHUP_MINUTES back) are replayed.
+    """
+
+    def __init__(self, bot: Bot, index: ScheduleIndex):
+        self.bot = bot
+        self.index = index
+        self._heap: List[Tuple[int, Slot]] = []
+        self._queued: Set[Slot] = set()
+        self._wakeup = Event()
+        self._task: Optional[Task[None]] = None
+        # Every occurrence before this has been handled; None until the first index is loaded.
+        self._checkpoint: Optional[datetime] = None
+        # Set after a failure: the heap may have lost slots, so it is rebuilt from the checkpoint.
+        self._stale = False
+
+    def start(self):
+        self.index.subscribe(self.on_index_change)
+        self._task = create_task(self._run())
+
+    def stop(self):
+        self.index.unsubscribe(self.on_index_change)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def on_index_change(self, slot: Optional[Slot]):
+        if self._checkpoint is None:
+            return
+        if slot is None:
+            self._reset()
+        elif slot not in self._queued:
+            self._push(slot, max(self._checkpoint, utc_now()))
+        self._wakeup.set()
+
+    def _push(self, slot: Slot, after: datetime):
+        heappush(self._heap, (to_millis(next_occurrence(slot, after)), slot))
+        self._queued.add(slot)
+
+    def _reset(self):
+        assert self._checkpoint is not None
+        self._heap.clear()
+        self._queued.clear()
+        for slot in self.index.slots():
+            self._heap.append((to_millis(next_occurrence(slot, self._checkpoint)), slot))
+            self._queued.add(slot)
+        heapify(self._heap)
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        retry = RETRY_SECONDS
+        while True:
+            try:
+                if self._checkpoint is None:
+                    await self._load()
+                elif self._stale:
+                    self._reset()
+                self._stale = False
+                await self._tick()
+                retry = RETRY_SECONDS
+                await self._sleep_until_due()
+            except Exception:
+                exception(f"Reminder scheduler failed; retrying in {retry}s.")
+                self._stale = True
+                await sleep(retry)
+                retry = min(2 * retry, MAX_SLEEP_SECONDS)
+
+    async def _load(self):
+        if not self.index.built:
+            await self.index.rebuild()
+
+        self._checkpoint = utc_now() - timedelta(minutes=REMINDER_CATCHUP_MINUTES)
+        self._reset()
+        info(f"Reminder scheduler started with {len(self._heap)} slots.")
+
+    async def _tick(self):
+        assert self._checkpoint is not None
+        now = utc_now()
+        started = perf_counter()
+        while self._heap and self._heap[0][0] <= to_millis(now):
+            due, slot = heappop(self._heap)
+            self._queued.discard(slot)
+            tt_entries = self.index.lookup(*slot)
+            if not tt_entries:
+                continue  # every entry in the slot was deleted since it was queued
+            try:
+                await self._fire(tt_entries, due)
+            except Exception as exc:
+                error(f"Failed to send time table alerts for {slot}: {exc}", exc_info=True)
+            # A rebuild while firing may have queued the slot again already.
+            if slot not in self._queued:
+                self._push(slot, datetime.fromtimestamp(due / 1000, timezone.utc) + timedelta(minutes=1))
+        self._checkpoint = max(self._checkpoint, now)
+        metrics().observe_reminder_tick(perf_counter() - started)
+
+    async def _sleep_until_due(self):
+        self._wakeup.clear()
+        timeout = float(MAX_SLEEP_SECONDS)
+        if self._heap:
+            timeout = min(timeout, max(0.0, (self._heap[0][0] - to_millis(utc_now())) / 1000))
+        try:
+            await wait_for(self._wakeup.wait(), timeout)
+        except TimeoutError:
+            pass
+
+    async def _fire(self, tt_entries: List[TimeTableEntry], due: int):
+        # Claim the occurrence first; entries that already have a status row were sent before.
+        query = (
+            "INSERT INTO Time_Table_Status (tt_id, time, status) "
+            "SELECT tt_id, %s, 'sent' FROM unnest(%s::varchar[]) AS tt_id "
+            "ON CONFLICT DO NOTHING RETURNING tt_id"
+        )
+        result = await Database.fetch_many(query, due, [tt_entry.tt_id for tt_entry in tt_entries])
+        claimed = {row[0] for row in result}
+        tt_entries = [tt_entry for tt_entry in tt_entries if tt_entry.tt_id in claimed]
+        if not tt_entries:
+            return
+
+        late = to_millis(utc_now()) - due
+        if late > 60_000:
+            warning(f"Catching up {len(tt_entries)} time table alert(s) {late // 1000}s late.")
+        failed = await send_alert(self.bot, tt_entries, due)
+        if failed:
+            query = "UPDATE Time_Table_Status SET status = 'failed' WHERE time = %s AND tt_id = ANY(%s)"
+            await Database.execute_query(query, due, failed)
@@ -1,10 +1,30 @@
-from typing import Optional, List
+from asyncio import to_thread, create_task, Task
+from io import BytesIO
+from logging import warning
+from typing import Optional, List, Dict, BinaryIO, Tuple
 
 from discord import Interaction
 from utils.random import generate_random_string
 from utils.discord import ctx_mgr, get_files_from_message, send_message, BaseEmbed, File, BaseView
+from utils.cache import LRUCache
 from database import Database
-from io import BytesIO
+from storage import blob_store
+from config import SONG_CACHE_MAX_BYTES
+
+
+# Process-wide cache of song audio keyed by blob hash; songs too big to share the budget are streamed.
+song_cache: LRUCache[str, bytes] = LRUCache(max_bytes=SONG_CACHE_MAX_BYTES)
+
+
+def _log_prefetch_failure(task: "Task[BinaryIO]"):
+    if not task.cancelled() and task.exception() is not None:
+        warning(f"Prefetching song audio failed: {task.exception()}")
+
+
+def _close_prefetched(task: "Task[BinaryIO]"):
+    # The view moved elsewhere before using this file.
+    if not task.cancelled() and task.exception() is None:
+        task.result().close()
 
 
 class Song:
@@ -12,35 +32,58 @@ class Song:
         self.song_id: Optional[str] = None
         self.name: Optional[str] = None
         self.user_id: Optional[int] = None
-        self.bytes: Optional[bytes] = None
+        self.bytes: Optional[bytes] = None  # only set for a new upload, until it's saved
+        self.blob_hash: Optional[str] = None
+        self.size: Optional[int] = None
         self.artist: Optional[str] = None
     
-    def generate_id(self):
+    async def generate_id(self):
         while True:
             self.song_id = generate_random_string(12)
             try:
                 query = f"SELECT song_id FROM songs WHERE song_id = %s"
-                Database.fetch_one(query, self.song_id)
+                await Database.fetch_one(query, self.song_id)
             except:
                 break
     
-    def save_song(self):
+    async def save_song(self):
         assert self.song_id is not None
         assert self.name is not None
         assert self.user_id is not None
         assert self.bytes is not None
         assert self.artist is not None
-        query = "INSERT INTO songs (song_id, name, user_id, bytes, artist) VALUES (%s, %s, %s, %s, %s)"
-        Database.execute_query(query, self.song_id, self.name, self.user_id, self.bytes, self.artist)
+
+        # The audio goes to the blob store (deduplicated by hash), the row only references it.
+        self.blob_hash = await to_thread(blob_store().put, self.bytes)
+        self.size = len(self.bytes)
+        self.bytes = None
+
+        query = "INSERT INTO songs (song_id, name, user_id, blob_hash, size, artist) VALUES (%s, %s, %s, %s, %s, %s)"
+        await Database.execute_query(query, self.song_id, self.name, self.user_id, self.blob_hash, self.size, self.artist)
     
-    def load_song(self):
+    async def load_song(self):
         assert self.song_id is not None
-        query = "SELECT name, user_id, bytes, artist FROM songs WHERE song_id = %s"
-        result = Database.fetch_one(query, self.song_id)
+        query = "SELECT name, user_id, blob_hash, size, artist FROM songs WHERE song_id = %s"
+        result = await Database.fetch_one(query, self.song_id)
         self.name = result[0]
         self.user_id = result[1]
-        self.bytes = result[2]
-        self.artist = result[3]
+        self.blob_hash = result[2]
+        self.size = result[3]
+        self.artist = result[4]
+
+    async def open_audio(self) -> BinaryIO:
+        assert self.blob_hash is not None
+        audio = song_cache.get(self.blob_hash)
+        if audio is not None:
+            return BytesIO(audio)
+        if self.size is None or self.size > SONG_CACHE_MAX_BYTES // 8:
+            return await to_thread(blob_store().open, self.blob_hash)
+        audio = await to_thread(blob_store().read, self.blob_hash)
+        song_cache.put(self.blob_hash, audio)
+        return BytesIO(audio)
+
+    def get_file(self, fp: BinaryIO) -> File:
+        return File(fp, f"{self.name}.mp3")
 
 
 class Playlist:
@@ -52,67 +95,80 @@ class Playlist:
         self.song_ids: List[str] = []
         self.songs: List[Song] = []
     
-    def generate_id(self):
+    async def generate_id(self):
         while True:
             self.playlist_id = generate_random_string(12)
             try:
                 query = f"SELECT playlist_id FROM playlist WHERE playlist_id = %s"
-                Database.fetch_one(query, self.playlist_id)
+                await Database.fetch_one(query, self.playlist_id)
             except:
                 break
     
-    def save_playlist(self):
+    async def save_playlist(self):
         assert self.playlist_id is not None
         assert self.name is not None
         assert self.user_id is not None
         query = "INSERT INTO playlist (playlist_id, name, user_id) VALUES (%s, %s, %s)"
-        Database.execute_query(query, self.playlist_id, self.name, self.user_id)
+        await Database.execute_query(query, self.playlist_id, self.name, self.user_id)
     
-    def load_playlist(self):
+    async def load_playlist(self):
         assert self.playlist_id is not None
         query = "SELECT name, user_id FROM playlist WHERE playlist_id = %s"
-        result = Database.fetch_one(query, self.playlist_id)
+        result = await Database.fetch_one(query, self.playlist_id)
         self.name = result[0]
         self.user_id = result[1]
     
-    def load_song_ids(self):
+    async def load_song_ids(self):
         assert self.playlist_id is not None
         query = "SELECT song_id FROM playlist_songs WHERE playlist_id = %s"
-        result = Database.fetch_many(query, self.playlist_id)
+        result = await Database.fetch_many(query, self.playlist_id)
         self.song_ids = [row[0] for row in result]
     
-    def load_songs(self):
+    async def load_songs(self):
+        """
+        Loads the metadata of every song in `song_ids` with a single query; audio is loaded on demand.
+        """
         self.songs.clear()
-        for song_id in self.song_ids:
+        if not self.song_ids:
+            return
+        query = "SELECT song_id, name, user_id, blob_hash, size, artist FROM songs WHERE song_id = ANY(%s)"
+        result = await Database.fetch_many(query, self.song_ids)
+        songs: Dict[str, Song] = {}
+        for row in result:
             song = Song()
-            song.song_id = song_id
-            song.load_song()
-            self.songs.append(song)
+            song.song_id = row[0]
+            song.name = row[1]
+            song.user_id = row[2]
+            song.blob_hash = row[3]
+            song.size = row[4]
+            song.artist = row[5]
+            songs[song.song_id] = song
+        self.songs = [songs[song_id] for song_id in self.song_ids if song_id in songs]
     
-    def add_song_to_playlist(self, song_id: str):
-        self.load_song_ids()
+    async def add_song_to_playlist(self, song_id: str):
+        await self.load_song_ids()
         if song_id in self.song_ids:
             return
         query = "INSERT INTO playlist_songs (playlist_id, song_id) VALUES (%s, %s)"
-        Database.execute_query(query, self.playlist_id, song_id)
+        await Database.execute_query(query, self.playlist_id, song_id)
     
-    def remove_song_from_playlist(self, song_id: str):
-        self.load_song_ids()
+    async def remove_song_from_playlist(self, song_id: str):
+        await self.load_song_ids()
         if song_id not in self.song_ids:
             return
         query = "DELETE FROM playlist_songs WHERE playlist_id = %s AND song_id = %s"
-        Database.execute_query(query, self.playlist_id, song_id)
+        await Database.execute_query(query, self.playlist_id, song_id)
 
 
 class SongEmbed(BaseEmbed):
     def __init__(self, song: Song):
         super().__init__(title="Song Details")
-        assert song.bytes is not None
+        assert song.size is not None
         self.add_field(name="Song ID", value=f"`{song.song_id}`")
         self.add_field(name="Name", value=f"{song.name}")
         self.add_field(name="Artist", value=f"{song.artist}")
         self.add_field(name="User ID", value=f"{song.user_id}")
-        self.add_field(name="Bytes", value=f"{len(song.bytes)} bytes")
+        self.add_field(name="Bytes", value=f"{song.size} bytes")
 
 
 class PlaylistDetailsEmbed(BaseEmbed):
@@ -129,6 +185,8 @@ class PlaylistView(BaseView):
     def __init__(self, playlist: Playlist):
         self.playlist = playlist
         self.idx = 0
+        # (index, task opening that song's audio): the next song is opened while the current one plays.
+        self._prefetch: Optional[Tuple[int, "Task[BinaryIO]"]] = None
         super().__init__()
     
     def _add_items(self):
@@ -150,17 +208,47 @@ class PlaylistView(BaseView):
         await self.update_view()
     
     async def get_embed_files(self):
-        embed = SongEmbed(self.playlist.songs[self.idx])
-        song_bytes = self.playlist.songs[self.idx].bytes
-        assert song_bytes is not None
-        song_bytes = BytesIO(song_bytes)
-        file = File(song_bytes, f"{self.playlist.songs[self.idx].name}.mp3")
+        song = self.playlist.songs[self.idx]
+        embed = SongEmbed(song)
+        # Small songs come from song_cache, large ones are streamed from the blob store.
+        file = song.get_file(await self._open_audio(self.idx))
+
+        if self.idx + 1 < len(self.playlist.songs):
+            prefetch = create_task(self.playlist.songs[self.idx + 1].open_audio())
+            prefetch.add_done_callback(_log_prefetch_failure)
+            self._prefetch = (self.idx + 1, prefetch)
         return embed, [file]
+
+    async def on_timeout(self):
+        self._discard_prefetch()
+        await super().on_timeout()
+
+    def stop(self):
+        self._discard_prefetch()
+        super().stop()
+
+    def _discard_prefetch(self):
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None:
+            prefetch[1].add_done_callback(_close_prefetched)
+
+    async def _open_audio(self, idx: int) -> BinaryIO:
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None:
+            prefetched_idx, task = prefetch
+            if prefetched_idx != idx:
+                task.add_done_callback(_close_prefetched)
+            else:
+                try:
+                    return await task
+                except Exception:
+                    pass  # logged by _log_prefetch_failure; open it again below
+        return await self.playlist.songs[idx].open_audio()
     
 
 async def add_song(*args: str):
     song = Song()
-    song.generate_id()
+    await song.generate_id()
     song.user_id = ctx_mgr().get_context_user_id()
     song_details = " ".join(args)
     song.name = song_details.split("by")[0].strip()
@@ -173,7 +261,7 @@ async def add_song(*args: str):
         await send_message(content=content)
         return
     song.bytes = list(files.values())[0].getvalue()
-    song.save_song()
+    await song.save_song()
 
     embed = SongEmbed(song)
     await send_message(embed=embed)
@@ -182,20 +270,19 @@ async def add_song(*args: str):
 async def get_song(song_id: str):
     song = Song()
     song.song_id = song_id
-    song.load_song()
+    await song.load_song()
 
     embed = SongEmbed(song)
-    assert song.bytes is not None
-    file = File(BytesIO(song.bytes), f"{song.name}.mp3")
+    file = song.get_file(await song.open_audio())
     await send_message(embed=embed, file=file)
 
 
 async def create_playlist(*args: str):
     playlist = Playlist()
-    playlist.generate_id()
+    await playlist.generate_id()
     playlist.user_id = ctx_mgr().get_context_user_id()
     playlist.name = " ".join(args)
-    playlist.save_playlist()
+    await playlist.save_playlist()
     
     assert playlist.playlist_id is not None
     await get_playlist(playlist.playlist_id)
@@ -204,9 +291,8 @@ async def create_playlist(*args: str):
 async def get_playlist(playlist_id: str):
     playlist = Playlist()
     playlist.playlist_id = playlist_id
-    playlist.load_playlist()
-    playlist.load_song_ids()
-    playlist.load_songs()
+    await playlist.load_playlist()
+    await playlist.load_song_ids()
 
     embed = PlaylistDetailsEmbed(playlist)
     await send_message(embed=embed)
@@ -215,7 +301,7 @@ async def get_playlist(playlist_id: str):
 async def add_song_to_playlist(playlist_id: str, song_id: str):
     playlist = Playlist()
     playlist.playlist_id = playlist_id
-    playlist.add_song_to_playlist(song_id)
+    await playlist.add_song_to_playlist(song_id)
 
     await get_playlist(playlist_id)
 
@@ -223,7 +309,7 @@ async def add_song_to_playlist(playlist_id: str, song_id: str):
 async def remove_song_from_playlist(playlist_id: str, song_id: str):
     playlist = Playlist()
     playlist.playlist_id = playlist_id
-    playlist.remove_song_from_playlist(song_id)
+    await playlist.remove_song_from_playlist(song_id)
 
     await get_playlist(playlist_id)
 
@@ -231,9 +317,9 @@ async def remove_song_from_playlist(playlist_id: str, song_id: str):
 async def play_playlist(playlist_id: str):
     playlist = Playlist()
     playlist.playlist_id = playlist_id
-    playlist.load_playlist()
-    playlist.load_song_ids()
-    playlist.load_songs()
+    await playlist.load_playlist()
+    await playlist.load_song_ids()
+    await playlist.load_songs()
 
     view = PlaylistView(playlist)
     await view.send()
@@ -52,34 +52,49 @@ class Task:
         self.completion_time = completion_time
         
 
-    def add_task(self):
+    async def add_task(self):
         query = ("INSERT INTO Tasks(user_id,name,description,status,due_date,completion_time) VALUES(%s,%s,%s,%s,%s,%s)")
-        Database.execute_query(query,self.user_id,self.name,self.description,self.status,self.due_date,self.completion_time)
+        await Database.execute_query(query,self.user_id,self.name,self.description,self.status,self.due_date,self.completion_time)
 
-    def list_tasks(self):
+    async def list_tasks(self):
         query = ("SELECT * FROM Tasks WHERE user_id=%s ORDER BY task_id")
-        tasks = Database.fetch_many(query,self.user_id)
+        tasks = await Database.fetch_many(query,self.user_id)
         return tasks
     
-    def mark_as_done(self):
-        query = ("UPDATE Tasks SET status='done' WHERE task_id=%s and user_id=%s")
-        Database.execute_query(query, self.task_id, self.user_id)
-        completion_time = get_time()
-        query = ("UPDATE Tasks SET completion_time=%s WHERE task_id=%s and user_id=%s")
-        Database.execute_query(query, completion_time, self.task_id, self.user_id)
+    def _target(self):
+        # One statement per mutation: a name is resolved to the user's oldest task with that name
+        # inside the statement itself, and RETURNING reports whether a row was affected.
+        if self.task_id is None:
+            return ("task_id=(SELECT task_id FROM Tasks WHERE user_id=%s AND name=%s ORDER BY task_id LIMIT 1) "
+                    "AND user_id=%s", (self.user_id, self.name, self.user_id))
+        return ("task_id=%s AND user_id=%s", (self.task_id, self.user_id))
 
-    def mark_as_started(self):
-        query = ("UPDATE Tasks SET status='started' WHERE task_id=%s and user_id=%s")
-        Database.execute_query(query, self.task_id, self.user_id)
+    async def _update(self, assignments, *args):
+        where, where_args = self._target()
+        query = (f"UPDATE Tasks SET {assignments} WHERE {where} RETURNING task_id")
+        return bool(await Database.fetch_many(query, *args, *where_args))
 
-    def delete_task(self):
-        query = ("DELETE FROM Tasks WHERE task_id=%s and user_id=%s")
-        Database.execute_query(query, self.task_id, self.user_id)
+    async def mark_as_done(self):
+        return await self._update("status='done', completion_time=%s", get_time())
+
+    async def mark_as_started(self):
+        return await self._update("status='started'")
+
+    async def set_description(self):
+        return await self._update("description=%s", self.description)
+
+    async def set_due_date(self):
+        return await self._update("due_date=%s", self.due_date)
+
+    async def delete_task(self):
+        where, where_args = self._target()
+        query = (f"DELETE FROM Tasks WHERE {where} RETURNING task_id")
+        return bool(await Database.fetch_many(query, *where_args))
 
 
 
 async def list_tasks():
-    tasks = Task().list_tasks()
+    tasks = await Task().list_tasks()
     embed = BaseEmbed(title="Tasks")
     for task in tasks:
         embed.add_field(
@@ -96,49 +111,44 @@ async def list_tasks():
 
 async def add_task(name:str):
     try:
-        query = ("SELECT user_id FROM Users WHERE user_id=%s")
-        Database.fetch_one(query, ctx_mgr().get_context_user_id())
-        Task(name=name).add_task()
+        await Task(name=name).add_task()
         await send_message(content="Task added successfully")
     except Exception as e:
-        await send_message(content="Task addition failed.Please register first")
+        await send_message(content="Task addition failed")
 
-async def remove_task(task_id):
+async def remove_task(task_id=None, name=None):
     try:
-        Task(task_id=task_id).delete_task()
-        await send_message(content="Task removed successfully")
+        removed = await Task(task_id=task_id, name=name).delete_task()
     except Exception as e:
-        await send_message(content="Task removal failed. Task not found")
+        removed = False
+    await send_message(content="Task removed successfully" if removed else "Task removal failed. Task not found")
 
 async def add_description(task_id, description):
-    query = ("UPDATE Tasks SET description=%s WHERE task_id=%s")
-    Database.execute_query(query, description, task_id)
+    try:
+        updated = await Task(task_id=task_id, description=description).set_description()
+    except Exception as e:
+        updated = False
+    if not updated:
+        await send_message(content="Task not found")
 
-async def mark_as_done(task_id):
+async def mark_as_done(task_id=None, name=None):
     try:
-        Task(task_id=task_id).mark_as_done()
-        await send_message(content="Task marked as done")
+        updated = await Task(task_id=task_id, name=name).mark_as_done()
     except Exception as e:
-        await send_message("Task not found")
+        updated = False
+    await send_message(content="Task marked as done" if updated else "Task not found")
 
-async def mark_as_started(task_id):
+async def mark_as_started(task_id=None, name=None):
     try:
-        Task(task_id=task_id).mark_as_started()
-        await send_message(content="Task marked as started")
+        updated = await Task(task_id=task_id, name=name).mark_as_started()
     except Exception as e:
-        await send_message(content="Task not found")
+        updated = False
+    await send_message(content="Task marked as started" if updated else "Task not found")
 
 async def set_due_date(task_id:int, due_date:str):
     try:
-        due_date = date_to_epoch(due_date)
-        query = ("UPDATE Tasks SET due_date=%s WHERE task_id=%s")
-        Database.execute_query(query, due_date, task_id)
+        updated = await Task(task_id=task_id, due_date=date_to_epoch(due_date)).set_due_date()
     except Exception as e:
+        updated = False
+    if not updated:
         await send_message(content="Task not found")
-    
-
-
-
-
-
-
@@ -1,12 +1,26 @@
-from typing import Optional, List
+from asyncio import Semaphore, gather
+from typing import Optional, List, Dict, Tuple, Any, Callable
 from discord.ext.commands import Bot  # type: ignore
 
+from config import ALERT_CHANNEL_ID, ALERT_SEND_CONCURRENCY
 from utils.context_manager import ctx_mgr
+from utils.general import get_time, get_utc_offset
 from utils.random import generate_random_string
 from utils.discord import send_message, BaseEmbed, get_channel, Embed
-from utils.general import get_time, get_day, get_time_frmt
 from database import Database
-from logging import info
+from utils.metrics import metrics
+from utils.rate_limit import SlidingWindow
+from logging import info, warning, error
+from time import perf_counter
+
+
+DAYS = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+MINUTES_PER_DAY = 24 * 60
+
+# Discord allows at most 10 embeds in one message and 5 messages per 5 seconds in a channel.
+ALERT_EMBEDS_PER_MESSAGE = 10
+ALERT_MESSAGES_PER_CHANNEL = 5
+ALERT_CHANNEL_PERIOD_SECONDS = 5
 
 
 class TimeTableEntry:
@@ -21,12 +35,12 @@ class TimeTableEntry:
         self.ping: Optional[bool] = None
         self.active: Optional[bool] = None
 
-    def generate_id(self):
+    async def generate_id(self):
         while True:
             self.tt_id = generate_random_string(12)
             try:
                 query = "SELECT tt_id FROM Time_Table WHERE tt_id = %s"
-                Database.fetch_one(query, self.tt_id)
+                await Database.fetch_one(query, self.tt_id)
             except:
                 break
 
@@ -44,12 +58,12 @@ class TimeTableEntry:
             return False
         return True
 
-    def save(self):
+    async def save(self):
         query = (
             "INSERT INTO Time_Table (tt_id, user_id, name, description, days, time, duration, ping, active) "
             "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
         )
-        Database.execute_query(
+        await Database.execute_query(
             query,
             self.tt_id,
             self.user_id,
@@ -62,33 +76,173 @@ class TimeTableEntry:
             self.active
         )
     
-    def delete(self):
+    async def delete(self):
         assert self.tt_id is not None
         query = "DELETE FROM Time_Table WHERE tt_id = %s"
-        Database.execute_query(query, self.tt_id)
+        await Database.execute_query(query, self.tt_id)
     
-    def load(self):
+    async def load(self):
         assert self.tt_id is not None
         query = "SELECT user_id, name, description, days, time, duration, ping, active FROM Time_Table WHERE tt_id = %s"
-        result = Database.fetch_one(query, self.tt_id)
-        self.user_id = result[0]
-        self.name = result[1]
-        self.description = result[2]
-        self.days = result[3]
-        self.time = result[4]
-        self.duration = result[5]
-        self.ping = result[6]
-        self.active = result[7]
+        result = await Database.fetch_one(query, self.tt_id)
+        self._set_from_row(result)
+
+    def _set_from_row(self, row: Tuple[Any, ...]):
+        # row: user_id, name, description, days, time, duration, ping, active
+        self.user_id = row[0]
+        self.name = row[1]
+        self.description = row[2]
+        self.days = row[3]
+        self.time = row[4]
+        self.duration = row[5]
+        self.ping = row[6]
+        self.active = row[7]
     
     def get_days(self):
         assert self.days is not None
         days: List[str] = []
-        for i, day in enumerate(["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]):
+        for i, day in enumerate(DAYS):
             if self.days & (1 << i):
                 days.append(day)
         return days
 
 
+def to_utc_slot(day: int, time: int, utc_offset: int) -> Tuple[int, int]:
+    """
+    Converts a local (weekday, HHMM) to the UTC (weekday, HHMM) it falls on for a user whose
+    clock is `utc_offset` minutes ahead of UTC.
+    """
+    minute_of_week = day * MINUTES_PER_DAY + (time // 100) * 60 + time % 100 - utc_offset
+    day, minute = divmod(minute_of_week % (len(DAYS) * MINUTES_PER_DAY), MINUTES_PER_DAY)
+    return day, (minute // 60) * 100 + minute % 60
+
+
+class ScheduleIndex:
+    """
+    In-memory index of the entries that send alerts (active and ping), keyed by the UTC
+    (weekday, HHMM) they fire at, where weekday is the bit index used in `TimeTableEntry.days`
+    (0 = Sun). Entry times are local to their owner; the owner's UTC offset is applied once when
+    the entry is indexed, so a single lookup per UTC minute serves every time zone.
+    Built from the database at startup / reconnect and kept up to date by the commands that
+    create or delete entries and change time zones.
+
+    Listeners are called with each newly added slot, or with None after a rebuild.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._slots: Dict[Tuple[int, int], Dict[str, TimeTableEntry]] = {}
+        self._entries: Dict[str, TimeTableEntry] = {}
+        self._entry_slots: Dict[str, List[Tuple[int, int]]] = {}
+        self._offsets: Dict[int, int] = {}
+        self.built = False
+        self._listeners: List[Callable[[Optional[Tuple[int, int]]], None]] = []
+
+    def subscribe(self, listener: Callable[[Optional[Tuple[int, int]]], None]):
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Optional[Tuple[int, int]]], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, slot: Optional[Tuple[int, int]]):
+        for listener in self._listeners:
+            listener(slot)
+
+    async def rebuild(self):
+        query = (
+            "SELECT t.tt_id, t.user_id, t.name, t.description, t.days, t.time, t.duration, t.ping, t.active, "
+            "u.time_zone FROM Time_Table t LEFT JOIN Users u ON u.user_id = t.user_id "
+            "WHERE t.active = TRUE AND t.ping = TRUE"
+        )
+        result = await Database.fetch_many(query)
+
+        self._slots.clear()
+        self._entries.clear()
+        self._entry_slots.clear()
+        self._offsets.clear()
+        for row in result:
+            tt_entry = TimeTableEntry()
+            tt_entry.tt_id = row[0]
+            tt_entry._set_from_row(row[1:9])
+            self._offsets[row[1]] = get_utc_offset(row[9])
+            self._insert(tt_entry)
+        self.built = True
+        info(f"ScheduleIndex has been built with {len(self._entries)} entries.")
+        self._notify(None)
+
+    def add(self, tt_entry: TimeTableEntry, time_zone: Optional[int]):
+        """
+        :param time_zone: the owner's `Users.time_zone`
+        """
+        assert tt_entry.user_id is not None
+        self._offsets[tt_entry.user_id] = get_utc_offset(time_zone)
+        for slot in self._insert(tt_entry):
+            self._notify(slot)
+
+    def set_time_zone(self, user_id: int, time_zone: Optional[int]):
+        """
+        Re-indexes the user's entries after their time zone changed.
+        """
+        self._offsets[user_id] = get_utc_offset(time_zone)
+        for tt_entry in [tt_entry for tt_entry in self._entries.values() if tt_entry.user_id == user_id]:
+            for slot in self._insert(tt_entry):
+                self._notify(slot)
+
+    def _insert(self, tt_entry: TimeTableEntry) -> List[Tuple[int, int]]:
+        assert tt_entry.tt_id is not None and tt_entry.user_id is not None
+        self.remove(tt_entry.tt_id)
+        if not tt_entry.active or not tt_entry.ping:
+            return []
+
+        assert tt_entry.days is not None and tt_entry.time is not None
+        if not (0 <= tt_entry.time // 100 < 24 and 0 <= tt_entry.time % 100 < 60):
+            warning(f"Time table entry {tt_entry.tt_id} has an invalid time: {tt_entry.time}")
+            return []
+
+        utc_offset = self._offsets.get(tt_entry.user_id, get_utc_offset(None))
+        slots: List[Tuple[int, int]] = []
+        for day in range(len(DAYS)):
+            if tt_entry.days & (1 << day):
+                slot = to_utc_slot(day, tt_entry.time, utc_offset)
+                slots.append(slot)
+                self._slots.setdefault(slot, {})[tt_entry.tt_id] = tt_entry
+        self._entries[tt_entry.tt_id] = tt_entry
+        self._entry_slots[tt_entry.tt_id] = slots
+        return slots
+
+    def remove(self, tt_id: str):
+        self._entries.pop(tt_id, None)
+        for slot_key in self._entry_slots.pop(tt_id, []):
+            slot = self._slots.get(slot_key)
+            if slot is None:
+                continue
+            slot.pop(tt_id, None)
+            if not slot:
+                del self._slots[slot_key]
+
+    def slots(self) -> List[Tuple[int, int]]:
+        return list(self._slots.keys())
+
+    def lookup(self, day: int, time: int) -> List[TimeTableEntry]:
+        """
+        :param day: UTC weekday (0 = Sun)
+        :param time: UTC HHMM
+        """
+        return list(self._slots.get((day, time), {}).values())
+
+
+def schedule_index() -> ScheduleIndex:
+    return ScheduleIndex.get_instance()
+
+
 class TimeTableEntryDetailsEmbed(BaseEmbed):
     def __init__(self, tt_entry: TimeTableEntry):
         super().__init__(title="Time Table Entry Details")
@@ -116,7 +270,7 @@ async def create_time_table_entry():
     message = ctx_mgr().get_init_context().message
 
     tt_entry = TimeTableEntry()
-    tt_entry.generate_id()
+    await tt_entry.generate_id()
     tt_entry.user_id = ctx_mgr().get_context_user_id()
     tt_entry.active = True
     tt_entry.ping = True
@@ -126,7 +280,7 @@ async def create_time_table_entry():
             tt_entry.time = int(line[8:].replace(":", ""))
         elif line.startswith("## days: "):
             tt_entry.days = 0
-            for i, day in enumerate(["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]):
+            for i, day in enumerate(DAYS):
                 if day in line:
                     tt_entry.days |= 1 << i
         elif line.startswith("## duration: "):
@@ -150,7 +304,10 @@ async def create_time_table_entry():
         )
         return
     
-    tt_entry.save()
+    await tt_entry.save()
+    query = "SELECT time_zone FROM Users WHERE user_id = %s"
+    time_zone = (await Database.fetch_one(query, tt_entry.user_id))[0]
+    schedule_index().add(tt_entry, time_zone)
 
     embed = TimeTableEntryDetailsEmbed(tt_entry)
     await send_message(embed=embed)
@@ -159,29 +316,62 @@ async def create_time_table_entry():
 async def delete_time_table_entry(tt_id: str):
     tt_entry = TimeTableEntry()
     tt_entry.tt_id = tt_id
-    tt_entry.delete()
+    await tt_entry.delete()
+    schedule_index().remove(tt_id)
     await send_message(content="Time Table Entry deleted.")
 
 
-async def send_alert(bot: "Bot"):
-    info("Send alert was called!")
-    alert_channel_id = 1282659377437999185
-    alert_channel = await get_channel(alert_channel_id, bot)
+alert_send_slots = Semaphore(ALERT_SEND_CONCURRENCY)
+_channel_windows: Dict[int, SlidingWindow] = {}
+
+
+async def _send_alert_batch(channel: Any, tt_entries: List[TimeTableEntry]):
+    user_ids = list(dict.fromkeys(tt_entry.user_id for tt_entry in tt_entries))
+    mentions = " ".join(f"<@{user_id}>" for user_id in user_ids)
+    content = f"{mentions} you have a time table alert!" if len(tt_entries) == 1 else f"{mentions} you have time table alerts!"
+    embeds: List[Embed] = [TimeTableEntryAlertEmbed(tt_entry) for tt_entry in tt_entries]
+
+    window = _channel_windows.setdefault(channel.id, SlidingWindow(ALERT_MESSAGES_PER_CHANNEL, ALERT_CHANNEL_PERIOD_SECONDS))
+    async with alert_send_slots:
+        # Counted right before sending, so a wait for a send slot can't bunch sends past the limit.
+        await window.wait()
+        started = perf_counter()
+        await channel.send(content=content, embeds=embeds)
+        metrics().observe_send("alert", perf_counter() - started)
 
-    current_time = get_time_frmt("%H%M")
-    day = get_day(get_time())
-    day = 1 << ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"].index(day)
-    query = "SELECT tt_id FROM Time_Table WHERE active = TRUE AND ping = TRUE AND days & %s = %s AND time = %s"
-    result = Database.fetch_many(query, day, day, int(current_time))
-    tt_ids = [row[0] for row in result]
-    
-    for tt_id in tt_ids:
-        tt_entry = TimeTableEntry()
-        tt_entry.tt_id = tt_id
-        tt_entry.load()
 
-        content = f"<@{tt_entry.user_id}> you have a time table alert!"
-        embed = TimeTableEntryAlertEmbed(tt_entry)
-        await alert_channel.send(content=content, embed=embed)  # type: ignore
+async def send_alert(bot: "Bot", tt_entries: List[TimeTableEntry], due: Optional[int] = None) -> List[str]:
+    """
+    Sends the alerts batched up to ALERT_EMBEDS_PER_MESSAGE per message, concurrently but bounded by
+    ALERT_SEND_CONCURRENCY in total and to ALERT_MESSAGES_PER_CHANNEL per ALERT_CHANNEL_PERIOD_SECONDS
+    in each channel, and logs how long after `due` (epoch ms) they were delivered.
+    Returns the tt_ids whose message could not be sent.
+    """
+    if due is None:
+        due = get_time()
+    alert_channel = await get_channel(ALERT_CHANNEL_ID, bot)
 
+    batches = [
+        tt_entries[i:i + ALERT_EMBEDS_PER_MESSAGE]
+        for i in range(0, len(tt_entries), ALERT_EMBEDS_PER_MESSAGE)
+    ]
+    latencies: List[int] = []
 
+    async def deliver(batch: List[TimeTableEntry]):
+        await _send_alert_batch(alert_channel, batch)
+        latencies.append(get_time() - due)
+
+    results = await gather(*(deliver(batch) for batch in batches), return_exceptions=True)
+
+    failed: List[str] = []
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            error(f"Failed to send time table alerts: {result}", exc_info=result)
+            failed.extend(str(tt_entry.tt_id) for tt_entry in batch)
+
+    if latencies:
+        info(
+            f"Delivered {len(tt_entries) - len(failed)} time table alert(s) in {len(latencies)} message(s); "
+            f"latency avg {sum(latencies) // len(latencies)} ms, max {max(latencies)} ms."
+        )
+    return failed
@@ -1,8 +1,71 @@
-from typing import Optional
+from typing import Any, Optional, Set
+from discord.ext import commands  # type: ignore
+from discord.ext.commands import Context  # type: ignore
 from utils.context_manager import ctx_mgr
 from utils.general import get_time, get_time_from_str, get_time_str
 from database import Database
 from utils.discord import send_message, BaseEmbed
+from modules.time_table import schedule_index
+
+
+class NotRegistered(commands.CheckFailure):
+    pass
+
+
+class RegisteredUsers:
+    """
+    In-memory set of registered user ids, so commands don't look the user up in the Users table
+    on every invocation. Warmed once on startup and kept current by register_user; a miss still
+    falls back to the database, so a user registered elsewhere is picked up on first use.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._user_ids: Set[int] = set()
+        self.misses = 0
+
+    async def warm(self):
+        result = await Database.fetch_many("SELECT user_id FROM Users")
+        self._user_ids = {row[0] for row in result}
+
+    def add(self, user_id: int):
+        self._user_ids.add(user_id)
+
+    async def contains(self, user_id: int) -> bool:
+        if user_id in self._user_ids:
+            return True
+        self.misses += 1
+        result = await Database.fetch_many("SELECT user_id FROM Users WHERE user_id = %s", user_id)
+        if result:
+            self._user_ids.add(user_id)
+        return bool(result)
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+
+def registered_users() -> RegisteredUsers:
+    return RegisteredUsers.get_instance()
+
+
+def registered_only():
+    """
+    Command check that fails with NotRegistered unless the author has registered.
+    """
+
+    async def predicate(ctx: Context[Any]) -> bool:
+        if not await registered_users().contains(ctx.author.id):
+            raise NotRegistered()
+        return True
+
+    return commands.check(predicate)
 
 
 class User:
@@ -14,28 +77,29 @@ class User:
         self.institution: Optional[str] = None
         self.time_zone: Optional[int] = None
 
-    def register_user(self):
+    async def register_user(self):
         assert self.user_id is not None
         assert self.name is not None
         assert self.join_date is not None
 
         query = "INSERT INTO users (user_id, name, join_date) VALUES (%s, %s, %s)"
-        Database.execute_query(query, self.user_id, self.name, self.join_date)
+        await Database.execute_query(query, self.user_id, self.name, self.join_date)
+        registered_users().add(self.user_id)
 
-    def load_user(self):
+    async def load_user(self):
         assert self.user_id is not None
 
         query = "SELECT name, join_date, dob, institution, time_zone FROM users WHERE user_id = %s"
-        result = Database.fetch_one(query, self.user_id)
+        result = await Database.fetch_one(query, self.user_id)
         self.name = result[0]
         self.join_date = result[1]
         self.dob = result[2]
         self.institution = result[3]
         self.time_zone = result[4]
 
-    def update_user(self):
+    async def update_user(self):
         query = "UPDATE users SET name = %s, dob = %s, institution = %s, time_zone = %s WHERE user_id = %s"
-        Database.execute_query(
+        await Database.execute_query(
             query, self.name, self.dob, self.institution, self.time_zone, self.user_id
         )
 
@@ -58,7 +122,7 @@ async def register_user(*args: str):
     user.user_id = ctx_mgr().get_context_user_id()
     user.name = " ".join(args)
     user.join_date = get_time()
-    user.register_user()
+    await user.register_user()
 
     embed = UserEmbed(user)
     await send_message(embed=embed)
@@ -67,9 +131,9 @@ async def register_user(*args: str):
 async def set_institution(*args: str):
     user = User()
     user.user_id = ctx_mgr().get_context_user_id()
-    user.load_user()
+    await user.load_user()
     user.institution = " ".join(args)
-    user.update_user()
+    await user.update_user()
 
     embed = UserEmbed(user)
     await send_message(embed=embed)
@@ -78,9 +142,10 @@ async def set_institution(*args: str):
 async def set_time_zone(time_zone: str):
     user = User()
     user.user_id = ctx_mgr().get_context_user_id()
-    user.load_user()
+    await user.load_user()
     user.time_zone = int(time_zone)
-    user.update_user()
+    await user.update_user()
+    schedule_index().set_time_zone(user.user_id, user.time_zone)
 
     embed = UserEmbed(user)
     await send_message(embed=embed)
@@ -89,9 +154,9 @@ async def set_time_zone(time_zone: str):
 async def set_dob(*args: str):
     user = User()
     user.user_id = ctx_mgr().get_context_user_id()
-    user.load_user()
+    await user.load_user()
     user.dob = get_time_from_str(" ".join(args))
-    user.update_user()
+    await user.update_user()
 
     embed = UserEmbed(user)
     await send_message(embed=embed)
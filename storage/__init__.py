@@ -0,0 +1,3 @@
+__all__ = ["BlobStore", "LocalBlobStore", "S3BlobStore", "blob_store", "blob_digest"]
+
+from .blob_store import BlobStore, LocalBlobStore, S3BlobStore, blob_store, blob_digest
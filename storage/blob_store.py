@@ -0,0 +1,146 @@
+import os
+from hashlib import sha256
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from logging import info
+from typing import Any, BinaryIO, Optional
+
+from config import BLOB_STORE, BLOB_STORE_PATH, S3_BUCKET, S3_ENDPOINT_URL, S3_ACCESS_KEY, S3_SECRET_KEY
+
+
+def blob_digest(data: bytes) -> str:
+    return sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed storage: blobs are keyed by the SHA-256 of their bytes, so identical
+    uploads are stored once. All methods block; call them through `asyncio.to_thread`.
+    """
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores `data` (if not already stored) and returns its digest.
+        """
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        raise NotImplementedError
+
+    def open(self, digest: str) -> BinaryIO:
+        """
+        Returns a seekable, readable file object positioned at the start of the blob.
+
+        :raises FileNotFoundError: if the blob doesn't exist
+        """
+        raise NotImplementedError
+
+    def delete(self, digest: str) -> None:
+        raise NotImplementedError
+
+    def read(self, digest: str) -> bytes:
+        with self.open(digest) as fp:
+            return fp.read()
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        path = self._path(digest)
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def open(self, digest: str) -> BinaryIO:
+        return open(self._path(digest), "rb")
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """
+    S3-compatible backend. Point `S3_ENDPOINT_URL` at a local stand-in (e.g. MinIO) for development.
+    Requires `boto3`.
+    """
+
+    # Blobs larger than this are spooled to disk instead of memory when opened.
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str], access_key: Optional[str], secret_key: Optional[str]):
+        import boto3  # type: ignore
+
+        self.bucket = bucket
+        self.client: Any = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+
+    def _key(self, digest: str) -> str:
+        return f"{digest[:2]}/{digest}"
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        if not self.exists(digest):
+            self.client.put_object(Bucket=self.bucket, Key=self._key(digest), Body=data)
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        from botocore.exceptions import ClientError  # type: ignore
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+            return True
+        except ClientError:
+            return False
+
+    def open(self, digest: str) -> BinaryIO:
+        from botocore.exceptions import ClientError  # type: ignore
+
+        fp = SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE)
+        try:
+            self.client.download_fileobj(self.bucket, self._key(digest), fp)
+        except ClientError:
+            fp.close()
+            raise FileNotFoundError(f"Blob `{digest}` doesn't exist.")
+        fp.seek(0)
+        return fp  # type: ignore
+
+    def delete(self, digest: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(digest))
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        if BLOB_STORE == "local":
+            _blob_store = LocalBlobStore(BLOB_STORE_PATH)
+        elif BLOB_STORE == "s3":
+            assert S3_BUCKET is not None, "S3_BUCKET is not set."
+            _blob_store = S3BlobStore(S3_BUCKET, S3_ENDPOINT_URL, S3_ACCESS_KEY, S3_SECRET_KEY)
+        else:
+            raise ValueError(f"Invalid BLOB_STORE: `{BLOB_STORE}`, expected `local` or `s3`.")
+        info(f"BlobStore has been setup. ({BLOB_STORE})")
+    return _blob_store
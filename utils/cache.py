@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Least-recently-used cache bounded by item count and/or total size.
+    Not thread-safe; it's meant to be used from the event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[V], int] = len,  # type: ignore
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._sizes: Dict[K, int] = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self._data:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return self._data[key]
+
+    def put(self, key: K, value: V):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Caching it would evict everything else.
+            self.pop(key)
+            return
+
+        self.pop(key)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+        self._evict()
+
+    def pop(self, key: K) -> Optional[V]:
+        if key not in self._data:
+            return None
+        self.bytes -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def items(self) -> List[Tuple[K, V]]:
+        """
+        Snapshot of the entries, least recently used first; doesn't count as a use.
+        """
+        return list(self._data.items())
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def _evict(self):
+        while self._data and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self.pop(key)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "items": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TTLCache(LRUCache[K, V]):
+    """
+    LRUCache whose entries also expire `ttl` seconds after they were put.
+    """
+
+    def __init__(self, *, ttl: float, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+        self._expires: Dict[K, float] = {}
+        self.expirations = 0
+
+    def _expire(self, key: K) -> bool:
+        expires = self._expires.get(key)
+        if expires is None or expires > monotonic():
+            return False
+        self.pop(key)
+        self.expirations += 1
+        return True
+
+    def __contains__(self, key: K) -> bool:
+        return not self._expire(key) and super().__contains__(key)
+
+    def get(self, key: K) -> Optional[V]:
+        self._expire(key)
+        return super().get(key)
+
+    def put(self, key: K, value: V):
+        super().put(key, value)
+        if key in self._data:
+            self._expires[key] = monotonic() + self.ttl
+
+    def pop(self, key: K) -> Optional[V]:
+        self._expires.pop(key, None)
+        return super().pop(key)
+
+    def items(self) -> List[Tuple[K, V]]:
+        now = monotonic()
+        return [(key, value) for key, value in super().items() if self._expires.get(key, now + 1) > now]
+
+    def clear(self):
+        super().clear()
+        self._expires.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["expirations"] = self.expirations
+        return stats
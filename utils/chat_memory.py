@@ -0,0 +1,114 @@
+from logging import warning
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.cache import TTLCache
+from utils.general import estimate_tokens
+
+# (summary so far, transcript of the turns to fold in) -> new summary
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+
+class ChatSession:
+    def __init__(self):
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []  # (role, text), role is "user" or "model"
+        self.compacting = False
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(text) for _, text in self.turns)
+
+    def contents(self, prompt: str) -> List[Dict[str, Any]]:
+        """
+        The conversation so far plus `prompt`, in the Gemini `contents` format.
+        """
+        contents: List[Dict[str, Any]] = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]})
+            contents.append({"role": "model", "parts": ["Understood."]})
+        contents.extend({"role": role, "parts": [text]} for role, text in self.turns)
+        contents.append({"role": "user", "parts": [prompt]})
+        return contents
+
+
+class ChatMemory:
+    """
+    Per-user chat sessions. At most `max_sessions` are kept (least recently used dropped first)
+    and a session expires after `ttl` idle seconds.
+
+    Once a session grows past `max_tokens`, its oldest turns are folded into a running summary
+    until the remaining turns fit in half the budget, so every prompt stays bounded.
+    """
+
+    def __init__(self, *, ttl: float, max_sessions: int, max_tokens: int, summarize: Optional[Summarizer] = None):
+        self.sessions: TTLCache[int, ChatSession] = TTLCache(ttl=ttl, max_items=max_sessions, sizeof=lambda _: 1)
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.summaries = 0
+
+    def get(self, user_id: int) -> ChatSession:
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = ChatSession()
+        # Putting it back restarts its idle timer.
+        self.sessions.put(user_id, session)
+        return session
+
+    def forget(self, user_id: int):
+        self.sessions.pop(user_id)
+
+    def add_exchange(self, user_id: int, prompt: str, answer: str) -> bool:
+        """
+        Records an exchange and returns whether the session is now over budget and should be compacted.
+        """
+        session = self.get(user_id)
+        session.turns.append(("user", prompt))
+        session.turns.append(("model", answer))
+        return session.tokens() > self.max_tokens
+
+    async def compact(self, user_id: int, summarize: bool = True):
+        """
+        Folds the oldest turns of an over-budget session into its summary, by the summarizer if
+        `summarize` and one is set, otherwise by truncating them.
+        """
+        session = self.sessions.get(user_id)
+        # A second compaction while one waits on the summarizer would overwrite its summary.
+        if session is None or session.compacting or session.tokens() <= self.max_tokens:
+            return
+        session.compacting = True
+        try:
+            await self._compact(session, summarize)
+        finally:
+            session.compacting = False
+
+    async def _compact(self, session: ChatSession, summarize: bool):
+        # Fold whole exchanges, oldest first, but always keep the latest one verbatim.
+        split = 0
+        while split < len(session.turns) - 2 and sum(
+            estimate_tokens(text) for _, text in session.turns[split:]
+        ) > self.max_tokens // 2:
+            split += 2
+        if split == 0:
+            return
+
+        old, session.turns = session.turns[:split], session.turns[split:]
+        transcript = "\n".join(f"{role}: {text}" for role, text in old)
+        fallback = f"{session.summary}\n{transcript}".strip()
+        if self.summarize is None or not summarize:
+            session.summary = fallback
+        else:
+            try:
+                session.summary = await self.summarize(session.summary, transcript)
+                self.summaries += 1
+            except Exception as exc:
+                warning(f"Could not summarize chat history, truncating it instead: {exc}")
+                session.summary = fallback
+        # At about 4 characters per token this caps the summary at a quarter of the budget.
+        session.summary = session.summary[-self.max_tokens:]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "evictions": self.sessions.evictions,
+            "expirations": self.sessions.expirations,
+            "summaries": self.summaries,
+        }
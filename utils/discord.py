@@ -10,8 +10,10 @@ from discord import (
     AllowedMentions,
 )
 from io import BytesIO
+from time import perf_counter
 from typing import Optional, List, Tuple, Any, Dict, Self, Protocol, TYPE_CHECKING
 from utils.context_manager import ctx_mgr
+from utils.metrics import metrics
 from logging import error as err, info
 
 if TYPE_CHECKING:
@@ -21,6 +23,10 @@ if TYPE_CHECKING:
 async def get_channel(channel_id: int, bot: Optional["Bot"] = None):
     if bot is None:
         bot = ctx_mgr().get_context_bot()
+    # Channels the bot can see are in the gateway cache; only fall back to a REST call on a miss.
+    channel = bot.get_channel(channel_id)
+    if channel is not None:
+        return channel
     try:
         channel_api = await bot.fetch_channel(channel_id)
         return channel_api
@@ -73,12 +79,15 @@ async def send_message(
                 kwargs[kwarg] = locals()[kwarg]
 
         ctx = ctx_mgr().get_init_context()
+        started = perf_counter()
         message = await ctx.reply(content=content, **kwargs)
+        metrics().observe_send("reply", perf_counter() - started)
 
     else:
         allowed_mentions = (
             AllowedMentions.all() if mention_author else AllowedMentions.none()
         )
+        started = perf_counter()
         message = await message.edit(
             content=content,
             embed=embed,
@@ -86,6 +95,7 @@ async def send_message(
             attachments=files,
             allowed_mentions=allowed_mentions,
         )
+        metrics().observe_send("edit", perf_counter() - started)
 
     ctx_mgr().set_active_msg(message)
 
@@ -1,5 +1,6 @@
 from time import time
 from datetime import datetime
+from typing import Optional
 from calendar import timegm
 
 
@@ -30,4 +31,23 @@ def get_minute(time: int) -> str:
 
 def get_time_frmt(frmt: str):
     dt = datetime.now()
-    return dt.strftime(frmt)
\ No newline at end of file
+    return dt.strftime(frmt)
+
+def get_utc_offset(time_zone: Optional[int]) -> int:
+    """
+    Minutes a `Users.time_zone` is ahead of UTC. Values up to 14 in magnitude are whole hours
+    (e.g. -5), larger ones are minutes (e.g. 330 for UTC+5:30). Unset means the host's time zone.
+    """
+    if time_zone is None:
+        offset = datetime.now().astimezone().utcoffset()
+        return int(offset.total_seconds()) // 60 if offset is not None else 0
+    if abs(time_zone) <= 14:
+        return time_zone * 60
+    return time_zone
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count (about 4 characters per token for English text).
+    """
+    return (len(text) + 3) // 4
@@ -0,0 +1,98 @@
+from re import findall
+from typing import Dict, List, TYPE_CHECKING
+
+from utils.general import estimate_tokens
+
+if TYPE_CHECKING:
+    from discord.ext.commands import Bot  # type: ignore
+
+PREAMBLE = (
+    "You answer questions about this Discord bot's commands. Commands start with `$`; "
+    "`!help <question>` asks you about them."
+)
+
+# Words in a command's name count for more than words in its description.
+NAME_WEIGHT = 3
+STOPWORDS = {
+    "the", "and", "for", "how", "can", "you", "your", "what", "with", "does", "this", "that",
+    "takes", "one", "two", "argument", "arguments", "use", "want", "get", "set", "new", "all",
+}
+
+
+def name_keywords(name: str) -> List[str]:
+    """
+    Keywords of a command or group name, including adjacent words run together
+    ("time_table" also matches "timetable").
+    """
+    words = tokenize(name)
+    parts = findall(r"[a-z]+", name.lower())
+    return words + ["".join(pair) for pair in zip(parts, parts[1:])]
+
+
+def tokenize(text: str) -> List[str]:
+    words: List[str] = []
+    for word in findall(r"[a-z]+", text.lower()):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+class HelpContext:
+    """
+    Help text for the LLM generated from the bot's registered commands: their signatures,
+    docstrings and `extras["group"]`. Build it after every cog is added.
+
+    `select` returns a one-line-per-group index of all commands plus the full sections of the
+    groups whose keywords match the question best (at least half the top score), within a token budget.
+    """
+
+    def __init__(self, bot: "Bot"):
+        sections: Dict[str, List[str]] = {}
+        names: Dict[str, List[str]] = {}
+        self.keywords: Dict[str, Dict[str, int]] = {}
+
+        for command in sorted(bot.walk_commands(), key=lambda command: command.qualified_name):
+            if command.hidden:
+                continue
+            group = command.extras.get("group", "General")
+            usage = f"{bot.command_prefix}{command.qualified_name} {command.signature}".strip()
+            lines = [f"- {usage}"] + [f"  {line}" for line in (command.help or "").splitlines()]
+            sections.setdefault(group, []).append("\n".join(lines))
+            names.setdefault(group, []).append(f"{bot.command_prefix}{command.qualified_name}")
+
+            weights = self.keywords.setdefault(group, {word: NAME_WEIGHT for word in name_keywords(group)})
+            for word in tokenize(command.help or ""):
+                weights.setdefault(word, 1)
+            for word in name_keywords(command.qualified_name):
+                weights[word] = NAME_WEIGHT
+
+        self.sections = {group: f"{group} Commands\n" + "\n".join(lines) for group, lines in sections.items()}
+        self.index = "Commands by group:\n" + "\n".join(
+            f"{group}: {', '.join(group_names)}" for group, group_names in names.items()
+        )
+
+    def score(self, question: str) -> Dict[str, int]:
+        words = set(tokenize(question))
+        return {
+            group: sum(weights.get(word, 0) for word in words)
+            for group, weights in self.keywords.items()
+        }
+
+    def select(self, question: str, max_tokens: int) -> str:
+        parts = [PREAMBLE, self.index]
+        used = sum(estimate_tokens(part) for part in parts)
+
+        scores = self.score(question)
+        top = max(scores.values(), default=0)
+        for group in sorted(scores, key=lambda group: scores[group], reverse=True):
+            if scores[group] == 0 or 2 * scores[group] < top:
+                break
+            cost = estimate_tokens(self.sections[group])
+            if used + cost > max_tokens:
+                continue
+            parts.append(self.sections[group])
+            used += cost
+        return "\n\n".join(parts)
@@ -0,0 +1,37 @@
+from io import BytesIO
+from logging import info, warning
+
+
+def shrink_image(data: bytes, max_size: int, jpeg_quality: int = 85) -> bytes:
+    """
+    Downscales PNG/JPEG images so neither side exceeds `max_size` and re-encodes them.
+    Returns the original bytes for other formats, unreadable data, or when nothing is saved.
+    Blocking; call it through `asyncio.to_thread`.
+    """
+    try:
+        from PIL import Image  # type: ignore
+    except ImportError:
+        warning("Pillow is not installed, images are stored as uploaded.")
+        return data
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            frmt = img.format
+            if frmt not in ("PNG", "JPEG"):
+                return data
+
+            img.thumbnail((max_size, max_size))
+            buf = BytesIO()
+            if frmt == "JPEG":
+                img.save(buf, format="JPEG", quality=jpeg_quality, optimize=True)
+            else:
+                img.save(buf, format="PNG", optimize=True)
+    except Exception as exc:
+        warning(f"Could not recompress image: {exc}")
+        return data
+
+    shrunk = buf.getvalue()
+    if len(shrunk) >= len(data):
+        return data
+    info(f"Image recompressed: {len(data)} -> {len(shrunk)} bytes")
+    return shrunk
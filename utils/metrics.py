@@ -0,0 +1,108 @@
+from asyncio import Task, get_running_loop, sleep
+from logging import info, warning
+from time import perf_counter
+from typing import Any, Optional
+
+from config import METRICS_PORT
+
+# Seconds between event loop lag probes
+LOOP_LAG_INTERVAL = 0.5
+# Histogram buckets (seconds): database calls are mostly sub-millisecond, Discord calls tens to hundreds of ms
+QUERY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class Metrics:
+    """
+    Optional Prometheus exporter. With METRICS_PORT set (and `prometheus_client` installed) `start()`
+    serves /metrics on that port from a background thread; otherwise every `observe_*` call is a no-op,
+    so callers never need to check whether metrics are enabled.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.enabled = False
+        self._lag_task: Optional[Task[None]] = None
+
+    def start(self, port: int = METRICS_PORT):
+        if self.enabled or not port:
+            return
+        try:
+            from prometheus_client import Counter, Gauge, Histogram, start_http_server  # type: ignore
+        except ImportError:
+            warning("METRICS_PORT is set but prometheus_client is not installed, metrics are disabled.")
+            return
+
+        self.command_seconds: Any = Histogram(
+            "bot_command_seconds", "Command invocation latency", ["command", "status"], buckets=REQUEST_BUCKETS
+        )
+        self.query_seconds: Any = Histogram(
+            "bot_db_query_seconds", "Database call latency by normalized SQL", ["statement"], buckets=QUERY_BUCKETS
+        )
+        self.query_errors: Any = Counter("bot_db_query_errors", "Failed database calls", ["statement"])
+        self.send_seconds: Any = Histogram(
+            "bot_discord_send_seconds", "Discord message send/edit latency", ["kind"], buckets=REQUEST_BUCKETS
+        )
+        self.reminder_tick_seconds: Any = Histogram(
+            "bot_reminder_tick_seconds", "Time spent handling due reminder slots per scheduler wakeup",
+            buckets=REQUEST_BUCKETS,
+        )
+        self.loop_lag_seconds: Any = Histogram(
+            "bot_event_loop_lag_seconds", "How late the event loop ran a scheduled callback", buckets=LAG_BUCKETS
+        )
+        self.loop_lag_current: Any = Gauge("bot_event_loop_lag_current_seconds", "Latest event loop lag")
+
+        start_http_server(port)
+        self.enabled = True
+        self._lag_task = get_running_loop().create_task(self._probe_loop_lag())
+        info(f"Metrics served on port {port}")
+
+    def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    async def _probe_loop_lag(self):
+        while True:
+            expected = perf_counter() + LOOP_LAG_INTERVAL
+            await sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, perf_counter() - expected)
+            self.loop_lag_seconds.observe(lag)
+            self.loop_lag_current.set(lag)
+
+    def command_started(self, ctx: Any):
+        ctx.metrics_started = perf_counter()
+
+    def command_finished(self, ctx: Any):
+        started = getattr(ctx, "metrics_started", None)
+        if not self.enabled or started is None or ctx.command is None:
+            return
+        status = "error" if ctx.command_failed else "ok"
+        self.command_seconds.labels(ctx.command.qualified_name, status).observe(perf_counter() - started)
+
+    def observe_query(self, statement: str, seconds: float, failed: bool):
+        if not self.enabled:
+            return
+        self.query_seconds.labels(statement).observe(seconds)
+        if failed:
+            self.query_errors.labels(statement).inc()
+
+    def observe_send(self, kind: str, seconds: float):
+        if self.enabled:
+            self.send_seconds.labels(kind).observe(seconds)
+
+    def observe_reminder_tick(self, seconds: float):
+        if self.enabled:
+            self.reminder_tick_seconds.observe(seconds)
+
+
+def metrics() -> Metrics:
+    return Metrics.get_instance()
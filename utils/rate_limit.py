@@ -0,0 +1,95 @@
+from asyncio import sleep
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from utils.cache import LRUCache
+
+
+class TokenBucket:
+    """
+    Allows `capacity` calls in a burst, refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SlidingWindow:
+    """
+    At most `limit` calls in any `period` seconds, e.g. Discord's per-channel message limit.
+    Unlike a token bucket, a burst can't be followed by refilled tokens inside the same window.
+    """
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self._calls: Deque[float] = deque()
+
+    async def wait(self):
+        """
+        Sleeps until a call is allowed, then counts it.
+        """
+        while True:
+            now = monotonic()
+            while self._calls and now - self._calls[0] >= self.period:
+                self._calls.popleft()
+            if len(self._calls) < self.limit:
+                self._calls.append(now)
+                return
+            await sleep(self._calls[0] + self.period - now)
+
+
+class RateLimiter:
+    """
+    Token buckets per user, per guild and globally. A call is admitted only if every bucket it
+    touches has a token, and then takes one from each, so a rejected call costs nothing.
+    Idle per-user / per-guild buckets are dropped LRU-first beyond `max_keys`.
+    """
+
+    def __init__(self, *, user_per_minute: int, guild_per_minute: int, global_per_minute: int, max_keys: int = 10_000):
+        self.user_per_minute = user_per_minute
+        self.guild_per_minute = guild_per_minute
+        self.global_bucket = TokenBucket(global_per_minute / 60, global_per_minute)
+        self._buckets: LRUCache[Tuple[str, Hashable], TokenBucket] = LRUCache(max_items=max_keys, sizeof=lambda _: 1)
+        self.rejections: Dict[str, int] = {"user": 0, "guild": 0, "global": 0}
+
+    def _bucket(self, kind: str, key: Hashable, per_minute: int) -> TokenBucket:
+        bucket = self._buckets.get((kind, key))
+        if bucket is None:
+            bucket = TokenBucket(per_minute / 60, per_minute)
+            self._buckets.put((kind, key), bucket)
+        return bucket
+
+    def acquire(self, user_id: int, guild_id: Optional[int]) -> Optional[str]:
+        """
+        Takes a token for the call, or returns which limit ("user", "guild" or "global") refused it.
+        """
+        buckets: List[Tuple[str, TokenBucket]] = [("user", self._bucket("user", user_id, self.user_per_minute))]
+        if guild_id is not None:
+            buckets.append(("guild", self._bucket("guild", guild_id, self.guild_per_minute)))
+        buckets.append(("global", self.global_bucket))
+
+        now = monotonic()
+        for kind, bucket in buckets:
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                self.rejections[kind] += 1
+                return kind
+        for _, bucket in buckets:
+            bucket.tokens -= 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self._buckets),
+            "global_tokens": self.global_bucket.tokens,
+            "rejections": dict(self.rejections),
+        }
@@ -0,0 +1,116 @@
+from hashlib import sha256
+from logging import warning
+from math import sqrt
+from re import sub
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.cache import TTLCache
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Lowercases and strips punctuation and extra whitespace, so trivially different
+    spellings of a question share a cache entry.
+    """
+    return " ".join(sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class CacheLookup:
+    def __init__(self, namespace: str, key: str, normalized: str):
+        self.namespace = namespace
+        self.key = key
+        self.normalized = normalized
+        self.embedding: Optional[List[float]] = None
+        self.response: Optional[str] = None
+
+
+class ResponseCache:
+    """
+    Caches generated responses by a hash of the normalized prompt, with TTL and LRU eviction.
+
+    If an `embed` function and a similarity threshold are given, a miss on the exact key falls
+    back to the cached prompt with the most similar embedding (cosine similarity at least
+    `threshold`), which catches rephrasings of the same question at the cost of an embedding call.
+    """
+
+    def __init__(self, *, ttl: float, max_items: int, embed: Optional[Embedder] = None, threshold: float = 0.0):
+        self.responses: TTLCache[str, str] = TTLCache(ttl=ttl, max_items=max_items)
+        self.embeddings: TTLCache[str, Tuple[str, List[float]]] = TTLCache(ttl=ttl, max_items=max_items, sizeof=lambda _: 1)
+        self.embed = embed if threshold > 0 else None
+        self.threshold = threshold
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.miss_seconds = 0.0
+
+    async def lookup(self, namespace: str, prompt: str) -> CacheLookup:
+        normalized = normalize_prompt(prompt)
+        key = sha256(f"{namespace}\0{normalized}".encode()).hexdigest()
+        lookup = CacheLookup(namespace, key, normalized)
+
+        lookup.response = self.responses.get(key)
+        if lookup.response is not None:
+            self.hits += 1
+            return lookup
+
+        if self.embed is not None and normalized:
+            try:
+                lookup.embedding = _unit(await self.embed(normalized))
+            except Exception as exc:
+                warning(f"Could not embed prompt for the response cache: {exc}")
+            else:
+                lookup.response = self._nearest(namespace, lookup.embedding)
+                if lookup.response is not None:
+                    self.semantic_hits += 1
+                    return lookup
+
+        self.misses += 1
+        return lookup
+
+    def _nearest(self, namespace: str, embedding: List[float]) -> Optional[str]:
+        best_key, best_score = None, self.threshold
+        for key, (entry_namespace, entry_embedding) in self.embeddings.items():
+            if entry_namespace != namespace:
+                continue
+            score = sum(a * b for a, b in zip(embedding, entry_embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        return self.responses.get(best_key)
+
+    def store(self, lookup: CacheLookup, response: str, elapsed: float):
+        """
+        :param elapsed: seconds it took to produce the response, used to estimate the time hits save
+        """
+        self.stored += 1
+        self.miss_seconds += elapsed
+        self.responses.put(lookup.key, response)
+        if lookup.embedding is not None:
+            self.embeddings.put(lookup.key, (lookup.namespace, lookup.embedding))
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.hits + self.semantic_hits
+        lookups = served + self.misses
+        avg_miss_ms = 1000 * self.miss_seconds / self.stored if self.stored else 0.0
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": served / lookups if lookups else 0.0,
+            "avg_miss_ms": avg_miss_ms,
+            "saved_ms": served * avg_miss_ms,
+            "api_calls_saved": served,
+            "entries": len(self.responses),
+            "evictions": self.responses.evictions,
+            "expirations": self.responses.expirations,
+        }
@@ -0,0 +1,60 @@
+from json import dumps
+from typing import Any, Dict, Optional
+
+from config import SESSION_TTL, SESSION_MAX_USERS, SESSION_PERSIST
+from database import Database
+from utils.cache import TTLCache
+from utils.general import get_time
+
+
+class SessionStore:
+    """
+    Per-user session state (e.g. the task selected with $set_task), kept in memory and dropped
+    after SESSION_TTL idle seconds.
+
+    With SESSION_PERSIST every change is also written through to the User_Sessions table, and a
+    session missing from memory (e.g. after a restart) is loaded from there if it isn't stale.
+    """
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(ttl=SESSION_TTL, max_users=SESSION_MAX_USERS, persist=SESSION_PERSIST)
+        return cls._instance
+
+    def __init__(self, *, ttl: int, max_users: int, persist: bool):
+        self.ttl = ttl
+        self.persist = persist
+        self._sessions: TTLCache[int, Dict[str, Any]] = TTLCache(ttl=ttl, max_items=max_users, sizeof=lambda _: 1)
+
+    async def _load(self, user_id: int) -> Dict[str, Any]:
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = {}
+            if self.persist:
+                query = "SELECT data FROM User_Sessions WHERE user_id = %s AND updated_at > %s"
+                result = await Database.fetch_many(query, user_id, get_time() - 1000 * self.ttl)
+                if result:
+                    session = result[0][0]
+        # Putting it back restarts its idle timer; an empty session also spares the next lookup.
+        self._sessions.put(user_id, session)
+        return session
+
+    async def get(self, user_id: int, key: str) -> Optional[Any]:
+        return (await self._load(user_id)).get(key)
+
+    async def set(self, user_id: int, key: str, value: Any):
+        session = await self._load(user_id)
+        session[key] = value
+        if self.persist:
+            query = (
+                "INSERT INTO User_Sessions (user_id, data, updated_at) VALUES (%s, %s::jsonb, %s) "
+                "ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at"
+            )
+            await Database.execute_query(query, user_id, dumps(session), get_time())
+
+
+def sessions() -> SessionStore:
+    return SessionStore.get_instance()
@@ -0,0 +1,84 @@
+from asyncio import Queue, QueueFull, Task, create_task
+from logging import error
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class WorkQueue:
+    """
+    Bounded queue of jobs run by a fixed number of worker tasks, so at most `workers` jobs are in
+    flight and at most `max_size` wait. `submit` never blocks; it reports a full queue so the
+    caller can shed the load.
+    """
+
+    def __init__(self, name: str, workers: int, max_size: int):
+        self.name = name
+        self.workers = workers
+        self._queue: "Queue[Tuple[float, Job]]" = Queue(maxsize=max_size)
+        self._tasks: List[Task[None]] = []
+
+        self.started = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self):
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(create_task(self._worker()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def reject(self):
+        """
+        Counts a job the caller turned away after seeing `full()`, e.g. before spending a rate limit token on it.
+        """
+        self.rejected += 1
+
+    def submit(self, job: Job) -> bool:
+        try:
+            self._queue.put_nowait((perf_counter(), job))
+        except QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            submitted, job = await self._queue.get()
+            wait = perf_counter() - submitted
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self.started += 1
+            self.running += 1
+            try:
+                await job()
+            except Exception as exc:
+                self.failed += 1
+                error(f"{self.name}: job failed: {exc}", exc_info=True)
+            finally:
+                self.running -= 1
+                self.completed += 1
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg_ms": 1000 * self._wait_total / self.started if self.started else 0.0,
+            "wait_max_ms": 1000 * self._wait_max,
+        }